@@ -6,39 +6,41 @@ License:
   All rights reserved.
 """
 
-from rktl_autonomy import RocketLeagueInterface
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import SubprocVecEnv
-from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.evaluation import evaluate_policy
+from rktl_autonomy.checkpoint_evaluator import CheckpointEvaluator, EvaluationIndex, make_seeds, get_steps
 from os.path import expanduser
-from sys import argv
 from glob import glob
-import uuid
-
-if __name__ == '__main__':      # this is required due to forking processes
-    run_id = str(uuid.uuid4())  # ALL running environments must share this
-    print(f"RUN ID: {run_id}")
-
-    # to pass launch args, add to env_kwargs: 'launch_args': ['render:=false', 'plot_log:=true']
-    env = make_vec_env(RocketLeagueInterface, env_kwargs={'run_id':run_id,
-        'launch_args':['render:=false', 'plot_log:=false']},
-        n_envs=24, vec_env_cls=SubprocVecEnv)
-
-    assert len(argv) >= 2
-    for model_run_id in argv[1:]:
-        print(f"Evaluating training run: {model_run_id}")
-        model_dir = expanduser(f'~/catkin_ws/data/rocket_league/{model_run_id}')
-
-        with open(f'{model_dir}/eval_log_{run_id}.txt', 'w') as logfile:
-            logfile.write("Training Episodes\tMean Reward\tStd-Dev Reward\n")
-
-            for weight in glob(f'{model_dir}/rl_model_*_steps.zip'):
-                model = PPO.load(weight.replace('.zip', ''))
-                mu, sigma = evaluate_policy(model, env, n_eval_episodes=48)
-
-                episodes = weight.replace(f'{model_dir}/rl_model_', '').replace('_steps.zip', '')
-                logfile.write(f"{episodes}\t{mu:.3f}\t{sigma:.3f}\n")
-                logfile.flush()
-
-    env.close() # this must be done to clean up other processes
+import argparse
+import yaml
+
+if __name__ == '__main__':      # this is required due to spawning processes
+    parser = argparse.ArgumentParser(description='Evaluate the checkpoints of training runs on fixed, seeded episodes.')
+    parser.add_argument('run_ids', nargs='+', help='training runs (folders in ~/catkin_ws/data/rocket_league)')
+    parser.add_argument('--episodes', type=int, default=48, help='episodes per checkpoint')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the episode seeds')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default=one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=8, help='episodes per worker task')
+    parser.add_argument('--backend', default=None, choices=['pybullet', 'planar'])
+    parser.add_argument('--config', default=None, help='agent config to evaluate with (default=rocket_league.yaml)')
+    args = parser.parse_args()
+
+    config = None
+    if args.config is not None:
+        with open(args.config) as file:
+            config = yaml.safe_load(file)
+
+    # the same seeds for every checkpoint, so the scores are comparable
+    seeds = make_seeds(args.episodes, args.seed)
+    with CheckpointEvaluator(seeds, config=config, backend=args.backend, workers=args.workers,
+                             chunk_size=args.chunk_size) as evaluator:
+        print(f"Evaluating on seed set {evaluator.seed_set[:16]} ({args.episodes} episodes)")
+        for model_run_id in args.run_ids:
+            print(f"Evaluating training run: {model_run_id}")
+            model_dir = expanduser(f'~/catkin_ws/data/rocket_league/{model_run_id}')
+
+            # results of every seed set are kept together, and reused on later runs
+            index = EvaluationIndex(f'{model_dir}/eval_index.json')
+            weights = sorted(glob(f'{model_dir}/rl_model_*_steps.zip'), key=get_steps)
+            for result in evaluator.evaluate(weights, index):
+                status = 'cached' if result.cached else 'done'
+                print(f"{result.steps}\t{result.mean:.3f}\t{result.std:.3f}\t({status})")
+            print(f"Results in {index.tsv_path}")
@@ -7,24 +7,40 @@ License:
 stable_baselines3 resource: https://stable-baselines3.readthedocs.io/_/downloads/en/master/pdf/
 """
 
-from rktl_autonomy import RocketLeagueInterface
+from rktl_autonomy import RocketLeagueInterface, RocketLeagueDirectInterface, LaunchCoordinator, SharedMemoryVecEnv
 from stable_baselines3 import PPO
 from stable_baselines3.common.vec_env import SubprocVecEnv
-from stable_baselines3.common.env_util import make_vec_env
 from stable_baselines3.common.logger import configure
 from stable_baselines3.common.callbacks import CheckpointCallback
 from os.path import expanduser
+from functools import partial
+import argparse
 import uuid
 
-if __name__ == '__main__':
-    # This is required due to forking processes.
+if __name__ == '__main__':      # this is required due to forking processes
+    parser = argparse.ArgumentParser(description='Train a Rocket League agent with PPO.')
+    # Train without ROS: each process steps its own simulator, and observations and
+    # actions are exchanged through shared memory instead of being pickled.
+    parser.add_argument('--direct', action='store_true', help='train on the simulator directly, without ROS')
+    args = parser.parse_args()
+
     # ALL running environments must share this id.
     run_id = str(uuid.uuid4())
     print(f"RUN ID: {run_id}")
 
-    # Pass launch args by adding to env_kwargs: 'launch_args': ['render:=false', 'plot_log:=true'].
-    env = make_vec_env(RocketLeagueInterface, env_kwargs={'run_id': run_id},
-                       n_envs=24, vec_env_cls=SubprocVecEnv)
+    n_envs = 24
+
+    if args.direct:
+        coordinator = None
+        env = SharedMemoryVecEnv([RocketLeagueDirectInterface for _ in range(n_envs)])
+    else:
+        # Start every environment's ROS network from here, a few at a time, then give each
+        # environment its master. Pass launch args with launch_args=['render:=false', 'plot_log:=true'].
+        # For lockstep training, add 'lockstep:=true' to launch_args and lockstep=True to the envs.
+        coordinator = LaunchCoordinator(['rktl_autonomy', 'rocket_league_train.launch'],
+                                        agent_name='rocket_league_agent', ready_services=['/sim_reset'])
+        master_uris = coordinator.start(n_envs)
+        env = SubprocVecEnv([partial(RocketLeagueInterface, run_id=run_id, master_uri=uri) for uri in master_uris])
 
     model = PPO("MlpPolicy", env)
 
@@ -47,3 +63,5 @@ if __name__ == '__main__':
     print("done training")
     model.save(log_dir + "/final_weights")
     env.close() # This must be done to clean up other processes
+    if coordinator is not None:
+        coordinator.shutdown()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Self-play training script for the Rocket League project.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+stable_baselines3 resource: https://stable-baselines3.readthedocs.io/_/downloads/en/master/pdf/
+"""
+
+from rktl_autonomy import RocketLeagueSelfPlayEnv, OpponentPool
+from stable_baselines3 import PPO
+from stable_baselines3.common.logger import configure
+from stable_baselines3.common.callbacks import CheckpointCallback
+from os.path import expanduser
+import uuid
+
+if __name__ == '__main__':
+    run_id = str(uuid.uuid4())
+    print(f"RUN ID: {run_id}")
+    log_dir = expanduser(f'~/catkin_ws/data/rocket_league/{run_id}')
+
+    # Every car in every arena is an agent, stepped by one in-process simulator.
+    # Team A is trained, and team B plays past checkpoints of this run (or the
+    # current model). Pass opponents=None to train both teams instead.
+    opponents = OpponentPool(log_dir, latest_prob=0.5)
+    env = RocketLeagueSelfPlayEnv(team_size=1, num_arenas=24, opponents=opponents)
+
+    model = PPO("MlpPolicy", env)
+    # Until the first checkpoint is saved, team B plays the current model.
+    opponents.add(model)
+
+    # Log training progress as CSV.
+    logger = configure(log_dir, ["stdout", "csv", "log"])
+    model.set_logger(logger)
+
+    # Log model weights.
+    freq = 20833  # save 20 times
+    # freq = steps / (n_saves * n_envs)
+    callback = CheckpointCallback(save_freq=freq, save_path=log_dir)
+
+    # Run training.
+    steps = 240000000  # 240M (10M sequential)
+    print(f"training on {steps} steps")
+    model.learn(total_timesteps=steps, callback=callback)
+
+    # Save final weights.
+    print("done training")
+    model.save(log_dir + "/final_weights")
+    env.close()
@@ -6,13 +6,13 @@ License:
   All rights reserved.
 """
 
-from rktl_autonomy import RocketLeagueInterface
+from rktl_autonomy import RocketLeagueInterface, LaunchCoordinator, EnvPool
 import numpy as np
 from stable_baselines3 import PPO
 
 from stable_baselines3.common.vec_env import SubprocVecEnv
-from stable_baselines3.common.env_util import make_vec_env
 
+from functools import partial
 import uuid
 import optuna
 import sys
@@ -22,9 +22,10 @@ from stable_baselines3.common.vec_env import VecCheckNan
 
 
 timesteps = 2000 # Timesteps that the model will train on before getting assessed and tuned
+evaluations = 4 # Number of times the model is assessed while training, so bad trials can be pruned early.
 episodes_per_trial = 7 # Number of times the model will be evaluated per tuning trial after training.
 total_trials = 10000 # Number of optimization attempts optuna will make to the hyperparams.
-parallel_jobs = 24 # Number of parallel envs the script will run and use at once.
+parallel_jobs = 24 # Number of trials the script will run at once, each with a training and an evaluation env.
 
 
 def optimize_ppo2(trial):
@@ -32,14 +33,14 @@ def optimize_ppo2(trial):
     return {
         'n_steps': int(trial.suggest_loguniform('n_steps', 16, 2048)),
         'gamma': trial.suggest_loguniform('gamma', 0.9, 0.9997),
-        'learning_rate': trial.suggest_loguniform('learning_rate', 5e-6, 0.003), 
-        'ent_coef': trial.suggest_loguniform('ent_coef', 1e-8, 0.01), 
+        'learning_rate': trial.suggest_loguniform('learning_rate', 5e-6, 0.003),
+        'ent_coef': trial.suggest_loguniform('ent_coef', 1e-8, 0.01),
         'clip_range': trial.suggest_uniform('clip_range', 0.1, 0.3), # try 0.2 and 0.3 as well
         'n_epochs': int(trial.suggest_loguniform('n_epochs', 3, 30)),
         'gae_lambda': trial.suggest_uniform('gae_lambda', 0.9, 1.0),
         'batch_size': int(trial.suggest_uniform('batch_size', 4, 4096)),
         'vf_coef': trial.suggest_uniform('v_coef', 0.5, 1.0)
-        #'max_grad_norm': trial.suggest_uniform('max_grad_norm', 0.9, 1.0)  
+        #'max_grad_norm': trial.suggest_uniform('max_grad_norm', 0.9, 1.0)
     }
 
 
@@ -47,47 +48,37 @@ def optimize_ppo2(trial):
 ### Global variables. Not for modification.
 run_id = str(uuid.uuid4())  # ALL running environments must share this id
 step = 0 # Keeps track of tuning steps, i.e. how many unique hyperparam sets it has run.
-study = optuna.create_study() # Creates optuna study.
+# Stops trials whose intermediate reward is below the median of earlier trials at the same point.
+study = optuna.create_study(pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=1))
+pool = None # Environments shared by all trials, created in main.
 
-### Train the model and optimize it.
-def optimize_agent(trial):
-    
-    global step
-    global study
-    
-    # Hyperparams are determined by Optuna.
-    model_params = optimize_ppo2(trial)
-    
-    env = make_vec_env(RocketLeagueInterface, env_kwargs={'run_id' : run_id, 'launch_args': ['render:=false', 'plot_log:=false']},
-            n_envs= 1 , vec_env_cls=SubprocVecEnv) # Creates the env
-            
-    env = VecCheckNan(env, raise_exception=True)
-    
-    model = PPO("MlpPolicy", env, **model_params) # Creates the PPO network model based on the env and the provided hyperparameters.
-    
-    model.learn(timesteps) # Makes the model learn before getting assessed and tuned
-    
+
+def make_env(coordinator, index, restart):
+    """Makes the pool's environment number index, restarting its ROS network if it broke."""
+    uri = coordinator.restart(index) if restart else coordinator.master_uris[index]
+    return SubprocVecEnv([partial(RocketLeagueInterface, run_id=run_id, master_uri=uri)])
+
+
+def evaluate(model, env):
+    """Runs episodes_per_trial episodes, returning the mean reward."""
     rewards = [] # The way the car was rewarded for each attempt it had in this tuning trial
-    
     n_episodes, reward_sum = 0, 0.0
 
     obs = env.reset()
     while n_episodes < episodes_per_trial:
-    
+
         if np.isnan(obs).any():
             print("Best Params:" + str(study.best_params))
             sys.exit("OBS is NAN")
-  
+
         action, _ = model.predict(obs)
-               
+
         if np.isnan(action).any():
             print("Best Params:" + str(study.best_params))
             sys.exit("ACTION IS NAN")
-               
+
         obs, reward, done, _ = env.step(action)
-        
-        
-        
+
         reward_sum += reward
 
         if done:
@@ -96,27 +87,63 @@ def optimize_agent(trial):
             n_episodes += 1
             obs = env.reset()
 
-    mean_reward = np.mean(rewards)
-    
+    return np.mean(rewards)
+
+
+### Train the model and optimize it.
+def optimize_agent(trial):
+
+    global step
+    global study
+
+    # Hyperparams are determined by Optuna.
+    model_params = optimize_ppo2(trial)
+
+    pruned = False
+    # Borrows envs that are already running, instead of launching them. Evaluating on its own env
+    # leaves the training env mid episode, where the model left it.
+    with pool.lease() as env, pool.lease() as eval_env:
+        env = VecCheckNan(env, raise_exception=True)
+        eval_env = VecCheckNan(eval_env, raise_exception=True)
+
+        model = PPO("MlpPolicy", env, **model_params) # Creates the PPO network model based on the env and the provided hyperparameters.
+
+        # Learn in chunks, reporting the reward after each so Optuna can stop bad trials early.
+        for evaluation in range(evaluations):
+            model.learn(timesteps // evaluations, reset_num_timesteps=(evaluation == 0))
+            mean_reward = evaluate(model, eval_env)
+
+            # Optuna minimizes, so we need to negate the reward here
+            trial.report(-1 * mean_reward, evaluation)
+            if trial.should_prune():
+                pruned = True
+                break
+
+    # Raised after returning the envs, which are still healthy.
+    if pruned:
+        raise optuna.TrialPruned()
+
     step += 1
-    
+
     print("\n")
     print("Mean Reward at step #" + str(step) + " : " + str(mean_reward) )
     if (step + 1) % 5 == 0 :
         print("Best Params:" + str(study.best_params))
 
-    env.close() # this must be done to clean up other processes
-    
-    # Optuna maximizes negative reward, so we need to negate the reward here
-    trial.report(-1 * mean_reward, step)
-    
     return -1 * mean_reward
-    
-    
+
+
 
 
 if __name__ == '__main__':      # this is required due to forking processes
-    
+
+    # Starts two ROS networks per parallel job, kept for the whole study.
+    coordinator = LaunchCoordinator(['rktl_autonomy', 'rocket_league_train.launch'],
+                                    launch_args=['render:=false', 'plot_log:=false'],
+                                    agent_name='rocket_league_agent', ready_services=['/sim_reset'])
+    coordinator.start(2 * parallel_jobs)
+    pool = EnvPool(partial(make_env, coordinator), 2 * parallel_jobs)
+
     try: # Begins the optimizer with total trials and number of parallel jobs specified.
         study.optimize(optimize_agent, n_trials=total_trials, n_jobs=parallel_jobs)
         print("\n")
@@ -125,5 +152,7 @@ if __name__ == '__main__':      # this is required due to forking processes
         print('Interrupted by keyboard.')
         print("\n")
         print("Best Params:" + str(study.best_params))
-    
-    
\ No newline at end of file
+    finally:
+        pool.close() # this must be done to clean up other processes
+        coordinator.shutdown()
+
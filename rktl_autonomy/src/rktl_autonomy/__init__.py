@@ -1,12 +1,42 @@
+from importlib import import_module
+
 from ._ros_interface import ROSInterface
 from .cartpole_interface import CartpoleInterface
 from .cartpole_direct_interface import CartpoleDirectInterface
 from .snake_interface import SnakeInterface
+from .rocket_league_task import RocketLeagueTask, CarActions
 from .rocket_league_interface import RocketLeagueInterface
+from .rocket_league_direct_interface import RocketLeagueDirectInterface
+from .launch_coordinator import LaunchCoordinator
+
+# training tools, imported on first use so the environments do not need stable_baselines3
+_LAZY = {
+    "SharedMemoryVecEnv": "shared_memory_vec_env",
+    "EnvPool": "env_pool",
+    "CheckpointEvaluator": "checkpoint_evaluator",
+    "OpponentPool": "opponent_pool",
+    "RocketLeagueSelfPlayEnv": "rocket_league_self_play",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(import_module(f".{_LAZY[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "ROSInterface",
     "CartpoleInterface",
     "CartpoleDirectInterface",
     "SnakeInterface",
-    "RocketLeagueInterface"]
\ No newline at end of file
+    "RocketLeagueTask",
+    "CarActions",
+    "RocketLeagueInterface",
+    "RocketLeagueDirectInterface",
+    "SharedMemoryVecEnv",
+    "LaunchCoordinator",
+    "EnvPool",
+    "CheckpointEvaluator",
+    "OpponentPool",
+    "RocketLeagueSelfPlayEnv"]
@@ -0,0 +1,87 @@
+"""Contains the StepTimers class, which times the phases of an environment step.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+import time
+
+
+class _Timer(object):
+    """Adds the time spent in a with block to a timer."""
+    __slots__ = ('_timers', '_name', '_start')
+
+    def __init__(self, timers, name):
+        self._timers = timers
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._timers.add_time(self._name, time.perf_counter() - self._start)
+
+
+class _NullTimer(object):
+    """Stands in for _Timer while timing is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StepTimers(object):
+    """
+    Totals the time spent in named blocks (`with timers.timer('name'):`), in the
+    same format as the simulator's profile. Disabled timers do nothing.
+    """
+
+    def __init__(self, enabled=False):
+        """@param enabled: Whether to time blocks."""
+        self.enabled = enabled
+        # each a list of [calls, total seconds, max seconds]
+        self._timings = {}
+
+    def timer(self, name):
+        """
+        Returns a context manager that adds the time spent in it to a timer.
+        @param name: Name of the timer, ex: 'env.step'.
+        """
+        if self.enabled:
+            return _Timer(self, name)
+        return _NULL_TIMER
+
+    def add_time(self, name, seconds):
+        """Adds a duration to a timer."""
+        timing = self._timings.get(name)
+        if timing is None:
+            self._timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def get_profile(self):
+        """
+        Returns the totals of every timer.
+        @return: Dict of timer name to dict of calls, total, mean, and max (seconds).
+        """
+        return {name: {'calls': calls, 'total': total, 'mean': total / calls, 'max': max_time}
+                for name, (calls, total, max_time) in sorted(self._timings.items())}
+
+    def format_profile(self):
+        """Returns a table of timer totals, one line per timer, for logging."""
+        lines = [f'{"timer":<24} {"calls":>9} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>10}']
+        for name, timing in self.get_profile().items():
+            lines.append(f'{name:<24} {timing["calls"]:>9} {timing["total"]:>10.3f} '
+                         f'{timing["mean"] * 1e3:>10.3f} {timing["max"] * 1e3:>10.3f}')
+        return '\n'.join(lines)
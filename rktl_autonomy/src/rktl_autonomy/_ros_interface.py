@@ -7,14 +7,18 @@ License:
 
 from abc import abstractmethod
 from threading import Condition
-import time, uuid, socket, os
+import time, uuid, os
+from urllib.parse import urlparse
 
 from gym import Env
 
-import rospy, roslaunch
+import rospy
 from rosgraph_msgs.msg import Clock
 from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
 
+from rktl_autonomy._profiling import StepTimers
+from rktl_autonomy.launch_coordinator import LaunchCoordinator, DEFAULT_PORT
+
 
 class SimTimeException(Exception):
     """For when advancing sim time does not go as planned."""
@@ -37,9 +41,11 @@ class ROSInterface(Env):
             - _get_state()
             - _publish_action()
         - Notify _cond when _has_state() may have turned true.
+    Environments that support lockstep training must also implement _step_env().
     """
 
-    def __init__(self, node_name='gym_interface', eval=False, launch_file=None, launch_args=[], run_id=None):
+    def __init__(self, node_name='gym_interface', eval=False, launch_file=None, launch_args=[], run_id=None,
+                 lockstep=False, master_uri=None):
         """
         Initializes the rospy interface.
         @param node_name: Desired name of this node in the ROS network.
@@ -47,43 +53,47 @@ class ROSInterface(Env):
         @param launch_file: If training, launch file to be used (ex: ['rktl_autonomy', 'rocket_league_train.launch']).
         @param launch_args: If training, arguments to be passed to roslaunch (ex: ['render:=true', rate:=10]).
         @param run_id: If training, used to prevent deadlocks. if logging, run_id describes where to save files.
+        @param lockstep: If training, step the environment with _step_env() instead of advancing sim time and waiting.
+        @param master_uri: If training, join a ROS network that is already running (ex: started by a
+            LaunchCoordinator) instead of launching one.
         """
         super().__init__()
         self.__EVAL_MODE = eval
+        self.__LOCKSTEP = lockstep
+        assert not (eval and lockstep)
 
         # ROS initialization
-        if not self.__EVAL_MODE:
+        if not self.__EVAL_MODE and master_uri is not None:
+            # use a ROS network started for this environment
+            port = urlparse(master_uri).port
+            os.environ['ROS_MASTER_URI'] = master_uri
+            rospy.init_node(node_name)
+        elif not self.__EVAL_MODE:
             assert launch_file is not None
             assert run_id is not None
-            # use temporary files to enforce one environment roslaunching at a time
+            # use temporary files to enforce one environment picking a port and roslaunching at a time.
+            # each env has its own coordinator here, and checking that a port is free then launching on it
+            # is not atomic across processes: roslaunch would silently join a master another env just started
+            delay = 0.01
             while True:
                 try:
                     open(f'/tmp/{run_id}_launch', mode='x')
                     break
                 except FileExistsError:
-                    pass
-            # find a free port (using default if available)
-            port = 11311
-            with socket.socket() as sock:
-                try:
-                    sock.bind(('localhost', port))
-                except socket.error:
-                    sock.bind(('localhost', 0))
-                    port = sock.getsockname()[1]
-
-            # launch the training ROS network
-            ros_id = roslaunch.rlutil.get_or_generate_uuid(None, False)
-            roslaunch.configure_logging(ros_id)
-            launch_file = roslaunch.rlutil.resolve_launch_arguments(launch_file)[0]
-            launch_args = [f'render:={port==11311}', f'plot_log:={port==11311}'] + launch_args + [f'agent_name:={node_name}']
-            launch = roslaunch.parent.ROSLaunchParent(ros_id, [(launch_file, launch_args)], port=port)
-            launch.start()
-            self.close = lambda: launch.shutdown()
-
-            os.environ['ROS_MASTER_URI'] = f'http://localhost:{port}'
+                    time.sleep(delay)
+                    delay = min(delay * 2.0, 0.5)
+            try:
+                # launch the training ROS network (on the default port if available)
+                coordinator = LaunchCoordinator(launch_file, launch_args, agent_name=node_name, max_parallel=1)
+                master_uri = coordinator.start(1)[0]
+            finally:
+                # let someone else take a turn
+                os.remove(f'/tmp/{run_id}_launch')
+            self.close = coordinator.shutdown
+
+            port = urlparse(master_uri).port
+            os.environ['ROS_MASTER_URI'] = master_uri
             rospy.init_node(node_name)
-            # let someone else take a turn
-            os.remove(f'/tmp/{run_id}_launch')
         else:
             # use an existing ROS network
             rospy.init_node(node_name)
@@ -91,7 +101,7 @@ class ROSInterface(Env):
         # private variables
         self._cond = Condition()
 
-        if not self.__EVAL_MODE:
+        if not self.__EVAL_MODE and not self.__LOCKSTEP:
             self.__DELTA_T = rospy.Duration.from_sec(1.0 / rospy.get_param('~rate', 30.0))
             self.__clock_pub = rospy.Publisher('/clock', Clock, queue_size=1, latch=True)
 
@@ -103,13 +113,21 @@ class ROSInterface(Env):
         if run_id is None:
             run_id = uuid.uuid4()
         if self.__EVAL_MODE:
-            port = 11311
+            port = DEFAULT_PORT
         self.__LOG_ID = f'{run_id}:{port}'
         self.__log_pub = rospy.Publisher('~log', DiagnosticStatus, queue_size=1)
         self.__episode = 0
         self.__net_reward = 0
         self.__start_time = rospy.Time.now()
 
+        # time the phases of each step (most importantly, time spent waiting on the env)
+        self.__PROFILE_PERIOD = rospy.get_param('~profile_period', 0.0)
+        self.__timers = StepTimers(enabled=(self.__PROFILE_PERIOD > 0.0))
+        if self.__PROFILE_PERIOD > 0.0:
+            self.__profile_pub = rospy.Publisher('~profile', DiagnosticStatus, queue_size=1, latch=True)
+            self.__last_profile = time.monotonic()
+            rospy.on_shutdown(self.__dump_profile)
+
     def step(self, action):
         """
         Implementation of gym.Env.step.
@@ -124,11 +142,22 @@ class ROSInterface(Env):
             info (dict): Contains auxiliary diagnostic information (helpful for debugging, and sometimes learning).
         """
 
-        self._clear_state()
-        self._publish_action(action)
-        self.__step_time_and_wait_for_state()
-        state = self._get_state()
+        with self.__timers.timer('env.step'):
+            self._clear_state()
+            if self.__LOCKSTEP:
+                with self.__timers.timer('env.step_env'):
+                    self._step_env(action)
+            else:
+                with self.__timers.timer('env.publish_action'):
+                    self._publish_action(action)
+                self.__step_time_and_wait_for_state()
+            with self.__timers.timer('env.get_state'):
+                state = self._get_state()
         self.__net_reward += state[1]  # logging
+
+        if self.__PROFILE_PERIOD > 0.0 and time.monotonic() - self.__last_profile >= self.__PROFILE_PERIOD:
+            self.__last_profile = time.monotonic()
+            self.__publish_profile()
         return state
 
     def reset(self):
@@ -162,7 +191,10 @@ class ROSInterface(Env):
         if not self.__EVAL_MODE:
             self._reset_env()
         self._reset_self()
-        self.__step_time_and_wait_for_state(5)
+        if self.__LOCKSTEP:
+            self._step_env(None)
+        else:
+            self.__step_time_and_wait_for_state(5)
         self.__start_time = rospy.Time.now()  # logging
         return self._get_state()[0]
 
@@ -173,8 +205,9 @@ class ROSInterface(Env):
         @param max_retries: Number of time steps until state is known.
         """
         if not self.__EVAL_MODE:
-            self.__time += self.__DELTA_T
-            self.__clock_pub.publish(self.__time)
+            with self.__timers.timer('env.advance_clock'):
+                self.__time += self.__DELTA_T
+                self.__clock_pub.publish(self.__time)
             retries = 0
             while not self.__wait_once_for_state():
 
@@ -182,8 +215,9 @@ class ROSInterface(Env):
                     rospy.logerr("Failed to get new state.")
                     raise SimTimeException
                 else:
-                    self.__time += self.__DELTA_T
-                    self.__clock_pub.publish(self.__time)
+                    with self.__timers.timer('env.advance_clock'):
+                        self.__time += self.__DELTA_T
+                        self.__clock_pub.publish(self.__time)
                     retries += 1
         else:
             # call for the provided number of retries
@@ -192,12 +226,29 @@ class ROSInterface(Env):
 
     def __wait_once_for_state(self):
         """ Wait and allow other threads to run."""
-        with self._cond:
+        with self.__timers.timer('env.wait_for_state'), self._cond:
             has_state = self._cond.wait_for(self._has_state, 0.25)
         if rospy.is_shutdown():
             raise rospy.ROSInterruptException()
         return has_state
 
+    def __publish_profile(self):
+        """Publishes the step timers to ~profile."""
+        msg = DiagnosticStatus()
+        msg.level = DiagnosticStatus.OK
+        msg.name = 'ROS-Gym Interface'
+        msg.message = 'timers: calls, total s, mean ms, max ms'
+        msg.hardware_id = self.__LOG_ID
+        msg.values = [KeyValue(key=name, value=f"{timing['calls']}, {timing['total']:.3f}, "
+                                               f"{timing['mean'] * 1e3:.3f}, {timing['max'] * 1e3:.3f}")
+                      for name, timing in self.__timers.get_profile().items()]
+        self.__profile_pub.publish(msg)
+
+    def __dump_profile(self):
+        """Publishes the step timers and logs them as a table."""
+        self.__publish_profile()
+        rospy.loginfo('gym interface profile:\n' + self.__timers.format_profile())
+
     @property
     @abstractmethod
     def action_space(self):
@@ -240,3 +291,7 @@ class ROSInterface(Env):
     def _publish_action(self, action):
         """ Publish an action to the ROS network."""
         raise NotImplementedError
+
+    def _step_env(self, action):
+        """ Apply an action (None to keep the last one), advance one step, and set the new state (lockstep only)."""
+        raise NotImplementedError
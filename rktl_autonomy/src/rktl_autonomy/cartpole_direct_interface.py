@@ -16,8 +16,9 @@ import gym
 
 class CartpoleDirectInterface(ROSInterface):
     """ROS interface for the cartpole game."""
-    def __init__(self, eval=False, launch_file=['rktl_autonomy', 'cartpole_train.launch'], launch_args=[], run_id=None):
-        super().__init__(node_name='cartpole_agent', eval=eval, launch_file=launch_file, launch_args=launch_args, run_id=run_id)
+    def __init__(self, eval=False, launch_file=['rktl_autonomy', 'cartpole_train.launch'], launch_args=[], run_id=None, master_uri=None):
+        super().__init__(node_name='cartpole_agent', eval=eval, launch_file=launch_file, launch_args=launch_args, run_id=run_id,
+                         master_uri=master_uri)
 
         self._RENDER = rospy.get_param('~render', False)
 
@@ -0,0 +1,227 @@
+"""Contains the CheckpointEvaluator class, for scoring saved models in parallel.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# Every checkpoint is scored on the same fixed set of seeds: each episode seeds
+# a RocketLeagueDirectInterface before resetting it, so checkpoint N and
+# checkpoint M start from identical states and their scores are comparable.
+# Episodes are split into chunks, and the chunks of all checkpoints are run in a
+# pool of worker processes (one env each, see Sim). Results are kept in an index
+# keyed by the hash of the weights and of the seeds and env config, so weights
+# that were already scored are skipped.
+
+# 3rd party modules
+from collections import namedtuple
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import numpy as np
+
+# package
+from rktl_autonomy.rocket_league_direct_interface import _load_config
+
+# score of a checkpoint. returns has one total reward per seed, in the order of the seeds
+Result = namedtuple('Result', ['checkpoint', 'steps', 'key', 'mean', 'std', 'returns', 'cached'])
+
+_STEPS_PATTERN = re.compile(r'rl_model_(\d+)_steps\.zip$')
+
+
+def make_seeds(count, seed=0):
+    """Returns a fixed list of episode seeds."""
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(count)]
+
+
+def hash_file(path):
+    """Returns the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_steps(path):
+    """Returns the training steps of a CheckpointCallback file name, or None."""
+    match = _STEPS_PATTERN.search(path)
+    return int(match.group(1)) if match else None
+
+
+class EvaluationIndex(object):
+    """
+    Results of a directory of checkpoints, as JSON (keyed by Result.key) and as a
+    TSV table sorted by training steps. Both files are rewritten after every
+    result, so an interrupted evaluation keeps what it finished.
+    """
+
+    def __init__(self, path):
+        """
+        @param path: JSON file to keep results in. The TSV is written next to it.
+        """
+        self.path = path
+        self.tsv_path = os.path.splitext(path)[0] + '.tsv'
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path) as file:
+                self.entries = json.load(file)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """Returns the cached Result of a key."""
+        entry = self.entries[key]
+        return Result(entry['checkpoint'], entry['steps'], key, entry['mean'], entry['std'],
+                      entry['returns'], True)
+
+    def add(self, result):
+        """Adds a result, and rewrites both files."""
+        self.entries[result.key] = {
+            'checkpoint': os.path.basename(result.checkpoint),
+            'steps': result.steps,
+            'mean': result.mean,
+            'std': result.std,
+            'returns': result.returns,
+        }
+        self._write(self.path, lambda file: json.dump(self.entries, file, indent=2, sort_keys=True))
+        self._write(self.tsv_path, self._write_tsv)
+
+    def _write_tsv(self, file):
+        file.write("Training Episodes\tMean Reward\tStd-Dev Reward\tEpisodes\tCheckpoint\tKey\n")
+        rows = sorted(self.entries.items(), key=lambda item: (item[1]['steps'] is None, item[1]['steps'] or 0))
+        for key, entry in rows:
+            file.write(f"{entry['steps']}\t{entry['mean']:.3f}\t{entry['std']:.3f}\t"
+                       f"{len(entry['returns'])}\t{entry['checkpoint']}\t{key}\n")
+
+    @staticmethod
+    def _write(path, write):
+        # replace in one step, so readers never see a partial file
+        with open(path + '.tmp', 'w') as file:
+            write(file)
+        os.replace(path + '.tmp', path)
+
+
+_worker_env = None
+_worker_model = (None, None)
+
+
+def _init_worker(env_kwargs):
+    global _worker_env
+    import torch
+    # one thread per worker, otherwise every worker's policy uses every core
+    torch.set_num_threads(1)
+    from rktl_autonomy import RocketLeagueDirectInterface
+    _worker_env = RocketLeagueDirectInterface(**env_kwargs)
+
+
+def _run_episodes(task):
+    global _worker_model
+    from stable_baselines3 import PPO
+    index, path, seeds = task
+    # consecutive chunks are usually of the same checkpoint
+    if _worker_model[0] != path:
+        _worker_model = (path, PPO.load(path, device='cpu'))
+    model = _worker_model[1]
+
+    returns = []
+    for seed in seeds:
+        _worker_env.seed(seed)
+        obs = _worker_env.reset()
+        total, done = 0.0, False
+        while not done:
+            action, _ = model.predict(obs, deterministic=True)
+            obs, reward, done, _ = _worker_env.step(action)
+            total += reward
+        returns.append(float(total))
+    return index, returns
+
+
+class CheckpointEvaluator(object):
+    """Scores checkpoints on a fixed set of seeded episodes, in parallel."""
+
+    def __init__(self, seeds, config=None, sim_config=None, global_config=None, backend=None,
+                 workers=None, chunk_size=8):
+        """
+        @param seeds: Episode seeds (ex: make_seeds(48)). Every checkpoint runs one episode per seed.
+        @param config: Agent config, equivalent to `rocket_league.yaml` (used if None).
+        @param sim_config: Simulator config, equivalent to `simulation.yaml` (used if None).
+        @param global_config: Field and car config, equivalent to `global_params.yaml` (used if None).
+        @param backend: Physics backend (uses the simulator config if None).
+        @param workers: Number of worker processes (default=one per CPU).
+        @param chunk_size: Episodes per task given to a worker.
+        """
+        if not seeds:
+            raise ValueError('no seeds to evaluate on')
+        if config is None:
+            config = _load_config('rktl_autonomy', 'config', 'rocket_league.yaml')
+        if sim_config is None:
+            sim_config = _load_config('rktl_sim', 'config', 'simulation.yaml')
+        if global_config is None:
+            global_config = _load_config('rktl_launch', 'config', 'global_params.yaml')
+        env_kwargs = {'config': config, 'sim_config': sim_config, 'global_config': global_config,
+                      'backend': backend}
+        self.seeds = list(seeds)
+        self._chunk_size = chunk_size
+        # anything that changes the episodes changes the key, so old scores are not reused
+        self.seed_set = hashlib.sha256(json.dumps({'seeds': self.seeds, 'env': env_kwargs},
+                                                  sort_keys=True).encode()).hexdigest()
+        # workers are spawned rather than forked, so they do not inherit a PyBullet client
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=_init_worker, initargs=(env_kwargs,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def key(self, checkpoint):
+        """Returns the cache key of a checkpoint file on this evaluator's seeds."""
+        return f'{hash_file(checkpoint)[:16]}-{self.seed_set[:16]}'
+
+    def evaluate(self, checkpoints, index=None):
+        """
+        Scores checkpoints, skipping those already in an index.
+        @param checkpoints: Paths of saved models (.zip).
+        @param index: EvaluationIndex to read cached results from and add new results to (optional).
+        @return: Generator of Result, cached ones first, then the rest as they finish.
+        """
+        pending = []
+        for path in checkpoints:
+            key = self.key(path)
+            if index is not None and key in index:
+                yield index.get(key)
+            else:
+                pending.append((path, key))
+
+        tasks = []
+        for i, (path, _) in enumerate(pending):
+            for start in range(0, len(self.seeds), self._chunk_size):
+                tasks.append((i, path, self.seeds[start:start + self._chunk_size]))
+        num_chunks = -(-len(self.seeds) // self._chunk_size)
+
+        # imap keeps the order of the tasks, so each checkpoint's returns arrive in seed order
+        returns = [[] for _ in pending]
+        chunks_done = [0] * len(pending)
+        for i, chunk in self._pool.imap(_run_episodes, tasks):
+            returns[i] += chunk
+            chunks_done[i] += 1
+            if chunks_done[i] < num_chunks:
+                continue
+            path, key = pending[i]
+            result = Result(path, get_steps(path), key, float(np.mean(returns[i])),
+                            float(np.std(returns[i])), returns[i], False)
+            if index is not None:
+                index.add(result)
+            yield result
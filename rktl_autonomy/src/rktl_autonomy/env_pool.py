@@ -0,0 +1,88 @@
+"""Contains the EnvPool class, which keeps environments running between uses.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+from contextlib import contextmanager
+from queue import Queue
+from threading import Lock
+
+import numpy as np
+
+
+class EnvPool(object):
+    """
+    A fixed set of long lived (vectorized) environments, leased to one user at a time.
+    This is meant for running many short jobs (ex: hyperparameter tuning trials)
+    without starting and stopping an environment for each. Leasing waits for a free
+    environment, seeds it with a new seed, and resets it. An environment that raises
+    while leased is assumed broken, so it is closed and made again.
+    """
+
+    def __init__(self, make_env, size, seed=None):
+        """
+        @param make_env: Function of (index, restart) that returns a VecEnv. restart is True when
+            replacing a broken environment, so anything it depends on should be restarted too.
+        @param size: Number of environments.
+        @param seed: Seed for the seeds given to leased environments (default=unseeded).
+        """
+        self._make_env = make_env
+        self._envs = [make_env(index, False) for index in range(size)]
+        self._free = Queue()
+        for index in range(size):
+            self._free.put(index)
+        self._seeds = np.random.SeedSequence(seed)
+        self._seed_lock = Lock()
+        self.replaced = 0
+
+    def __len__(self):
+        return len(self._envs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextmanager
+    def lease(self, seed=None):
+        """
+        Borrows an environment for the duration of a with block, ex:
+            with pool.lease() as env:
+                model = PPO('MlpPolicy', env)
+        @param seed: Seed for the environment (default=drawn from the pool's seed).
+        """
+        index = self._free.get()
+        try:
+            env = self._envs[index]
+            if seed is None:
+                with self._seed_lock:
+                    # 31 bits, so it fits in a ROS parameter
+                    seed = int(self._seeds.spawn(1)[0].generate_state(1)[0] >> 1)
+            env.seed(seed)
+            env.reset()
+            yield env
+        except Exception:
+            self._replace(index)
+            raise
+        finally:
+            self._free.put(index)
+
+    def close(self):
+        """Closes every environment."""
+        for env in self._envs:
+            if env is not None:
+                env.close()
+        self._envs = []
+
+    def _replace(self, index):
+        env = self._envs[index]
+        self._envs[index] = None
+        try:
+            env.close()
+        except Exception:
+            pass
+        self._envs[index] = self._make_env(index, True)
+        self.replaced += 1
@@ -0,0 +1,173 @@
+"""Contains the LaunchCoordinator class, which starts the ROS networks of a
+set of training environments from one process.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import atexit, os, signal, socket, subprocess, time
+
+import rosgraph
+
+# port of the default ROS master. The network launched on it is rendered and plotted
+DEFAULT_PORT = 11311
+
+
+class LaunchException(Exception):
+    """For when a ROS network does not come up."""
+    pass
+
+
+def allocate_ports(count, preferred=DEFAULT_PORT):
+    """
+    Picks distinct free ports, using the preferred port for the first one if it is free.
+    @param count: Number of ports.
+    @param preferred: Port to try first (None to only use ports picked by the OS).
+    @return: List of ports.
+    """
+    sockets = []
+    try:
+        for i in range(count):
+            sock = socket.socket()
+            sockets.append(sock)
+            if i == 0 and preferred is not None:
+                try:
+                    sock.bind(('localhost', preferred))
+                    continue
+                except socket.error:
+                    pass
+            sock.bind(('localhost', 0))
+        # every socket is held until all are picked, so the ports are distinct
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+class LaunchCoordinator(object):
+    """
+    Starts one ROS network (roslaunch process with its own master) per environment.
+    Networks are started concurrently, up to max_parallel at a time, each on a port
+    picked up front. A network is healthy once its master answers and the
+    ready_services are registered. Networks that exit or do not get healthy in time
+    are restarted on a new port. Pass each master URI to an environment (ex:
+    RocketLeagueInterface(master_uri=uri)), which then joins that network instead
+    of launching its own.
+    """
+
+    def __init__(self, launch_file, launch_args=[], agent_name='gym_interface', ready_services=[],
+                 max_parallel=4, timeout=60.0, retries=2):
+        """
+        @param launch_file: Launch file to use (ex: ['rktl_autonomy', 'rocket_league_train.launch']).
+        @param launch_args: Arguments to pass to roslaunch (ex: ['render:=false']).
+        @param agent_name: Name of the environment's node, passed to the launch file as agent_name.
+        @param ready_services: Services that must be registered before a network is considered up (ex: ['/sim_reset']).
+        @param max_parallel: Maximum number of networks starting at once.
+        @param timeout: Seconds to wait for a network to come up before restarting it.
+        @param retries: Number of restarts before giving up.
+        """
+        self._launch_file = list(launch_file)
+        self._launch_args = list(launch_args)
+        self._agent_name = agent_name
+        self._ready_services = list(ready_services)
+        self._max_parallel = max_parallel
+        self._timeout = timeout
+        self._retries = retries
+        self._procs = []
+        self.master_uris = []
+        atexit.register(self.shutdown)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def start(self, num_envs):
+        """
+        Starts more ROS networks, and waits for all of them to come up.
+        @param num_envs: Number of networks to start.
+        @return: List of the new networks' master URIs.
+        """
+        ports = allocate_ports(num_envs, DEFAULT_PORT if not self._procs else None)
+        with ThreadPoolExecutor(max(1, min(self._max_parallel, num_envs))) as pool:
+            launched = list(pool.map(self._launch, ports))
+        uris = []
+        for proc, uri in launched:
+            self._procs.append(proc)
+            uris.append(uri)
+        self.master_uris += uris
+        return uris
+
+    def restart(self, index):
+        """Stops a network and starts it again on a new port, returning its new master URI."""
+        self._stop(self._procs[index])
+        self._procs[index], self.master_uris[index] = self._launch(allocate_ports(1, None)[0])
+        return self.master_uris[index]
+
+    def shutdown(self):
+        """Stops every network."""
+        for proc in self._procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+        for proc in self._procs:
+            self._stop(proc)
+        self._procs = []
+        self.master_uris = []
+
+    def _launch(self, port):
+        """Starts one network, retrying on new ports, and returns its process and master URI."""
+        for attempt in range(self._retries + 1):
+            uri = f'http://localhost:{port}'
+            # a master already on this port belongs to someone else
+            if not self._is_online(uri):
+                proc = self._popen(port, uri)
+                if self._wait_until_ready(proc, uri):
+                    return proc, uri
+                self._stop(proc)
+            port = allocate_ports(1, None)[0]
+        raise LaunchException(f'failed to launch {" ".join(self._launch_file)} '
+                              f'after {self._retries + 1} attempts')
+
+    def _popen(self, port, uri):
+        args = [f'render:={port == DEFAULT_PORT}', f'plot_log:={port == DEFAULT_PORT}'] + \
+            self._launch_args + [f'agent_name:={self._agent_name}']
+        env = dict(os.environ, ROS_MASTER_URI=uri)
+        # own process group, so terminal interrupts go through shutdown instead
+        return subprocess.Popen(['roslaunch', '-p', str(port)] + self._launch_file + args,
+                                env=env, start_new_session=True)
+
+    def _wait_until_ready(self, proc, uri):
+        deadline = time.monotonic() + self._timeout
+        delay = 0.05
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                return False
+            if self._is_online(uri) and self._has_services(uri):
+                return True
+            time.sleep(delay)
+            delay = min(delay * 2.0, 0.5)
+        return False
+
+    def _is_online(self, uri):
+        return rosgraph.Master('/launch_coordinator', master_uri=uri).is_online()
+
+    def _has_services(self, uri):
+        master = rosgraph.Master('/launch_coordinator', master_uri=uri)
+        for service in self._ready_services:
+            try:
+                master.lookupService(service)
+            except rosgraph.MasterError:
+                return False
+        return True
+
+    def _stop(self, proc, timeout=15.0):
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
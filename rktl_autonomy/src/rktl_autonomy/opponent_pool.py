@@ -0,0 +1,83 @@
+"""Contains the OpponentPool class, which picks opponents for self-play.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+from collections import OrderedDict
+from glob import glob
+import os
+
+import numpy as np
+from stable_baselines3 import PPO
+
+from rktl_autonomy.checkpoint_evaluator import get_steps
+
+
+class OpponentPool(object):
+    """
+    Past versions of a policy to play against. Opponents are the checkpoints that
+    CheckpointCallback saves during training (found again on every sample, so new
+    ones join as they are saved), and any policies added directly (ex: the model
+    being trained). Playing only the newest version can chase a moving target, so
+    the newest is picked with probability latest_prob, and otherwise a uniformly
+    random older checkpoint.
+    """
+
+    def __init__(self, checkpoint_dir=None, latest_prob=0.5, max_loaded=8, policy_class=PPO, seed=None):
+        """
+        @param checkpoint_dir: Directory of rl_model_*_steps.zip checkpoints (optional).
+        @param latest_prob: Probability of picking the newest opponent.
+        @param max_loaded: Number of checkpoints to keep loaded.
+        @param policy_class: Class to load checkpoints with.
+        @param seed: Seed for picking opponents (default=unseeded).
+        """
+        self._checkpoint_dir = checkpoint_dir
+        self._latest_prob = latest_prob
+        self._max_loaded = max_loaded
+        self._policy_class = policy_class
+        self._rng = np.random.default_rng(seed)
+        self._loaded = OrderedDict()
+        self.policies = []
+        self.checkpoints = []
+
+    def __len__(self):
+        return len(self.policies) + len(self.checkpoints)
+
+    def add(self, policy):
+        """Adds a policy (anything with predict(obs, deterministic)). Added policies count as the newest."""
+        self.policies.append(policy)
+
+    def refresh(self):
+        """Finds the checkpoints saved so far, oldest first."""
+        if self._checkpoint_dir is not None:
+            paths = glob(os.path.join(self._checkpoint_dir, 'rl_model_*_steps.zip'))
+            self.checkpoints = sorted(paths, key=get_steps)
+
+    def sample(self):
+        """
+        Picks an opponent.
+        @return: The opponent's policy, or None if the pool is empty.
+        """
+        self.refresh()
+        if len(self) == 0:
+            return None
+        if self.policies:
+            newest, older = self.policies[-1], self.checkpoints
+        else:
+            newest, older = self.checkpoints[-1], self.checkpoints[:-1]
+        if not older or self._rng.random() < self._latest_prob:
+            choice = newest
+        else:
+            choice = older[self._rng.integers(len(older))]
+        return self._load(choice) if isinstance(choice, str) else choice
+
+    def _load(self, path):
+        if path in self._loaded:
+            self._loaded.move_to_end(path)
+        else:
+            self._loaded[path] = self._policy_class.load(path, device='cpu')
+            if len(self._loaded) > self._max_loaded:
+                self._loaded.popitem(last=False)
+        return self._loaded[path]
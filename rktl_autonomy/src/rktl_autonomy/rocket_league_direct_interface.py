@@ -0,0 +1,240 @@
+"""Interface to the Rocket League project that directly owns the simulator.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# package
+from rktl_autonomy.rocket_league_task import RocketLeagueTask, OBS_SIZE
+from gym import Env
+
+# ROS (filesystem only, no ROS network is used)
+import rospkg
+import xacro
+
+# System
+import numpy as np
+import yaml, os, tempfile
+
+# simulator
+import simulator
+from simulator import state
+
+
+def _load_config(package, *path):
+    """Load a YAML config file from a package."""
+    with open(os.path.join(rospkg.RosPack().get_path(package), *path)) as file:
+        return yaml.safe_load(file)
+
+
+def _sample_param(value, rng):
+    """Resolve a parameter that may be given as a min / max range."""
+    if isinstance(value, dict):
+        low, high = float(value['min']), float(value['max'])
+        return rng.uniform(min(low, high), max(low, high))
+    return value
+
+
+class RocketLeagueDirectInterface(Env):
+    """Gym environment for the Rocket League that steps a simulator.Sim in-process.
+
+    This produces the same observations, rewards, and actions as the
+    RocketLeagueInterface running against the simulator in 'ideal' mode, but
+    does not go through ROS. Parameters that would normally come from the ROS
+    parameter server are read from the same YAML files used by the launch files.
+    """
+
+    # columns of Sim.get_state_array in the observation
+    _CAR_COLUMNS = [state.X, state.Y, state.YAW, state.V_FORWARD, state.OMEGA]
+    _BALL_COLUMNS = [state.X, state.Y, state.V_FORWARD, state.V_LEFT]
+
+    def __init__(self, config=None, sim_config=None, global_config=None, render=False, backend=None, run_id=None, seed=None,
+                 num_arenas=1):
+        """
+        Create the simulator and read all constants.
+        @param config: Agent config, equivalent to `rocket_league.yaml` (used if None).
+        @param sim_config: Simulator config, equivalent to `simulation.yaml` (used if None).
+        @param global_config: Field and car config, equivalent to `global_params.yaml` (used if None).
+        @param render: Open a PyBullet GUI window.
+        @param backend: Physics backend for the Sim (uses the simulator config if None).
+        @param run_id: Unused. Accepted for compatibility with scripts written for RocketLeagueInterface.
+        @param seed: Seed for all randomness, in parameter ranges and the Sim (default=unseeded).
+        @param num_arenas: Number of arenas in the Sim. This env only plays in the first one (see RocketLeagueSelfPlayEnv).
+        """
+        super().__init__()
+        self._rng = np.random.default_rng(seed)
+
+        if config is None:
+            config = _load_config('rktl_autonomy', 'config', 'rocket_league.yaml')
+        if sim_config is None:
+            sim_config = _load_config('rktl_sim', 'config', 'simulation.yaml')
+        if global_config is None:
+            global_config = _load_config('rktl_launch', 'config', 'global_params.yaml')
+        self._config = config
+        self._sim_config = sim_config
+        self._global_config = global_config
+
+        # spaces, observation bounds, rewards, and commands, shared with RocketLeagueInterface
+        self._task = RocketLeagueTask(config, global_config)
+        self._DELTA_T = 1.0 / config.get('rate', 10.0)
+        self._MAX_TIME = self._task.MAX_TIME
+
+        # simulator
+        self._urdf_dir = tempfile.TemporaryDirectory()
+        props = {
+            'engine': sim_config.get('engine', None),
+            'dynamics': sim_config.get('dynamics', None),
+            'stepping': sim_config.get('stepping', None),
+        }
+        if backend is None:
+            backend = sim_config.get('backend', 'pybullet')
+        self._sim = simulator.Sim(props, self._build_urdfs(), self._get_spawn_bounds(), render, backend=backend,
+                                  num_arenas=num_arenas, seed=seed)
+        ball_config = sim_config.get('ball', {})
+        self._sim.create_ball('ball', init_pose=ball_config.get('init_pose', None),
+                              init_speed=ball_config.get('init_speed', None))
+        self._car_id = self._sim.create_car('car', init_pose=sim_config['cars'][0].get('init_pose', None),
+                                            car_props=self._get_car_properties())
+        self._car_row = self._sim.car_ids.index(self._car_id)
+
+        # saved initial states to reset to (see snapshot_pool_size in `simulation.yaml`)
+        self._snapshot_pool_size = sim_config.get('snapshot_pool_size', 0) or 0
+        self._snapshot_pool_filled = False
+
+        # state variables
+        self._time = None
+        self._raw = np.zeros((1, OBS_SIZE), dtype=np.float32)
+
+    def _build_urdfs(self):
+        """Generate field URDFs for the configured field size, returning all URDF paths."""
+        urdf_dir = os.path.join(rospkg.RosPack().get_path('rktl_sim'), 'urdf')
+        field = self._global_config['field']
+        mappings = {
+            'field_length': str(field['length']),
+            'field_width': str(field['width']),
+            'goal_size': str(field['goal']['width']),
+        }
+
+        urdf_paths = {
+            'ball': os.path.join(urdf_dir, 'ball.urdf'),
+            'car': os.path.join(urdf_dir, 'car.urdf'),
+            'plane': os.path.join(urdf_dir, 'plane.urdf'),
+        }
+        for name in ('walls', 'goal_a', 'goal_b'):
+            doc = xacro.process_file(os.path.join(urdf_dir, f'{name}.urdf.xacro'), mappings=mappings)
+            urdf_paths[name] = os.path.join(self._urdf_dir.name, f'{name}.urdf')
+            with open(urdf_paths[name], 'w') as file:
+                file.write(doc.toprettyxml(indent='  '))
+        return urdf_paths
+
+    def _get_spawn_bounds(self):
+        """Spawn bounds, matching Simulator.get_spawn_bounds."""
+        fw = _sample_param(self._global_config['field']['width'], self._rng)
+        fl = _sample_param(self._global_config['field']['length'], self._rng)
+        wt = _sample_param(self._global_config['field']['wall_thickness'], self._rng)
+        spawn_height = self._sim_config.get('spawn_height', 0.06)
+
+        return [[-(fl / 2) + (2 * wt), (fl / 2) - (2 * wt)],
+                [-(fw / 2) + (2 * wt), (fw / 2) - (2 * wt)],
+                [spawn_height, spawn_height]]
+
+    def _get_car_properties(self):
+        """Car properties for an ideal mode car, matching Simulator.reset_cb."""
+        cars = self._global_config['cars']
+        return {'length': _sample_param(cars['length'], self._rng),
+                'max_speed': _sample_param(cars['throttle']['max_speed'], self._rng),
+                'steering_throw': _sample_param(cars['steering']['max_throw'], self._rng),
+                'throttle_tau': _sample_param(cars['throttle']['tau'], self._rng),
+                'steering_rate': _sample_param(cars['steering']['rate'], self._rng),
+                'simulate_effort': False}
+
+    @property
+    def action_space(self):
+        """The Space object corresponding to valid actions."""
+        return self._task.action_space
+
+    @property
+    def observation_space(self):
+        """
+        The Space object corresponding to valid observations.
+        @return: The lower and upper bound of the field.
+        """
+        return self._task.observation_space
+
+    def step(self, action):
+        """
+        Implementation of gym.Env.step.
+        Applies the action, then advances the simulator by one timestep.
+        @param action: An action provided by the agent.
+        @return: state tuple (observation, reward, done, info)
+        """
+        self._set_action(action)
+        self._sim.step(self._DELTA_T)
+        self._time += self._DELTA_T
+        return self._get_state()
+
+    def seed(self, seed=None):
+        """Re-seeds parameter ranges and the simulator's random streams."""
+        self._rng = np.random.default_rng(seed)
+        self._sim.seed(seed)
+        self._snapshot_pool_filled = False
+        return [seed]
+
+    def reset(self):
+        """
+        Resets the simulator to a new random initial state.
+        @return: the initial observation.
+        """
+        if self._snapshot_pool_size > 0:
+            if not self._snapshot_pool_filled:
+                self._sim.fill_snapshot_pool(self._snapshot_pool_size, self._get_spawn_bounds(),
+                                             self._get_car_properties(), None, None)
+                self._snapshot_pool_filled = True
+            self._sim.reset_from_pool()
+        else:
+            self._sim.reset(self._get_spawn_bounds(), self._get_car_properties(), None, None)
+        self._time = 0.0
+        return self._get_state()[0]
+
+    def close(self):
+        """Disconnect from the physics server and remove generated files."""
+        self._sim.close()
+        self._urdf_dir.cleanup()
+
+    def _get_state(self):
+        """
+        Checks if the ball and car are in the field limits, steps the time, and checks if there are rewards.
+        @return: state tuple (observation, reward, done, info)
+        """
+        # cars, then the ball
+        bodies = self._sim.get_state_array()
+
+        if self._sim.scored:
+            score = 1 if self._sim.winner == "A" else -1
+        else:
+            score = 0
+
+        # combine the car and ball odoms for observation
+        self._raw[0, :5] = bodies[self._car_row, self._CAR_COLUMNS]
+        self._raw[0, 5:] = bodies[-1, self._BALL_COLUMNS]
+
+        # ensure the observation fits within the the limits
+        observation, _ = self._task.observe(self._raw)
+
+        # check if time has exceeded
+        done = self._time >= self._MAX_TIME
+
+        # determine the reward, and check if someone scored
+        reward, scored = self._task.reward(self._raw, (score,))
+        done = done or bool(scored[0])
+
+        return (observation[0], float(reward[0]), done, {'goals': score})
+
+    def _set_action(self, action):
+        """
+        Set the car command in the sim (using velocity and curvature).
+        @param action: The desired action.
+        """
+        velocity, curvature = self._task.get_command(action)
+        self._sim.set_car_command(self._car_id, (velocity, curvature))
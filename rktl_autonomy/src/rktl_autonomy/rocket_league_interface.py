@@ -7,41 +7,24 @@ License:
 
 # package
 from rktl_autonomy import ROSInterface
-from gym.spaces import Box, Discrete
+from rktl_autonomy.rocket_league_task import RocketLeagueTask, OBS_SIZE
 
 # ROS
 import rospy
 from nav_msgs.msg import Odometry
 from rktl_msgs.msg import ControlCommand, MatchStatus
 from std_srvs.srv import Empty
+from rktl_sim.srv import SimStep, SimStepRequest
 
 # System
 import numpy as np
 from tf.transformations import euler_from_quaternion
-from enum import IntEnum, unique, auto
-from math import pi, tan
-
-
-@unique
-class CarActions(IntEnum):
-    """
-    Possible actions for car.
-    Currently using discrete action space.
-    """
-    STOP = 0
-    FWD_LEFT = auto()
-    FWD_RIGHT = auto()
-    FWD = auto()
-    REV_LEFT = auto()
-    REV_RIGHT = auto()
-    REV = auto()
-    SIZE = auto()
 
 
 class RocketLeagueInterface(ROSInterface):
 
     def __init__(self, eval=False, launch_file=['rktl_autonomy', 'rocket_league_train.launch'], launch_args=[],
-                 run_id=None):
+                 run_id=None, lockstep=False, master_uri=None):
         """
         ROS interface for the Rocket League.
         Set parameters for game elements (car/bar) and field object properties (goal,walls,planes).
@@ -50,66 +33,43 @@ class RocketLeagueInterface(ROSInterface):
         @param launch_file: Used in _ros_interface.py to configure the training for roslaunch.
         @param launch_args: Specify the files to be used in launching.
         @param run_id: The id for this specific training run.
+        @param lockstep: If training, step the simulator with one service call instead of advancing sim time.
+        @param master_uri: If training, master of a running network to join (the network must be
+            launched with lockstep:=true for lockstep training).
         """
+        if lockstep:
+            launch_args = launch_args + ['lockstep:=true']
         super().__init__(node_name='rocket_league_agent', eval=eval, launch_file=launch_file, launch_args=launch_args,
-                         run_id=run_id)
-
-        # car action constants
-        self._MIN_VELOCITY = -rospy.get_param('/cars/throttle/max_speed')
-        self._MAX_VELOCITY = rospy.get_param('/cars/throttle/max_speed')
-        self._MIN_CURVATURE = -tan(rospy.get_param('/cars/steering/max_throw')) / rospy.get_param('cars/length')
-        self._MAX_CURVATURE = tan(rospy.get_param('/cars/steering/max_throw')) / rospy.get_param('cars/length')
-
-        # car action space overrides
-        if rospy.has_param('~action_space/velocity/min'):
-            min_velocity = rospy.get_param('~action_space/velocity/min')
-            assert min_velocity > self._MIN_VELOCITY
-            self._MIN_VELOCITY = min_velocity
-        if rospy.has_param('~action_space/velocity/max'):
-            max_velocity = rospy.get_param('~action_space/velocity/max')
-            assert max_velocity < self._MAX_VELOCITY
-            self._MAX_VELOCITY = max_velocity
-        if rospy.has_param('~action_space/curvature/min'):
-            min_curvature = rospy.get_param('~action_space/curvature/min')
-            assert min_curvature > self._MIN_CURVATURE
-            self._MIN_CURVATURE = min_curvature
-        if rospy.has_param('~action_space/curvature/max'):
-            max_curvature = rospy.get_param('~action_space/curvature/max')
-            assert max_curvature < self._MAX_CURVATURE
-            self._MAX_CURVATURE = max_curvature
-
-        # observations
-        self._FIELD_WIDTH = rospy.get_param('/field/width')
-        self._FIELD_LENGTH = rospy.get_param('/field/length')
-        self._GOAL_DEPTH = rospy.get_param('~observation/goal_depth', 0.075)
-        self._MAX_OBS_VEL = rospy.get_param('~observation/velocity/max_abs', 3.0)
-        self._MAX_OBS_ANG_VEL = rospy.get_param('~observation/angular_velocity/max_abs', 2 * pi)
-
-        # learning
-        self._MAX_TIME = rospy.get_param('~max_episode_time', 30.0)
-        self._CONSTANT_REWARD = rospy.get_param('~reward/constant', 0.0)
-        self._BALL_DISTANCE_REWARD = rospy.get_param('~reward/ball_dist_sq', 0.0)
-        self._GOAL_DISTANCE_REWARD = rospy.get_param('~reward/goal_dist_sq', 0.0)
-        self._WIN_REWARD = rospy.get_param('~reward/win', 100.0)
-        self._LOSS_REWARD = rospy.get_param('~reward/loss', 0.0)
-        self._REVERSE_REWARD = rospy.get_param('~reward/reverse', 0.0)
-        self._WALL_REWARD = rospy.get_param('~reward/walls/value', 0.0)
-        self._WALL_THRESHOLD = rospy.get_param('~reward/walls/threshold', 0.0)
+                         run_id=run_id, lockstep=lockstep, master_uri=master_uri)
+        self._LOCKSTEP = lockstep
+
+        # spaces, observation bounds, rewards, and commands, from the agent's private parameters
+        self._task = RocketLeagueTask(rospy.get_param('~'), {'field': rospy.get_param('/field'),
+                                                              'cars': rospy.get_param('/cars')})
+        self._MAX_TIME = self._task.MAX_TIME
 
         # publishers
         self._command_pub = rospy.Publisher('cars/car0/command', ControlCommand, queue_size=1)
         self._reset_srv = rospy.ServiceProxy('sim_reset', Empty)
+        self._reload_params_srv = rospy.ServiceProxy('sim_reload_params', Empty)
 
         # state variables
         self._car_odom = None
         self._ball_odom = None
         self._score = None
         self._start_time = None
+        self._state_time = None
+        self._raw = np.zeros((1, OBS_SIZE), dtype=np.float32)
 
-        # subscribers
-        rospy.Subscriber('cars/car0/odom', Odometry, self._car_odom_cb)
-        rospy.Subscriber('ball/odom', Odometry, self._ball_odom_cb)
-        rospy.Subscriber('match_status', MatchStatus, self._score_cb)
+        if lockstep:
+            # state comes back from the step service
+            rospy.wait_for_service('sim_step')
+            self._step_srv = rospy.ServiceProxy('sim_step', SimStep, persistent=True)
+        else:
+            # subscribers
+            rospy.Subscriber('cars/car0/odom', Odometry, self._car_odom_cb)
+            rospy.Subscriber('ball/odom', Odometry, self._ball_odom_cb)
+            rospy.Subscriber('match_status', MatchStatus, self._score_cb)
 
         # block until environment in ready
         if not eval:
@@ -118,7 +78,7 @@ class RocketLeagueInterface(ROSInterface):
     @property
     def action_space(self):
         """The Space object corresponding to valid actions."""
-        return Discrete(CarActions.SIZE)
+        return self._task.action_space
 
     @property
     def observation_space(self):
@@ -126,25 +86,20 @@ class RocketLeagueInterface(ROSInterface):
         The Space object corresponding to valid observations.
         @return: The lower and upper bound of the field.
         """
-        return Box(
-            # x, y, theta, v, omega (car)
-            # x, y, vx, vy (ball)
-            low=np.array([
-                -(self._FIELD_LENGTH / 2) - self._GOAL_DEPTH,
-                -self._FIELD_WIDTH / 2, -pi,
-                -self._MAX_OBS_VEL, -self._MAX_OBS_ANG_VEL,
-                -(self._FIELD_LENGTH / 2) - self._GOAL_DEPTH,
-                -self._FIELD_WIDTH / 2,
-                -self._MAX_OBS_VEL, -self._MAX_OBS_VEL],
-                dtype=np.float32),
-            high=np.array([
-                (self._FIELD_LENGTH / 2) + self._GOAL_DEPTH,
-                self._FIELD_WIDTH / 2, pi,
-                self._MAX_OBS_VEL, self._MAX_OBS_ANG_VEL,
-                (self._FIELD_LENGTH / 2) + self._GOAL_DEPTH,
-                self._FIELD_WIDTH / 2,
-                self._MAX_OBS_VEL, self._MAX_OBS_VEL],
-                dtype=np.float32))
+        return self._task.observation_space
+
+    def seed(self, seed=None):
+        """
+        Re-seeds the simulator (see its ~seed parameter), used from the next reset.
+        @param seed: The seed (None for unseeded).
+        """
+        if seed is None:
+            if rospy.has_param('simulator/seed'):
+                rospy.delete_param('simulator/seed')
+        else:
+            rospy.set_param('simulator/seed', int(seed))
+        self._reload_params_srv.call()
+        return [seed]
 
     def _reset_env(self):
         """Reset environment for a new training episode."""
@@ -176,89 +131,91 @@ class RocketLeagueInterface(ROSInterface):
         assert self._has_state()
 
         # combine the car and ball odoms for observation
-        car = np.asarray(self._car_odom, dtype=np.float32)
-        ball = np.asarray(self._ball_odom, dtype=np.float32)
-        observation = np.concatenate((car, ball))
+        self._raw[0, :5] = self._car_odom
+        self._raw[0, 5:] = self._ball_odom
 
         # ensure the observation fits within the the limits
-        if not self.observation_space.contains(observation):
+        observation, clipped = self._task.observe(self._raw)
+        if clipped:
             rospy.logwarn_throttle(5, "Coercing observation into valid bounds")
-            np.clip(
-                observation,
-                self.observation_space.low,
-                self.observation_space.high,
-                out=observation)
 
         # check if time has exceeded
+        now = self._state_time if self._LOCKSTEP else rospy.Time.now()
         if self._start_time is None:
-            self._start_time = rospy.Time.now()
-        done = (rospy.Time.now() - self._start_time).to_sec() >= self._MAX_TIME
+            self._start_time = now
+        done = (now - self._start_time).to_sec() >= self._MAX_TIME
 
-        # determine the reward
-        reward = self._CONSTANT_REWARD
+        # determine the reward, and check if someone scored
+        reward, scored = self._task.reward(self._raw, (self._score,))
+        done = done or bool(scored[0])
 
-        ball_dist_sq = np.sum(np.square(ball[0:2] - car[0:2]))
-        reward += self._BALL_DISTANCE_REWARD * ball_dist_sq
-
-        goal_dist_sq = np.sum(np.square(ball[0:2] - np.array([self._FIELD_LENGTH / 2, 0])))
-        reward += self._GOAL_DISTANCE_REWARD * goal_dist_sq
-        # check if someone scored
-        if self._score != 0:
-            done = True
-            if self._score > 0:
-                reward += self._WIN_REWARD
-            else:
-                reward += self._LOSS_REWARD
-
-        x, y, __, v, __ = self._car_odom
-        if v < 0:
-            reward += self._REVERSE_REWARD
-        if (abs(x) > self._FIELD_LENGTH / 2 - self._WALL_THRESHOLD or
-                abs(y) > self._FIELD_WIDTH / 2 - self._WALL_THRESHOLD):
-            reward += self._WALL_REWARD
-
-        info = {'goals': self._score}
-
-        return (observation, reward, done, info)
+        return (observation[0], float(reward[0]), done, {'goals': self._score})
 
     def _publish_action(self, action):
         """
         Publish an action to the ROS network (using a message of action and curvature).
         @param action: The desired action.
+        """
+        self._command_pub.publish(self._get_command(action))
+
+    def _step_env(self, action):
+        """
+        Step the simulator with a single service call (lockstep mode).
+        @param action: The desired action, or None to keep the last one.
+        """
+        req = SimStepRequest()
+        if action is not None:
+            req.car_names = ['car0']
+            req.commands = [self._get_command(action)]
+        res = self._step_srv(req)
+
+        self._car_odom = self._car_odom_from_msg(res.car_odoms[res.car_names.index('car0')])
+        self._ball_odom = self._ball_odom_from_msg(res.ball_odom)
+        self._score = self._score_from_msg(res.status)
+        self._state_time = res.ball_odom.header.stamp
+
+    def _get_command(self, action):
+        """
+        Translate an action to a message of velocity and curvature.
+        @param action: The desired action.
         @return: Translated command in curvature and velocity.
         """
-        assert self.action_space.contains(action)
+        velocity, curvature = self._task.get_command(action)
 
         msg = ControlCommand()
         msg.header.stamp = rospy.Time.now()
-        # set msg velocity to max for Forward, Forward-Right, and Forward-Left movement
-        if (action == CarActions.FWD or
-                action == CarActions.FWD_RIGHT or
-                action == CarActions.FWD_LEFT):
-            msg.velocity = self._MAX_VELOCITY
-        elif (action == CarActions.REV or
-              action == CarActions.REV_RIGHT or
-              action == CarActions.REV_LEFT):
-            msg.velocity = self._MIN_VELOCITY
-        else:
-            msg.velocity = 0.0
-        # set msg velocity to min for Back, Back-Right, and Back-Left movement
-        if (action == CarActions.FWD_LEFT or
-                action == CarActions.REV_LEFT):
-            msg.curvature = self._MAX_CURVATURE
-        elif (action == CarActions.FWD_RIGHT or
-              action == CarActions.REV_RIGHT):
-            msg.curvature = self._MIN_CURVATURE
-        else:
-            msg.curvature = 0.0
+        msg.velocity = velocity
+        msg.curvature = curvature
 
-        self._command_pub.publish(msg)
+        return msg
 
     def _car_odom_cb(self, odom_msg):
         """Callback for odometry of car."""
+        self._car_odom = self._car_odom_from_msg(odom_msg)
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def _ball_odom_cb(self, odom_msg):
+        """Callback for odometry of ball."""
+        self._ball_odom = self._ball_odom_from_msg(odom_msg)
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def _score_cb(self, score_msg):
+        """Callback for score of game."""
+        self._score = self._score_from_msg(score_msg)
+
+        with self._cond:
+            self._cond.notify_all()
+
+    @staticmethod
+    def _car_odom_from_msg(odom_msg):
+        """Convert odometry of car to (x, y, yaw, v, omega)."""
         x = odom_msg.pose.pose.position.x
         y = odom_msg.pose.pose.position.y
-        yaw, __, __ = euler_from_quaternion((
+        __, __, yaw = euler_from_quaternion((
             odom_msg.pose.pose.orientation.x,
             odom_msg.pose.pose.orientation.y,
             odom_msg.pose.pose.orientation.z,
@@ -266,31 +223,24 @@ class RocketLeagueInterface(ROSInterface):
         v = odom_msg.twist.twist.linear.x
         omega = odom_msg.twist.twist.angular.z
 
-        self._car_odom = (x, y, yaw, v, omega)
-
-        with self._cond:
-            self._cond.notify_all()
-
-    def _ball_odom_cb(self, odom_msg):
-        """Callback for odometry of ball."""
+        return (x, y, yaw, v, omega)
 
+    @staticmethod
+    def _ball_odom_from_msg(odom_msg):
+        """Convert odometry of ball to (x, y, vx, vy)."""
         x = odom_msg.pose.pose.position.x
         y = odom_msg.pose.pose.position.y
         vx = odom_msg.twist.twist.linear.x
         vy = odom_msg.twist.twist.linear.y
 
-        self._ball_odom = (x, y, vx, vy)
+        return (x, y, vx, vy)
 
-        with self._cond:
-            self._cond.notify_all()
-
-    def _score_cb(self, score_msg):
-        """Callback for score of game."""
+    @staticmethod
+    def _score_from_msg(score_msg):
+        """Convert match status to 1 (win), -1 (loss), or 0 (ongoing)."""
         if score_msg.status == MatchStatus.VICTORY_TEAM_A:
-            self._score = 1
+            return 1
         elif score_msg.status == MatchStatus.VICTORY_TEAM_B:
-            self._score = -1
+            return -1
         else:
-            self._score = 0
-        with self._cond:
-            self._cond.notify_all()
+            return 0
@@ -0,0 +1,199 @@
+"""Multi-agent, self-play environment for the Rocket League project.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# Every car is an agent. Cars are split into team A (attacking the +x goal,
+# like the single agent environments) and team B. Team B's observations are
+# rotated half a turn about the center of the field, so each car sees the
+# field from its own side and one policy plays for both teams (actions need
+# no change, since a rotation keeps left and right). Each car observes itself
+# and the ball, the same as the single agent environments, so policies move
+# freely between them. One Sim step moves every car in every arena.
+
+# package
+from rktl_autonomy.rocket_league_direct_interface import RocketLeagueDirectInterface
+from rktl_autonomy.rocket_league_task import (CarActions, OBS_SIZE, CAR_X, CAR_Y, CAR_YAW,
+                                              BALL_X, BALL_Y, BALL_VX, BALL_VY)
+
+# System
+import numpy as np
+from math import pi
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+
+# columns that change sign when an observation is rotated half a turn
+_MIRRORED = [CAR_X, CAR_Y, BALL_X, BALL_Y, BALL_VX, BALL_VY]
+
+
+class RocketLeagueSelfPlayEnv(VecEnv):
+    """
+    Vectorized environment with one entry per agent car, over every arena of one
+    in-process Sim. Without an opponent pool, the policy being trained drives
+    every car (both teams). With one, it drives team A, and team B in each arena
+    is driven by an opponent sampled from the pool at the start of each episode.
+    Arenas end and reset independently, when a goal is scored or time runs out.
+    """
+
+    def __init__(self, team_size=1, num_arenas=1, opponents=None, config=None, sim_config=None,
+                 global_config=None, backend=None, seed=None):
+        """
+        Create the simulator and read all constants.
+        @param team_size: Cars per team.
+        @param num_arenas: Independent matches stepped together.
+        @param opponents: OpponentPool to drive team B (default=the trained policy drives both teams).
+        @param config: Agent config, equivalent to `rocket_league.yaml` (used if None).
+        @param sim_config: Simulator config, equivalent to `simulation.yaml` (used if None).
+        @param global_config: Field and car config, equivalent to `global_params.yaml` (used if None).
+        @param backend: Physics backend for the Sim (uses the simulator config if None).
+        @param seed: Seed for all randomness, in parameter ranges and the Sim (default=unseeded).
+        """
+        # builds the sim, the task, and the first car
+        self._env = RocketLeagueDirectInterface(config=config, sim_config=sim_config,
+                                                global_config=global_config, backend=backend,
+                                                seed=seed, num_arenas=num_arenas)
+        self._sim = self._env._sim
+        self._task = self._env._task
+        self._DELTA_T = self._env._DELTA_T
+        self._MAX_TIME = self._env._MAX_TIME
+        sim_config = self._env._sim_config
+
+        # team A, then team B
+        self._num_cars = 2 * team_size
+        for i in range(1, self._num_cars):
+            car_config = sim_config['cars'][i] if i < len(sim_config['cars']) else {}
+            self._sim.create_car('car', init_pose=car_config.get('init_pose', None),
+                                 car_props=self._env._get_car_properties())
+        self._num_arenas = num_arenas
+        self._team_size = team_size
+        self._opponents = opponents
+
+        # agents are numbered by arena, then car
+        n = num_arenas * self._num_cars
+        car = np.arange(n) % self._num_cars
+        self._arena = np.arange(n) // self._num_cars
+        self._team_b = car >= team_size
+        self._sign = np.where(self._team_b, -1, 1)
+        self._learners = np.arange(n) if opponents is None else np.flatnonzero(~self._team_b)
+        self._opponent_rows = np.flatnonzero(self._team_b) if opponents is not None else np.arange(0)
+        self._arena_opponents = [None] * num_arenas
+
+        # state variables
+        self._raw = np.zeros((n, OBS_SIZE), dtype=np.float32)
+        self._obs = np.zeros((n, OBS_SIZE), dtype=np.float32)
+        self._commands = np.zeros((num_arenas, self._num_cars, 2))
+        self._time = np.zeros(num_arenas)
+        self._actions = None
+
+        super().__init__(len(self._learners), self._task.observation_space, self._task.action_space)
+
+    def reset(self):
+        """
+        Resets every arena to a new random initial state.
+        @return: the initial observations of the agents.
+        """
+        self._reset_arenas(range(self._num_arenas))
+        self._observe()
+        return self._obs[self._learners].copy()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(-1)
+
+    def step_wait(self):
+        """
+        Applies the agents' (and opponents') actions, then advances every arena by one timestep.
+        @return: (observations, rewards, dones, infos) of the agents.
+        """
+        commands = self._commands.reshape(-1, 2)
+        commands[self._learners] = self._task.get_command(self._actions)
+        if self._opponents is not None:
+            commands[self._opponent_rows] = self._task.get_command(self._opponent_actions())
+        self._sim.set_car_commands(self._commands)
+        self._sim.step(self._DELTA_T)
+        self._time += self._DELTA_T
+
+        score = self._observe()
+        reward, _ = self._task.reward(self._raw, score)
+        # every car on a team gets the team's mean reward
+        team = self._arena * 2 + self._team_b
+        reward = (np.bincount(team, reward, minlength=2 * self._num_arenas) /
+                  np.bincount(team, minlength=2 * self._num_arenas))[team]
+        done = (self._time >= self._MAX_TIME) | np.asarray(self._sim.arena_scored[:self._num_arenas], dtype=bool)
+
+        infos = [{'goals': int(score[i])} for i in self._learners]
+        if done.any():
+            terminal = self._obs[self._learners].copy()
+            self._reset_arenas(np.flatnonzero(done))
+            self._observe()
+            for info, i, row in zip(infos, self._learners, terminal):
+                if done[self._arena[i]]:
+                    info['terminal_observation'] = row
+
+        return (self._obs[self._learners].copy(), reward[self._learners].astype(np.float32),
+                done[self._arena[self._learners]], infos)
+
+    def seed(self, seed=None):
+        """Re-seeds parameter ranges and the simulator's random streams."""
+        self._env.seed(seed)
+        return [seed] * self.num_envs
+
+    def close(self):
+        """Disconnect from the physics server and remove generated files."""
+        self._env.close()
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+    def _reset_arenas(self, arenas):
+        """Resets some arenas, and picks their next opponents."""
+        for arena in arenas:
+            self._sim.reset(self._env._get_spawn_bounds(), self._env._get_car_properties(), None, None,
+                            arena=arena)
+            self._time[arena] = 0.0
+            if self._opponents is not None:
+                self._arena_opponents[arena] = self._opponents.sample()
+
+    def _opponent_actions(self):
+        """Actions of team B, from each arena's opponent (cars stop if there is none)."""
+        actions = np.full(len(self._opponent_rows), int(CarActions.STOP))
+        arenas = self._arena[self._opponent_rows]
+        # one prediction per distinct opponent, over all the arenas it plays in
+        for opponent in {id(o): o for o in self._arena_opponents if o is not None}.values():
+            mask = np.array([self._arena_opponents[a] is opponent for a in arenas])
+            actions[mask], _ = opponent.predict(self._obs[self._opponent_rows[mask]], deterministic=False)
+        return actions
+
+    def _observe(self):
+        """
+        Reads every arena into raw observations (in each car's team frame) and observations.
+        @return: (n,) score of each car's team: 1 (win), -1 (loss), or 0 (ongoing).
+        """
+        raw = self._raw.reshape(self._num_arenas, self._num_cars, OBS_SIZE)
+        score = np.zeros(self._num_arenas)
+        for arena in range(self._num_arenas):
+            # cars, then the ball
+            bodies = self._sim.get_state_array(arena=arena)
+            raw[arena, :, :5] = bodies[:self._num_cars, RocketLeagueDirectInterface._CAR_COLUMNS]
+            raw[arena, :, 5:] = bodies[-1, RocketLeagueDirectInterface._BALL_COLUMNS]
+            if self._sim.arena_scored[arena]:
+                score[arena] = 1 if self._sim.arena_winner[arena] == "A" else -1
+
+        # rotate team B's view half a turn
+        team_b = self._raw[self._team_b]
+        team_b[:, _MIRRORED] *= -1
+        team_b[:, CAR_YAW] = np.where(team_b[:, CAR_YAW] > 0, team_b[:, CAR_YAW] - pi, team_b[:, CAR_YAW] + pi)
+        self._raw[self._team_b] = team_b
+
+        self._task.observe(self._raw, out=self._obs)
+        return score[self._arena] * self._sign
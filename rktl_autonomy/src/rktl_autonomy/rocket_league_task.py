@@ -0,0 +1,174 @@
+"""Observations, rewards, and actions of the Rocket League project, shared by its environments.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# The task works on batches: raw observations are (n, 9) arrays of
+# x, y, yaw, v, omega (car) and x, y, vx, vy (ball), one row per env. A single
+# env passes a batch of one. Spaces, bounds, and the command of every action are
+# built once, so a step only does a few array operations.
+
+from gym.spaces import Box, Discrete
+
+# System
+import numpy as np
+from enum import IntEnum, unique, auto
+from math import pi, tan
+
+# columns of an observation
+CAR_X, CAR_Y, CAR_YAW, CAR_V, CAR_OMEGA, BALL_X, BALL_Y, BALL_VX, BALL_VY = range(9)
+OBS_SIZE = 9
+
+
+@unique
+class CarActions(IntEnum):
+    """
+    Possible actions for car.
+    Currently using discrete action space.
+    """
+    STOP = 0
+    FWD_LEFT = auto()
+    FWD_RIGHT = auto()
+    FWD = auto()
+    REV_LEFT = auto()
+    REV_RIGHT = auto()
+    REV = auto()
+    SIZE = auto()
+
+
+class RocketLeagueTask(object):
+    """Spaces, observation bounds, reward shaping, and action commands of the Rocket League."""
+
+    def __init__(self, config, global_config):
+        """
+        Read all constants.
+        @param config: Agent config, in the format of `rocket_league.yaml` (ex: the agent's private parameters).
+        @param global_config: Dict with the field parameters under 'field' and the car parameters under 'cars'.
+        """
+        field = global_config['field']
+        cars = global_config['cars']
+
+        # car action constants
+        self.MIN_VELOCITY = -cars['throttle']['max_speed']
+        self.MAX_VELOCITY = cars['throttle']['max_speed']
+        self.MIN_CURVATURE = -tan(cars['steering']['max_throw']) / cars['length']
+        self.MAX_CURVATURE = tan(cars['steering']['max_throw']) / cars['length']
+
+        # car action space overrides
+        action_space = config.get('action_space', {})
+        if 'min' in action_space.get('velocity', {}):
+            min_velocity = action_space['velocity']['min']
+            assert min_velocity > self.MIN_VELOCITY
+            self.MIN_VELOCITY = min_velocity
+        if 'max' in action_space.get('velocity', {}):
+            max_velocity = action_space['velocity']['max']
+            assert max_velocity < self.MAX_VELOCITY
+            self.MAX_VELOCITY = max_velocity
+        if 'min' in action_space.get('curvature', {}):
+            min_curvature = action_space['curvature']['min']
+            assert min_curvature > self.MIN_CURVATURE
+            self.MIN_CURVATURE = min_curvature
+        if 'max' in action_space.get('curvature', {}):
+            max_curvature = action_space['curvature']['max']
+            assert max_curvature < self.MAX_CURVATURE
+            self.MAX_CURVATURE = max_curvature
+
+        # observations
+        observation = config.get('observation', {})
+        self.FIELD_WIDTH = field['width']
+        self.FIELD_LENGTH = field['length']
+        self.GOAL_DEPTH = observation.get('goal_depth', 0.075)
+        self.MAX_OBS_VEL = observation.get('velocity', {}).get('max_abs', 3.0)
+        self.MAX_OBS_ANG_VEL = observation.get('angular_velocity', {}).get('max_abs', 2 * pi)
+
+        # learning
+        reward = config.get('reward', {})
+        self.MAX_TIME = config.get('max_episode_time', 30.0)
+        self.CONSTANT_REWARD = reward.get('constant', 0.0)
+        self.BALL_DISTANCE_REWARD = reward.get('ball_dist_sq', 0.0)
+        self.GOAL_DISTANCE_REWARD = reward.get('goal_dist_sq', 0.0)
+        self.WIN_REWARD = reward.get('win', 100.0)
+        self.LOSS_REWARD = reward.get('loss', 0.0)
+        self.REVERSE_REWARD = reward.get('reverse', 0.0)
+        self.WALL_REWARD = reward.get('walls', {}).get('value', 0.0)
+        self.WALL_THRESHOLD = reward.get('walls', {}).get('threshold', 0.0)
+
+        # spaces
+        self.action_space = Discrete(CarActions.SIZE)
+        self.observation_space = Box(
+            # x, y, theta, v, omega (car)
+            # x, y, vx, vy (ball)
+            low=np.array([
+                -(self.FIELD_LENGTH / 2) - self.GOAL_DEPTH,
+                -self.FIELD_WIDTH / 2, -pi,
+                -self.MAX_OBS_VEL, -self.MAX_OBS_ANG_VEL,
+                -(self.FIELD_LENGTH / 2) - self.GOAL_DEPTH,
+                -self.FIELD_WIDTH / 2,
+                -self.MAX_OBS_VEL, -self.MAX_OBS_VEL],
+                dtype=np.float32),
+            high=np.array([
+                (self.FIELD_LENGTH / 2) + self.GOAL_DEPTH,
+                self.FIELD_WIDTH / 2, pi,
+                self.MAX_OBS_VEL, self.MAX_OBS_ANG_VEL,
+                (self.FIELD_LENGTH / 2) + self.GOAL_DEPTH,
+                self.FIELD_WIDTH / 2,
+                self.MAX_OBS_VEL, self.MAX_OBS_VEL],
+                dtype=np.float32))
+        self._low = self.observation_space.low
+        self._high = self.observation_space.high
+        self._goal = np.array([self.FIELD_LENGTH / 2, 0.0])
+        # distance from the center past which the car is near a wall
+        self._wall = np.array([self.FIELD_LENGTH / 2 - self.WALL_THRESHOLD,
+                               self.FIELD_WIDTH / 2 - self.WALL_THRESHOLD])
+
+        # (velocity, curvature) of each action
+        self.commands = np.zeros((CarActions.SIZE, 2))
+        # set velocity to max for Forward, Forward-Right, and Forward-Left movement
+        self.commands[[CarActions.FWD, CarActions.FWD_RIGHT, CarActions.FWD_LEFT], 0] = self.MAX_VELOCITY
+        # set velocity to min for Back, Back-Right, and Back-Left movement
+        self.commands[[CarActions.REV, CarActions.REV_RIGHT, CarActions.REV_LEFT], 0] = self.MIN_VELOCITY
+        self.commands[[CarActions.FWD_LEFT, CarActions.REV_LEFT], 1] = self.MAX_CURVATURE
+        self.commands[[CarActions.FWD_RIGHT, CarActions.REV_RIGHT], 1] = self.MIN_CURVATURE
+
+    def observe(self, raw, out=None):
+        """
+        Coerces raw observations into the observation space.
+        @param raw: (n, 9) float32 array of raw observations.
+        @param out: Array to write the observations to (default=new array).
+        @return: Tuple of the (n, 9) observations, and whether any value was out of bounds.
+        """
+        out = np.clip(raw, self._low, self._high, out=out)
+        # clipping leaves observations in bounds unchanged (NaN is never equal, so counts as out of bounds)
+        return out, not np.array_equal(out, raw)
+
+    def reward(self, raw, score):
+        """
+        Computes the rewards of a step, from the raw (not clipped) observations.
+        @param raw: (n, 9) array of raw observations.
+        @param score: (n,) array of 1 (win), -1 (loss), or 0 (ongoing).
+        @return: Tuple of the (n,) rewards, and (n,) whether an episode ended by scoring.
+        """
+        car = raw[:, CAR_X:CAR_Y + 1]
+        ball = raw[:, BALL_X:BALL_Y + 1]
+        reward = np.full(len(raw), self.CONSTANT_REWARD, dtype=np.float64)
+        reward += self.BALL_DISTANCE_REWARD * np.sum(np.square(ball - car), axis=1)
+        reward += self.GOAL_DISTANCE_REWARD * np.sum(np.square(ball - self._goal), axis=1)
+
+        # check if someone scored
+        score = np.asarray(score)
+        reward += np.where(score > 0, self.WIN_REWARD, np.where(score < 0, self.LOSS_REWARD, 0.0))
+
+        reward += self.REVERSE_REWARD * (raw[:, CAR_V] < 0)
+        reward += self.WALL_REWARD * np.any(np.abs(car) > self._wall, axis=1)
+        return reward, score != 0
+
+    def get_command(self, action):
+        """
+        Translates actions to commands.
+        @param action: Action, or (n,) array of actions.
+        @return: (velocity, curvature), or (n, 2) array of them.
+        """
+        assert np.all((action >= 0) & (action < CarActions.SIZE))
+        return self.commands[action]
@@ -0,0 +1,243 @@
+"""Contains the SharedMemoryVecEnv class, a vectorized environment that runs
+each environment in its own process and exchanges observations and actions
+through shared memory.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from gym.spaces import Box, Discrete
+from stable_baselines3.common.env_util import is_wrapped
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, CloudpickleWrapper
+
+
+class _SharedBuffers(object):
+    """
+    Fixed-layout numpy views into one shared memory block:
+        observations: (ring, n_envs, *obs_shape) float32
+        rewards: (ring, n_envs) float32
+        dones: (ring, n_envs) bool
+        actions: (n_envs, *act_shape) float32
+    Each step is written to the next slot of the ring, so the observations
+    returned by the previous step are not overwritten while they are in use.
+    """
+
+    def __init__(self, n_envs, ring, obs_shape, act_shape, name=None):
+        """
+        @param n_envs: Number of environments.
+        @param ring: Number of slots in the ring.
+        @param obs_shape: Shape of one observation.
+        @param act_shape: Shape of one action.
+        @param name: Name of an existing block to attach to (None to create one).
+        """
+        layout = [
+            ('observations', (ring, n_envs) + tuple(obs_shape), np.float32),
+            ('rewards', (ring, n_envs), np.float32),
+            ('dones', (ring, n_envs), np.bool_),
+            ('actions', (n_envs,) + tuple(act_shape), np.float32),
+        ]
+        size = 0
+        offsets = []
+        for _, shape, dtype in layout:
+            size = -(-size // 8) * 8  # align to 8 bytes
+            offsets.append(size)
+            size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        if name is None:
+            self.shm = SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.shm = SharedMemory(name=name)
+        for (key, shape, dtype), offset in zip(layout, offsets):
+            setattr(self, key, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+
+    def close(self, unlink=False):
+        # views must be released before the block can be closed
+        del self.observations, self.rewards, self.dones, self.actions
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _worker(remote, parent_remote, env_fn_wrapper, index):
+    """Runs one environment, reading actions from and writing results to shared memory."""
+    parent_remote.close()
+    env = env_fn_wrapper.var()
+    buffers = None
+    discrete = isinstance(env.action_space, Discrete)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                action = buffers.actions[index]
+                if discrete:
+                    action = int(action[0])
+                observation, reward, done, info = env.step(action)
+                if done:
+                    info['terminal_observation'] = observation
+                    observation = env.reset()
+                buffers.observations[data, index] = observation
+                buffers.rewards[data, index] = reward
+                buffers.dones[data, index] = done
+                # only small info dicts go through the pipe
+                remote.send(info if info else None)
+            elif cmd == 'reset':
+                buffers.observations[data, index] = env.reset()
+                remote.send(None)
+            elif cmd == 'close':
+                env.close()
+                remote.send(None)
+                break
+            elif cmd == 'get_spaces':
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == 'attach':
+                buffers = _SharedBuffers(*data)
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send(env.seed(data))
+            elif cmd == 'get_attr':
+                remote.send(getattr(env, data))
+            elif cmd == 'set_attr':
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == 'env_method':
+                method = getattr(env, data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == 'is_wrapped':
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f'`{cmd}` is not implemented in the worker')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if buffers is not None:
+            buffers.close()
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Drop-in replacement for SubprocVecEnv, for environments with a Box
+    observation space and a Discrete or Box action space.
+
+    Observations, rewards, dones, and actions are never pickled. Each worker
+    writes its results straight into a shared memory slot, and step_wait
+    returns a view of all environments' observations as one array. Only a
+    short command and the (usually empty) info dict go through the pipes.
+    """
+
+    def __init__(self, env_fns, start_method=None, ring=2):
+        """
+        @param env_fns: List of functions that create the environments.
+        @param start_method: Multiprocessing start method (default=forkserver if available, else spawn).
+        @param ring: Number of observation slots. Observations returned by a step
+            stay valid for ring - 1 further steps.
+        """
+        self.closed = False
+        self.waiting = False
+        n_envs = len(env_fns)
+
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), index)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        # size the shared memory from the spaces, then hand it to the workers
+        self.remotes[0].send(('get_spaces', None))
+        observation_space, action_space = self.remotes[0].recv()
+        assert isinstance(observation_space, Box)
+        assert isinstance(action_space, (Box, Discrete))
+        act_shape = (1,) if isinstance(action_space, Discrete) else action_space.shape
+
+        self._ring = ring
+        self._slot = 0
+        self._buffers = _SharedBuffers(n_envs, ring, observation_space.shape, act_shape)
+        buffer_args = (n_envs, ring, observation_space.shape, act_shape, self._buffers.shm.name)
+        for remote in self.remotes:
+            remote.send(('attach', buffer_args))
+        for remote in self.remotes:
+            remote.recv()
+
+        super().__init__(n_envs, observation_space, action_space)
+
+    def step_async(self, actions):
+        self._buffers.actions[...] = np.reshape(actions, self._buffers.actions.shape)
+        self._slot = (self._slot + 1) % self._ring
+        for remote in self.remotes:
+            remote.send(('step', self._slot))
+        self.waiting = True
+
+    def step_wait(self):
+        infos = [remote.recv() or {} for remote in self.remotes]
+        self.waiting = False
+        return (self._buffers.observations[self._slot],
+                self._buffers.rewards[self._slot].copy(),
+                self._buffers.dones[self._slot].copy(),
+                infos)
+
+    def reset(self):
+        self._slot = (self._slot + 1) % self._ring
+        for remote in self.remotes:
+            remote.send(('reset', self._slot))
+        for remote in self.remotes:
+            remote.recv()
+        return self._buffers.observations[self._slot]
+
+    def seed(self, seed=None):
+        for index, remote in enumerate(self.remotes):
+            remote.send(('seed', None if seed is None else seed + index))
+        return [remote.recv() for remote in self.remotes]
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for remote in self.remotes:
+            remote.recv()
+        for process in self.processes:
+            process.join()
+        self._buffers.close(unlink=True)
+        self.closed = True
+
+    def get_attr(self, attr_name, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('get_attr', attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('set_attr', (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('env_method', (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(('is_wrapped', wrapper_class))
+        return [remote.recv() for remote in target_remotes]
+
+    def _get_target_remotes(self, indices):
+        return [self.remotes[i] for i in self._get_indices(indices)]
@@ -31,8 +31,9 @@ class SnakeActions(IntEnum):
 
 class SnakeInterface(ROSInterface):
     """ROS interface for the snake game."""
-    def __init__(self, eval=False, launch_file=['rktl_autonomy', 'snake_train.launch'], launch_args=[], run_id=None):
-        super().__init__(node_name='snake_agent', eval=eval, launch_file=launch_file, launch_args=launch_args, run_id=run_id)
+    def __init__(self, eval=False, launch_file=['rktl_autonomy', 'snake_train.launch'], launch_args=[], run_id=None, master_uri=None):
+        super().__init__(node_name='snake_agent', eval=eval, launch_file=launch_file, launch_args=launch_args, run_id=run_id,
+                         master_uri=master_uri)
 
         # Constants
         self._NUM_SEGMENTS = rospy.get_param('~num_segments', 7)
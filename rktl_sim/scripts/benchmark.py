@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Benchmark the simulator, without ROS.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# Times Sim.step, Sim.reset, state queries, and Car.step across car counts, step
+# sizes, and car modes, and writes the results as JSON. Pass --compare with an
+# earlier output to print how much each benchmark sped up or slowed down:
+#   rosrun rktl_sim benchmark.py --output before.json
+#   (make changes)
+#   rosrun rktl_sim benchmark.py --output after.json --compare before.json
+
+# 3rd party modules
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pybullet
+import yaml
+
+# local libraries
+from simulator import Sim
+
+PKG_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+# car commands in each mode: efforts (throttle, steering) or ideal (velocity, curvature)
+MODES = {'realistic': True, 'ideal': False}
+COMMANDS = {'realistic': (0.5, 0.3), 'ideal': (1.0, 1.0)}
+
+
+def time_calls(func, iterations, warmup):
+    """
+    Times repeated calls of a function.
+    @param func: Function without arguments.
+    @param iterations: Number of timed calls.
+    @param warmup: Number of calls to make first, untimed.
+    @return: Dict of calls per second and latency percentiles (microseconds).
+    """
+    for _ in range(warmup):
+        func()
+    latencies = np.zeros(iterations)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        latencies[i] = time.perf_counter_ns() - start
+    latencies /= 1000.0
+    return {
+        'iterations': iterations,
+        'per_second': 1e6 / np.mean(latencies),
+        'mean_us': np.mean(latencies),
+        'p50_us': np.percentile(latencies, 50),
+        'p99_us': np.percentile(latencies, 99),
+        'max_us': np.max(latencies),
+    }
+
+
+def trace_allocations(func, iterations):
+    """
+    Measures Python memory allocations of a function, in a separate pass from the
+    timing (tracing slows every allocation down).
+    @return: Dict of allocated bytes and memory blocks (net, left allocated) per call.
+    """
+    tracemalloc.start()
+    peak_bytes = 0
+    blocks = sys.getallocatedblocks()
+    for _ in range(iterations):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        peak_bytes += tracemalloc.get_traced_memory()[1] - before
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {
+        'peak_bytes_per_call': peak_bytes / iterations,
+        'net_blocks_per_call': blocks / iterations,
+    }
+
+
+class Benchmark(object):
+    """Builds sims for each configuration and runs the benchmarks on them."""
+
+    def __init__(self, args):
+        with open(args.sim_config) as file:
+            sim_config = yaml.safe_load(file)
+        with open(args.global_config) as file:
+            global_config = yaml.safe_load(file)
+        self.args = args
+        self.props = {
+            'engine': sim_config.get('engine'),
+            'dynamics': sim_config.get('dynamics'),
+            'stepping': sim_config.get('stepping'),
+        }
+        self.sensor_noise = sim_config.get('sensor_noise', {})
+        self.urdf_paths = {name: os.path.join(args.urdf_dir, f'{name}.urdf')
+                           for name in ('ball', 'car', 'goal_a', 'goal_b', 'walls', 'plane')}
+        for name, path in self.urdf_paths.items():
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f'{path} not found, generate the field URDFs with build_xacro.sh '
+                                        f'or pass --urdf-dir')
+
+        spawn_height = sim_config.get('spawn_height', 0.06)
+        field = global_config['field']
+        fl, fw, wt = field['length'], field['width'], field['wall_thickness']
+        self.spawn_bounds = [[-(fl / 2) + (2 * wt), (fl / 2) - (2 * wt)],
+                             [-(fw / 2) + (2 * wt), (fw / 2) - (2 * wt)],
+                             [spawn_height, spawn_height]]
+        cars = global_config['cars']
+        self.car_properties = {'length': cars['length'],
+                               'max_speed': cars['throttle']['max_speed'],
+                               'steering_throw': cars['steering']['max_throw'],
+                               'throttle_tau': cars['throttle']['tau'],
+                               'steering_rate': cars['steering']['rate']}
+        self.results = []
+
+    def make_sim(self, num_cars, mode):
+        """Creates a sim with a ball and some cars, all sending a fixed command."""
+        car_properties = dict(self.car_properties, simulate_effort=MODES[mode])
+        sim = Sim(self.props, self.urdf_paths, self.spawn_bounds, False,
+                  backend=self.args.backend, seed=self.args.seed)
+        sim.create_ball('ball', init_speed=1.0, noise=self.sensor_noise.get('ball'))
+        for _ in range(num_cars):
+            car_id = sim.create_car('car', noise=self.sensor_noise.get('car'), car_props=car_properties)
+            sim.set_car_command(car_id, COMMANDS[mode])
+        sim.reset(self.spawn_bounds, car_properties, None, 1.0)
+        return sim, car_properties
+
+    def add(self, name, func, iterations, **config):
+        """Times a function, and adds the result."""
+        result = {'name': name, 'backend': self.args.backend}
+        result.update(config)
+        result.update(time_calls(func, iterations, self.args.warmup))
+        if not self.args.no_alloc:
+            result.update(trace_allocations(func, min(iterations, self.args.alloc_iterations)))
+        self.results.append(result)
+        print(f"{name:<12} {describe(config):<36} {result['per_second']:>10.1f}/s  "
+              f"p50 {result['p50_us']:>9.1f} us  p99 {result['p99_us']:>9.1f} us", file=sys.stderr)
+
+    def run(self):
+        args = self.args
+        for mode in args.modes:
+            for num_cars in args.cars:
+                sim, car_properties = self.make_sim(num_cars, mode)
+                for dt in args.dt:
+                    self.add('sim_step', lambda: sim.step(dt), args.iterations,
+                             cars=num_cars, mode=mode, dt=dt)
+                self.add('sim_reset', lambda: sim.reset(self.spawn_bounds, car_properties, None, 1.0),
+                         args.iterations, cars=num_cars, mode=mode)
+                self.add('state', lambda: sim.get_state_array(), args.iterations,
+                         cars=num_cars, mode=mode)
+                self.add('state_noisy', lambda: sim.get_state_array(add_noise=True), args.iterations,
+                         cars=num_cars, mode=mode)
+                # Car.step is the kinematic update of one car in a physics substep (PyBullet backend only)
+                if num_cars == args.cars[0] and args.backend == 'pybullet':
+                    car = next(iter(sim._cars.values()))
+                    time_step = sim._engine_time_step
+                    self.add('car_step', lambda: car.step(time_step), args.iterations * 10,
+                             mode=mode, dt=time_step)
+                sim.close()
+
+
+def describe(config):
+    return ' '.join(f'{key}={value}' for key, value in config.items())
+
+
+def get_metadata():
+    """Returns what the results depend on, besides the code being benchmarked."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PKG_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'argv': sys.argv[1:],
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pybullet': pybullet.getAPIVersion(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def get_key(result):
+    return tuple(sorted((key, value) for key, value in result.items()
+                        if key in ('name', 'backend', 'cars', 'mode', 'dt')))
+
+
+def compare(results, baseline_path):
+    """Prints the change in calls per second of each benchmark, relative to an earlier output."""
+    with open(baseline_path) as file:
+        baseline = {get_key(result): result for result in json.load(file)['results']}
+    for result in results:
+        old = baseline.get(get_key(result))
+        if old is None:
+            continue
+        change = result['per_second'] / old['per_second'] - 1.0
+        config = describe({key: value for key, value in result.items() if key in ('cars', 'mode', 'dt')})
+        print(f"{result['name']:<12} {config:<36} {old['per_second']:>10.1f}/s -> "
+              f"{result['per_second']:>10.1f}/s ({change:+.1%})", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', default='pybullet', choices=['pybullet', 'planar'])
+    parser.add_argument('--cars', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='car counts to benchmark')
+    parser.add_argument('--dt', type=float, nargs='+', default=[0.1, 0.02],
+                        help='step sizes (seconds) to benchmark Sim.step with')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per benchmark')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed calls before each benchmark')
+    parser.add_argument('--alloc-iterations', type=int, default=50, help='calls to trace allocations over')
+    parser.add_argument('--no-alloc', action='store_true', help='skip tracing allocations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sim-config', default=os.path.join(PKG_DIR, 'config', 'simulation.yaml'))
+    parser.add_argument('--global-config',
+                        default=os.path.join(PKG_DIR, '..', 'rktl_launch', 'config', 'global_params.yaml'))
+    parser.add_argument('--urdf-dir', default=os.path.join(PKG_DIR, 'urdf'))
+    parser.add_argument('--output', help='JSON file to write (default=stdout)')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args)
+    benchmark.run()
+
+    output = {'metadata': get_metadata(), 'results': benchmark.results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        compare(benchmark.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
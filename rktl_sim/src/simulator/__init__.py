@@ -30,5 +30,8 @@ License:
 
 from simulator.sim import Sim
 from simulator.car import Car
+from simulator.dynamics import CarBatch
+from simulator.planar import PlanarSim
+from simulator.recording import Recorder, Replay
 
-__all__ = ['Sim', 'Car',]
\ No newline at end of file
+__all__ = ['Sim', 'Car', 'CarBatch', 'PlanarSim', 'Recorder', 'Replay',]
\ No newline at end of file
@@ -7,9 +7,14 @@ License:
 
 # 3rd party modules
 import pybullet as p
+import logging
 import math
 import numpy as np
 
+# Local modules
+from simulator.rng import NoiseBuffer
+from simulator import telemetry
+
 # locations used for accessing car position and orientation
 JOINT_IDS = (1, 0, 2)  # X, Y, W
 BASE_QUATERNION = [0., 0., 0.]
@@ -18,8 +23,13 @@ BASE_QUATERNION = [0., 0., 0.]
 class Car(object):
     """Handles Car actions and instance based parameters."""
 
-    def __init__(self, car_id, pos, orient, car_properties):
-        """Sets instance-based properties for a car and generates instance-based properties for a sim run."""
+    def __init__(self, car_id, pos, orient, car_properties, origin=(0., 0., 0.), arena=0, noise_buffer=None):
+        """
+        Sets instance-based properties for a car and generates instance-based properties for a sim run.
+        @param origin: World position of the center of the arena the car is in.
+        @param arena: Index of the arena the car is in.
+        @param noise_buffer: NoiseBuffer to draw sensor noise from (default=unseeded).
+        """
         self._MAX_CURVATURE = None
         self._STEERING_RATE = None
         self._THROTTLE_TAU = None
@@ -33,6 +43,11 @@ class Car(object):
         self.id = car_id
         self.init_pos = None
         self.orient = None
+        self.origin = origin
+        self.arena = arena
+        if noise_buffer is None:
+            noise_buffer = NoiseBuffer(np.random.default_rng())
+        self._noise = noise_buffer
         self.simulate_effort = car_properties['simulate_effort']
         self.set_properties(car_properties)
 
@@ -57,19 +72,10 @@ class Car(object):
         @param dt: The duration of the car time step.
         """
         if self.cmd is None:
-            print("command is none")
+            # TODO: a car without a command should not move
+            telemetry.log_throttled(logging.WARNING, 'car_no_cmd', 5.0,
+                                    'car %d has no command, using (1.0, 1.0)', self.id)
             self.cmd = (1.0, 1.0)
-            
-
-        """
-        ====================================================
-        ====================================================
-        ====================================================
-        ====================================================
-        TODO: bug descritpion: the self.cmd is none.
-        this means that we cannot use any of the calculations, and therefore cannot update hte car
-        if the command is set, everything works
-        """
 
         _, orient = self.get_pose()
         theta = p.getEulerFromQuaternion(orient)[2]
@@ -121,31 +127,33 @@ class Car(object):
         @param noise: The sensor noise and if it is present (None=no noise).
         @return: The position and orientation of the car.
         """
-        pos = p.getLinkState(self.id, self.body_link_id)[0]
+        pos = np.subtract(p.getLinkState(self.id, self.body_link_id)[0], self.origin)
         heading = p.getJointState(self.id, self.joint_ids[2])[0]
         orient = (0.0, 0.0, heading)
         if noise:
-            if np.random.uniform() < noise['dropout']:
+            if self._noise.uniform() < noise['dropout']:
                 return None, None
             else:
-                pos = np.random.normal(pos, noise['pos'])
-                orient = np.random.normal(orient, noise['orient'])
-        print("position: pos:",pos, "quaternion",p.getQuaternionFromEuler(orient))
+                pos = self._noise.normal(pos, noise['pos'])
+                orient = self._noise.normal(orient, noise['orient'])
+        telemetry.count('car_pose')
         return pos, p.getQuaternionFromEuler(orient)
 
     def get_velocity(self):
-        """Returns the linear and angular velocity of the car."""
-
-        link_state = p.getLinkState(self.id, self.body_link_id, computeLinkVelocity=1)
-        orient = link_state[1]
-        linear, angular = link_state[6:8]
-        heading = p.getEulerFromQuaternion(orient)[2]
-        r_inv = np.array([[math.cos(heading), -math.sin(heading), 0.],
-                          [math.sin(heading), math.cos(heading), 0.],
-                          [0., 0., 1.]], dtype=np.float)
-        linear = r_inv @ linear
-        print("velocity: linear:",linear, "angular",angular)
-        return linear, angular
+        """Returns the linear (body frame) and angular velocity of the car."""
+        _, _, _, heading, x_dot, y_dot, omega = self.get_state()
+        linear = (math.cos(heading) * x_dot + math.sin(heading) * y_dot,
+                  -math.sin(heading) * x_dot + math.cos(heading) * y_dot, 0.0)
+        telemetry.count('car_velocity')
+        return linear, (0.0, 0.0, omega)
+
+    def get_state(self):
+        """
+        Returns the pose and world frame velocity of the car, read with one PyBullet call.
+        @return: Tuple of x, y, z, heading, x velocity, y velocity, and angular velocity.
+        """
+        (x, x_dot, _, _), (y, y_dot, _, _), (heading, omega, _, _) = p.getJointStates(self.id, self.joint_ids)
+        return x, y, self.init_pos[2], heading, x_dot, y_dot, omega
 
     def reset(self, pos, orient):
         """Resets the car state with the new pose and orient."""
@@ -155,8 +163,8 @@ class Car(object):
         self._v_rear = 0.0
         self._psi = 0.0
 
-        p.resetBasePositionAndOrientation(self.id, [0., 0., pos[2]], p.getQuaternionFromEuler(BASE_QUATERNION))
-        print("reseting car to new pose and orient")
+        p.resetBasePositionAndOrientation(self.id, [self.origin[0], self.origin[1], pos[2]], p.getQuaternionFromEuler(BASE_QUATERNION))
+        telemetry.logger.debug('resetting car %d to %s, %s', self.id, pos, orient)
         self.joint_ids = JOINT_IDS  # X, Y, W
         p.resetJointState(self.id, self.joint_ids[0], targetValue=pos[0])
         p.resetJointState(self.id, self.joint_ids[1], targetValue=pos[1])
@@ -164,15 +172,32 @@ class Car(object):
 
         self.cmd = None
 
-    def check_overlap(self, pos):
-        """
-        Returns whether the position will overlap with the current car.
-        @param pos: The position of the other object.
-        @return: Boolean if the positions overlap (true = overlap).
-        """
-        print("x",pos[0],"y",pos[1])
-        print("x1",self.init_pos[0],"y1",self.init_pos[1])
-        val =((pos[0] - self.init_pos[0]) * (pos[0] - self.init_pos[0])) + ((pos[1] - self.init_pos[1]) * (pos[1] - self.init_pos[1]))
-        print(val)
-        dist = math.sqrt(val)
-        return dist < self._LENGTH
+    def set_state(self, x, y, theta, v_rear=0.0, psi=0.0):
+        """Moves the car to a new pose and internal state, keeping its current command."""
+        self._v_rear = v_rear
+        self._psi = psi
+        p.resetJointState(self.id, self.joint_ids[0], targetValue=x)
+        p.resetJointState(self.id, self.joint_ids[1], targetValue=y)
+        p.resetJointState(self.id, self.joint_ids[2], targetValue=theta)
+
+    def get_internal_state(self):
+        """Returns the state of the car that is not stored in PyBullet."""
+        return {
+            'v_rear': self._v_rear,
+            'psi': self._psi,
+            'cmd': self.cmd,
+            'init_pos': self.init_pos,
+            'orient': self.orient,
+            'properties': (self._LENGTH, self._MAX_SPEED, self._THROTTLE_TAU,
+                           self._STEERING_THROW, self._STEERING_RATE, self._MAX_CURVATURE),
+        }
+
+    def set_internal_state(self, state):
+        """Restores state from get_internal_state."""
+        self._v_rear = state['v_rear']
+        self._psi = state['psi']
+        self.cmd = state['cmd']
+        self.init_pos = state['init_pos']
+        self.orient = state['orient']
+        (self._LENGTH, self._MAX_SPEED, self._THROTTLE_TAU,
+         self._STEERING_THROW, self._STEERING_RATE, self._MAX_CURVATURE) = state['properties']
@@ -0,0 +1,163 @@
+"""Contains the CarBatch class.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# 3rd party modules
+import numpy as np
+
+
+class CarBatch(object):
+    """
+    Kinematic model of many cars across many independent environments.
+    All state is stored as (num_envs, num_cars) arrays, so a single call to step
+    advances every car at once. The model is identical to Car.step: a bicycle
+    model with a first order throttle response and rate limited steering when
+    simulating effort, or direct velocity and curvature tracking otherwise.
+    """
+
+    def __init__(self, num_envs, num_cars, car_properties):
+        """
+        Allocates state for all cars, which start at the origin.
+        @param num_envs: Number of independent environments.
+        @param num_cars: Number of cars in each environment.
+        @param car_properties: Car config properties. Each value may be a scalar or
+            anything that broadcasts to (num_envs, num_cars).
+        """
+        self.shape = (num_envs, num_cars)
+
+        # state
+        self.x = np.zeros(self.shape)
+        self.y = np.zeros(self.shape)
+        self.theta = np.zeros(self.shape)
+        self.v_rear = np.zeros(self.shape)
+        self.psi = np.zeros(self.shape)
+
+        # commands, either (throttle, steering) or (velocity, curvature)
+        self.cmd = np.zeros(self.shape + (2,))
+
+        # outputs of the last step, in the world frame
+        self.x_dot = np.zeros(self.shape)
+        self.y_dot = np.zeros(self.shape)
+        self.omega = np.zeros(self.shape)
+
+        self.set_properties(car_properties)
+
+    def get_properties(self):
+        """Returns the car config properties, as (num_envs, num_cars) arrays."""
+        return {
+            'length': self._LENGTH,
+            'max_speed': self._MAX_SPEED,
+            'throttle_tau': self._THROTTLE_TAU,
+            'steering_throw': self._STEERING_THROW,
+            'steering_rate': self._STEERING_RATE,
+            'simulate_effort': self.simulate_effort,
+        }
+
+    def set_properties(self, car_properties, mask=None):
+        """
+        Sets car config properties, broadcasting them to all cars.
+        @param car_properties: Car config properties, as in the constructor.
+        @param mask: Boolean array of shape (num_envs, num_cars) selecting cars to change (default=all).
+        """
+        current = None if mask is None else self.get_properties()
+
+        def prop(key, dtype=float):
+            value = np.broadcast_to(np.asarray(car_properties[key], dtype=dtype), self.shape)
+            if mask is None:
+                return value
+            merged = np.array(current[key], dtype=dtype)
+            merged[mask] = value[mask]
+            return merged
+
+        self._LENGTH = prop('length')
+        self._MAX_SPEED = prop('max_speed')
+        self._THROTTLE_TAU = prop('throttle_tau')
+        self._STEERING_THROW = prop('steering_throw')
+        self._STEERING_RATE = prop('steering_rate')
+        self._MAX_CURVATURE = np.tan(self._STEERING_THROW) / self._LENGTH
+        self.simulate_effort = prop('simulate_effort', dtype=bool)
+
+    def set_commands(self, cmd):
+        """
+        Sets the command of all cars.
+        @param cmd: Array broadcastable to (num_envs, num_cars, 2).
+        """
+        self.cmd[...] = cmd
+
+    def reset(self, pos, orient, mask=None):
+        """
+        Resets the pose of cars and zeros their internal state.
+        @param pos: Array broadcastable to (num_envs, num_cars, 2 or 3).
+        @param orient: Array broadcastable to (num_envs, num_cars, 3).
+        @param mask: Boolean array of shape (num_envs, num_cars) selecting cars to reset (default=all).
+        """
+        if mask is None:
+            mask = np.ones(self.shape, dtype=bool)
+        pos = np.broadcast_to(pos, self.shape + np.shape(pos)[-1:])
+        orient = np.broadcast_to(orient, self.shape + (3,))
+
+        self.x[mask] = pos[..., 0][mask]
+        self.y[mask] = pos[..., 1][mask]
+        self.theta[mask] = orient[..., 2][mask]
+        self.v_rear[mask] = 0.0
+        self.psi[mask] = 0.0
+        self.cmd[mask] = 0.0
+
+    def update_velocities(self, dt):
+        """
+        Updates the internal state of each car and calculates its world frame velocity.
+        This mirrors Car.step, and is what would be handed to the physics engine.
+        @param dt: The duration of the time step.
+        """
+        # effort: transform control input to reference angles and velocities
+        v_rear_ref = self.cmd[..., 0] * self._MAX_SPEED
+        psi_ref = self.cmd[..., 1] * self._STEERING_THROW
+
+        # update rear wheel velocity using 1st order model
+        v_rear = (self.v_rear - v_rear_ref) * np.exp(-dt / self._THROTTLE_TAU) + v_rear_ref
+
+        # update steering angle using massless acceleration to a fixed rate
+        max_change = self._STEERING_RATE * dt
+        psi = self.psi + np.clip(psi_ref - self.psi, -max_change, max_change)
+
+        self.v_rear = np.where(self.simulate_effort, v_rear, self.v_rear)
+        self.psi = np.where(self.simulate_effort, psi, self.psi)
+
+        # effort: extrapolate future state using bicycle model
+        tan_psi = np.tan(self.psi)
+        beta = self.theta + np.arctan(tan_psi / 2.0)
+        speed = self.v_rear * np.sqrt(np.square(tan_psi) / 4.0 + 1.0)
+        effort_omega = self.v_rear * tan_psi / self._LENGTH
+
+        # command: track body velocity and curvature directly
+        body_vel = np.clip(self.cmd[..., 0], -self._MAX_SPEED, self._MAX_SPEED)
+        body_curve = np.clip(self.cmd[..., 1], -self._MAX_CURVATURE, self._MAX_CURVATURE)
+
+        self.x_dot = np.where(self.simulate_effort, speed * np.cos(beta), body_vel * np.cos(self.theta))
+        self.y_dot = np.where(self.simulate_effort, speed * np.sin(beta), body_vel * np.sin(self.theta))
+        self.omega = np.where(self.simulate_effort, effort_omega, body_vel * body_curve)
+
+    def step(self, dt, substeps=1):
+        """
+        Moves all cars forward in time.
+        @param dt: The total duration of the step.
+        @param substeps: Number of integration steps to split dt into.
+        """
+        sub_dt = dt / substeps
+        for _ in range(substeps):
+            self.update_velocities(sub_dt)
+            self.x += self.x_dot * sub_dt
+            self.y += self.y_dot * sub_dt
+            self.theta += self.omega * sub_dt
+
+    def get_pose(self):
+        """Returns (num_envs, num_cars, 3) array of x, y, and heading."""
+        return np.stack((self.x, self.y, self.theta), axis=-1)
+
+    def get_velocity(self):
+        """Returns (num_envs, num_cars, 2) array of body frame forward velocity and angular velocity."""
+        forward = self.x_dot * np.cos(self.theta) + self.y_dot * np.sin(self.theta)
+        return np.stack((forward, self.omega), axis=-1)
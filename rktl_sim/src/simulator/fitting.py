@@ -0,0 +1,247 @@
+"""Contains the Fitter class, for tuning sim parameters to match recorded runs.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# A recorded run is replayed open loop: the sim starts from the first recorded
+# car and ball poses, and the recorded efforts are applied as they come. The
+# error is the RMS distance between the simulated and recorded positions. The
+# Fitter searches for the parameters with the lowest error using the cross
+# entropy method: each generation samples a population of candidates from a
+# normal distribution (clipped to the bounds), replays every candidate in a pool
+# of worker processes (one Sim each, see Sim), and refits the distribution to
+# the best candidates.
+
+# 3rd party modules
+from collections import namedtuple
+import copy
+import math
+import multiprocessing
+import numpy as np
+
+# Local modules
+from simulator import state, telemetry
+
+# a recorded run, with times in seconds from the first car odometry
+# efforts is (n, 2) of throttle and steering, car_xy and ball_xy are (n, 2) positions
+Trajectory = namedtuple('Trajectory', ['car_init_pose', 'ball_init_pose', 'effort_times', 'efforts',
+                                       'car_times', 'car_xy', 'ball_times', 'ball_xy'])
+
+# what the Sim needs, besides the parameters being fit
+# effort_offset is how far ahead (seconds) of the sim time efforts are applied
+ReplaySetup = namedtuple('ReplaySetup', ['urdf_paths', 'spawn_bounds', 'rate', 'effort_offset', 'backend'])
+
+
+def car_properties(cars):
+    """
+    Returns the car properties used by Sim, from the /cars parameters.
+    @param cars: Dict of the /cars parameters.
+    """
+    return {'length': cars['length'],
+            'max_speed': cars['throttle']['max_speed'],
+            'steering_throw': cars['steering']['max_throw'],
+            'throttle_tau': cars['throttle']['tau'],
+            'steering_rate': cars['steering']['rate'],
+            'simulate_effort': True}
+
+
+def get_value(config, path):
+    """Returns the value at a '/' separated path of nested dicts."""
+    for key in path.split('/'):
+        config = config[key]
+    return config
+
+
+def with_values(config, values):
+    """
+    Returns a copy of nested dicts with some values replaced.
+    @param config: The nested dicts.
+    @param values: Dict of '/' separated path to new value.
+    """
+    config = copy.deepcopy(config)
+    for path, value in values.items():
+        *parents, key = path.split('/')
+        node = config
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[key] = value
+    return config
+
+
+def replay_error(setup, config, trajectory, ball_weight=1.0):
+    """
+    Replays a recorded run in a new Sim.
+    @param setup: The ReplaySetup.
+    @param config: Dict with the simulation parameters under 'sim' and the /cars parameters under 'cars'.
+    @param trajectory: The Trajectory to replay.
+    @param ball_weight: Weight of the ball error, relative to the car error.
+    @return: Tuple of the weighted RMS position error, the car RMS error, and the ball RMS error (meters).
+    """
+    # imported here so the parent process of a worker pool never connects to PyBullet
+    from simulator.sim import Sim
+
+    sim_config = config['sim']
+    props = {
+        'engine': sim_config.get('engine'),
+        'dynamics': sim_config.get('dynamics'),
+        'stepping': sim_config.get('stepping'),
+    }
+    car_props = car_properties(config['cars'])
+    sim = Sim(props, setup.urdf_paths, setup.spawn_bounds, False, backend=setup.backend)
+    try:
+        sim.create_ball('ball', init_pose=trajectory.ball_init_pose, init_speed=0.0)
+        car_id = sim.create_car('car', init_pose=trajectory.car_init_pose, car_props=car_props)
+        sim.reset(setup.spawn_bounds, car_props, trajectory.ball_init_pose, 0.0)
+        car_row = sim.car_ids.index(car_id)
+
+        delta_t = 1.0 / setup.rate
+        end = max(trajectory.car_times[-1], trajectory.ball_times[-1])
+        steps = int(math.ceil(end / delta_t))
+        times = np.arange(steps + 1) * delta_t
+        # index of the latest effort at or before each step (plus the offset), -1 before the first
+        effort_index = np.searchsorted(trajectory.effort_times, times + setup.effort_offset, side='right') - 1
+
+        car_xy = np.zeros((steps + 1, 2))
+        ball_xy = np.zeros((steps + 1, 2))
+        bodies = sim.get_state_array()
+        car_xy[0] = bodies[car_row, state.X:state.Y + 1]
+        ball_xy[0] = bodies[-1, state.X:state.Y + 1]
+        for k in range(steps):
+            # the car holds still until the first effort
+            effort = trajectory.efforts[effort_index[k]] if effort_index[k] >= 0 else (0.0, 0.0)
+            sim.set_car_command(car_id, effort)
+            sim.step(delta_t)
+            bodies = sim.get_state_array(out=bodies)
+            car_xy[k + 1] = bodies[car_row, state.X:state.Y + 1]
+            ball_xy[k + 1] = bodies[-1, state.X:state.Y + 1]
+    finally:
+        sim.close()
+
+    car_error = _rms_error(times, car_xy, trajectory.car_times, trajectory.car_xy)
+    ball_error = _rms_error(times, ball_xy, trajectory.ball_times, trajectory.ball_xy)
+    total = math.sqrt((car_error ** 2 + ball_weight * ball_error ** 2) / (1.0 + ball_weight))
+    if not np.isfinite(total):
+        total = math.inf
+    return total, car_error, ball_error
+
+
+def _rms_error(sim_times, sim_xy, times, xy):
+    """RMS distance between recorded positions and the sim positions interpolated to the same times."""
+    if len(times) == 0:
+        return 0.0
+    x = np.interp(times, sim_times, sim_xy[:, 0])
+    y = np.interp(times, sim_times, sim_xy[:, 1])
+    return math.sqrt(np.mean((x - xy[:, 0]) ** 2 + (y - xy[:, 1]) ** 2))
+
+
+# replay inputs of a worker process, sent once when the worker starts
+_worker_args = None
+
+
+def _init_worker(setup, config, trajectory, ball_weight):
+    global _worker_args
+    _worker_args = (setup, config, trajectory, ball_weight)
+
+
+def _evaluate(values):
+    setup, config, trajectory, ball_weight = _worker_args
+    try:
+        return replay_error(setup, with_values(config, values), trajectory, ball_weight)
+    except Exception:
+        telemetry.logger.exception('replay failed with %s', values)
+        return math.inf, math.inf, math.inf
+
+
+# result of a generation, with the best candidate found so far
+Generation = namedtuple('Generation', ['index', 'best_values', 'best_error', 'car_error', 'ball_error'])
+
+
+class Fitter(object):
+    """Searches for the simulation parameters that best reproduce a recorded run."""
+
+    def __init__(self, setup, config, trajectory, bounds, ball_weight=1.0,
+                 population=16, elite=4, workers=None, seed=None):
+        """
+        @param setup: The ReplaySetup.
+        @param config: Dict with the simulation parameters under 'sim' and the /cars parameters under 'cars'.
+        @param trajectory: The Trajectory to match.
+        @param bounds: Dict of '/' separated path into config (ex: 'cars/throttle/tau') to [min, max].
+        @param ball_weight: Weight of the ball error, relative to the car error.
+        @param population: Candidates replayed per generation.
+        @param elite: Number of best candidates the next generation is sampled around.
+        @param workers: Number of worker processes (default=one per CPU).
+        @param seed: Seed for sampling candidates (default=unseeded).
+        """
+        if not bounds:
+            raise ValueError('no parameters to fit')
+        if not 0 < elite <= population:
+            raise ValueError(f'elite must be between 1 and population ({population}), got {elite}')
+        self.config = config
+        self.paths = list(bounds)
+        self._low = np.array([bounds[path][0] for path in self.paths], dtype=float)
+        self._high = np.array([bounds[path][1] for path in self.paths], dtype=float)
+        self._population = population
+        self._elite = elite
+        self._rng = np.random.default_rng(seed)
+        # workers are spawned rather than forked, so they do not inherit a ROS node or PyBullet client
+        self._pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=_init_worker, initargs=(setup, config, trajectory, ball_weight))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def initial_values(self):
+        """Returns the current values of the fitted parameters, clipped to the bounds."""
+        return np.clip([get_value(self.config, path) for path in self.paths], self._low, self._high)
+
+    def evaluate(self, candidates):
+        """
+        Replays candidates in parallel.
+        @param candidates: (n, num_params) array of parameter values.
+        @return: List of (error, car error, ball error).
+        """
+        return self._pool.map(_evaluate, [self._to_dict(values) for values in candidates], chunksize=1)
+
+    def fit(self, generations, tolerance=1e-3):
+        """
+        Runs the search, starting around the current values.
+        @param generations: Maximum number of generations.
+        @param tolerance: Stop once the spread of every parameter falls below this fraction of its range.
+        @return: Generator of Generation, one per generation after the first (which is the current values).
+        """
+        mean = self.initial_values()
+        std = (self._high - self._low) / 4.0
+        best_values = mean
+        best = self.evaluate([mean])[0]
+        yield Generation(0, self._to_dict(best_values), *best)
+
+        for index in range(1, generations + 1):
+            candidates = np.clip(self._rng.normal(mean, std, size=(self._population, len(mean))),
+                                 self._low, self._high)
+            results = self.evaluate(candidates)
+            order = np.argsort([error for error, _, _ in results])
+            if results[order[0]][0] < best[0]:
+                best_values = candidates[order[0]]
+                best = results[order[0]]
+            yield Generation(index, self._to_dict(best_values), *best)
+
+            elites = candidates[order[:self._elite]]
+            mean = elites.mean(axis=0)
+            std = elites.std(axis=0)
+            if np.all(std <= tolerance * (self._high - self._low)):
+                break
+
+    def _to_dict(self, values):
+        return {path: float(value) for path, value in zip(self.paths, values)}
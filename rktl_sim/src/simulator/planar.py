@@ -0,0 +1,830 @@
+"""Contains the PlanarSim class.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# 3rd party modules
+import copy
+import math
+import numpy as np
+import xml.etree.ElementTree as ET
+
+# Local modules
+from simulator.dynamics import CarBatch
+from simulator.recording import Recorder
+from simulator.rng import make_streams, NoiseBuffer
+from simulator.state import ContactEvent
+from simulator import spawn, state, telemetry
+
+# Bullet's default linear damping, applied to the ball every substep
+DEFAULT_LINEAR_DAMPING = 0.04
+# Bullet's default friction, used for bodies without configured dynamics
+DEFAULT_FRICTION = 0.5
+# Bullet's default fixedTimeStep (seconds)
+DEFAULT_TIME_STEP = 1.0 / 240.0
+
+
+def _parse_floats(text, default):
+    return [float(v) for v in text.split()] if text is not None else default
+
+
+def load_boxes(urdf_path):
+    """
+    Reads all collision boxes out of a URDF of fixed, unrotated links.
+    @param urdf_path: Path to the URDF.
+    @return: (K, 4) array of x_min, y_min, x_max, y_max for each box.
+    """
+    robot = ET.parse(urdf_path).getroot()
+
+    # find the origin of each link relative to the base
+    parents = {}
+    for joint in robot.findall('joint'):
+        origin = joint.find('origin')
+        xyz = _parse_floats(origin.get('xyz') if origin is not None else None, [0., 0., 0.])
+        parents[joint.find('child').get('link')] = (joint.find('parent').get('link'), xyz)
+
+    def link_origin(name):
+        if name not in parents:
+            return np.zeros(3)
+        parent, xyz = parents[name]
+        return link_origin(parent) + np.array(xyz)
+
+    boxes = []
+    for link in robot.findall('link'):
+        for collision in link.findall('collision'):
+            box = collision.find('geometry/box')
+            if box is None:
+                continue
+            origin = collision.find('origin')
+            xyz = _parse_floats(origin.get('xyz') if origin is not None else None, [0., 0., 0.])
+            center = link_origin(link.get('name')) + np.array(xyz)
+            half = np.array(_parse_floats(box.get('size'), None)) / 2.0
+            boxes.append([center[0] - half[0], center[1] - half[1],
+                          center[0] + half[0], center[1] + half[1]])
+    return np.array(boxes).reshape(-1, 4)
+
+
+def load_sphere_radius(urdf_path):
+    """Returns the radius of the first collision sphere in a URDF."""
+    sphere = ET.parse(urdf_path).getroot().find('link/collision/geometry/sphere')
+    return float(sphere.get('radius'))
+
+
+class PlanarSim(object):
+    """
+    Closed-form 2D alternative to Sim, vectorized across many independent arenas.
+    The ball is a circle, cars are oriented boxes driven by a CarBatch, and the
+    walls and goals are the axis-aligned boxes of their URDFs. The ball scores
+    when it touches a goal box, the same as with PyBullet.
+
+    Every arena has the same cars and ball, so create_car and create_ball add
+    one to each arena. Functions that return the state of a single object take
+    an `arena` argument, while the `get_*_array` functions return all arenas.
+    Collisions between cars are not modeled.
+    """
+
+    class NoURDFError(Exception):
+        pass
+
+    def __init__(self, props, urdf_paths, spawn_bounds, render_enabled, num_arenas=1, seed=None):
+        """
+        Initializes the field geometry and physical properties.
+        @param props: Simulation properties, using the dynamics section for friction and restitution.
+        @param urdf_paths: URDF paths, which must include walls, goal a and b.
+        @param spawn_bounds: Initial spawn bounds for cars and ball.
+        @param render_enabled: Unused, there is nothing to render.
+        @param num_arenas: Number of independent arenas to simulate.
+        @param seed: Seed for the spawn, dynamics, and noise random streams (default=unseeded).
+        """
+        self.props = props
+        self.urdf_paths = urdf_paths
+        self.spawn_bounds = spawn_bounds
+        self.num_arenas = num_arenas
+        self._rng = make_streams(seed)
+        self._noise = NoiseBuffer(self._rng['noise'])
+
+        if not all(name in urdf_paths for name in ("walls", "goal_a", "goal_b")):
+            raise self.NoURDFError()
+
+        # static geometry, with the goals as the last two boxes
+        walls = load_boxes(urdf_paths["walls"])
+        self._boxes = np.concatenate((walls,
+                                      load_boxes(urdf_paths["goal_a"])[:1],
+                                      load_boxes(urdf_paths["goal_b"])[:1]))
+        self._GOAL_A = len(self._boxes) - 2
+        self._GOAL_B = len(self._boxes) - 1
+
+        # combined contact properties, in the same way as Bullet (product of each body's)
+        ball_dyn = self._get_dynamics("ball")
+        wall_dyn = self._get_dynamics("walls")
+        car_dyn = self._get_dynamics("car")
+        ball_restitution = ball_dyn.get('restitution', 0.0)
+        ball_friction = ball_dyn.get('lateralFriction', DEFAULT_FRICTION)
+        self._box_restitution = np.full(len(self._boxes), ball_restitution * wall_dyn.get('restitution', 0.0))
+        self._box_friction = np.full(len(self._boxes), ball_friction * wall_dyn.get('lateralFriction', DEFAULT_FRICTION))
+        self._box_restitution[-2:] = 0.0
+        self._box_friction[-2:] = ball_friction * DEFAULT_FRICTION
+        self._car_restitution = ball_restitution * car_dyn.get('restitution', 0.0)
+        self._car_friction = ball_friction * car_dyn.get('lateralFriction', DEFAULT_FRICTION)
+        self._ball_damping = ball_dyn.get('linearDamping', DEFAULT_LINEAR_DAMPING)
+        # like Sim, substeps are the engine's fixedTimeStep
+        self._engine_time_step = DEFAULT_TIME_STEP
+        if self.props.get('engine') is not None:
+            self._engine_time_step = self.props['engine'].get('fixedTimeStep', DEFAULT_TIME_STEP)
+
+        # ball state
+        self._ball_id = None
+        self._ball_radius = None
+        self.ball_noise = None
+        self.init_ball_pos = None
+        self._speed_bound = 0.0
+        self._ball_pos = np.zeros((num_arenas, 3))
+        self._ball_vel = np.zeros((num_arenas, 2))
+
+        # car state
+        self._car_ids = []
+        self._car_data = {}
+        self._next_id = 0
+        self._car_half_size = np.zeros(2)
+        self._car_height = 0.0
+        self._cars = CarBatch(num_arenas, 0, self._empty_props())
+
+        # match state
+        self.arena_scored = np.zeros(num_arenas, dtype=bool)
+        self.arena_winner = np.full(num_arenas, None, dtype=object)
+        self.arena_touched_last = np.full(num_arenas, None, dtype=object)
+        self.substeps = 0
+
+        # contact tracking, keyed by car id, 'wall', or ('goal', winner)
+        self._ball_contacts = [set() for _ in range(num_arenas)]
+        self.events = []
+
+        self._snapshot_pool = []
+
+        # preallocated outputs of get_state_array
+        self._state_buffers = {}
+        self._state_noise = None
+
+        self.time = 0.0
+        self._recorder = None
+
+    @property
+    def scored(self):
+        """Whether the first arena has been scored in."""
+        return bool(self.arena_scored[0])
+
+    @property
+    def winner(self):
+        """Winner of the first arena."""
+        return self.arena_winner[0]
+
+    @property
+    def touched_last(self):
+        """Car that last touched the ball in the first arena."""
+        return self.arena_touched_last[0]
+
+    def close(self):
+        """Finishes any recording (there is nothing to disconnect from)."""
+        self.stop_recording()
+
+    def _get_dynamics(self, body_type):
+        if 'dynamics' not in self.props or \
+                self.props['dynamics'] is None or \
+                body_type not in self.props['dynamics']:
+            return {}
+        return self.props['dynamics'][body_type]
+
+    @staticmethod
+    def _empty_props():
+        return {'length': 1.0, 'max_speed': 0.0, 'throttle_tau': 1.0,
+                'steering_throw': 0.0, 'steering_rate': 0.0, 'simulate_effort': False}
+
+    def seed(self, seed=None):
+        """Re-seeds the spawn, dynamics, and noise random streams."""
+        self._rng = make_streams(seed)
+        self._noise.set_rng(self._rng['noise'])
+
+    def _arenas(self, arena):
+        """Converts an arena argument (None for all, int, or indices) to an index array."""
+        if arena is None:
+            return np.arange(self.num_arenas)
+        return np.atleast_1d(arena)
+
+    def _sample_spawn(self, size):
+        """Uniformly samples positions in the spawn bounds."""
+        low = [bound[0] for bound in self.spawn_bounds]
+        high = [bound[1] for bound in self.spawn_bounds]
+        return self._rng['spawn'].uniform(low, high, size=tuple(size) + (3,))
+
+    def create_ball(self, urdf_name, init_pose=None, init_speed=None,
+                    noise=None, init_vel=None):
+        """
+        Adds a ball to every arena.
+        @param urdf_name: The URDF to read the ball radius from.
+        @param init_pose: The initial position of the ball (override randomization).
+        @param init_speed: The max speed of the ball (override known speed parameter).
+        @param noise: The noise and if it should be present in the location of the object.
+        @param init_vel: The initial velocity of the ball (override randomization).
+        @return: The ball id if the creation was successful.
+        """
+        if urdf_name not in self.urdf_paths:
+            return None
+
+        self._ball_radius = load_sphere_radius(self.urdf_paths[urdf_name])
+        self._ball_id = 0
+        self.ball_noise = noise
+        self._state_noise = None
+        if init_pose:
+            self.init_ball_pos = init_pose["pos"]
+        else:
+            self.init_ball_pos = None
+        self._speed_bound = spawn.ball_speed_bound(init_speed)
+
+        self.reset_ball()
+        if init_vel:
+            self._ball_vel[:] = init_vel[:2]
+        return self._ball_id
+
+    def create_car(self, urdf_name, init_pose=None, noise=None, car_props=None):
+        """
+        Adds a car to every arena.
+        @param urdf_name: The URDF to read the car size from.
+        @param init_pose: The initial position of the car (override randomization).
+        @param noise: The noise and if it should be present in the location of the object.
+        @param car_props: Configuration based car properties.
+        @return: The car id if the creation was successful.
+        """
+        if urdf_name not in self.urdf_paths:
+            return None
+
+        car_box = load_boxes(self.urdf_paths[urdf_name])[0]
+        self._car_half_size = (car_box[2:] - car_box[:2]) / 2.0
+
+        if init_pose:
+            car_pos = init_pose.get("pos", [0.0, 0.0, 0.0])
+            car_orient = init_pose.get("orient", [0.0, 0.0, 0.0])
+            init_car_pos = car_pos
+            init_car_orient = car_orient
+        else:
+            car_pos = self._sample_spawn((self.num_arenas,))
+            car_orient = np.zeros((self.num_arenas, 3))
+            car_orient[:, 2] = self._rng['spawn'].uniform(0, 2 * math.pi, self.num_arenas)
+            init_car_pos = None
+            init_car_orient = None
+
+        car_id = self._next_id
+        self._next_id += 1
+        self._car_ids.append(car_id)
+        self._car_data[car_id] = {
+            "init_pos": init_car_pos,
+            "init_orient": init_car_orient,
+            "noise": noise,
+            "props": car_props,
+        }
+        self._state_noise = None
+
+        self._resize_cars()
+        slot = len(self._car_ids) - 1
+        mask = np.zeros(self._cars.shape, dtype=bool)
+        mask[:, slot] = True
+        self._cars.reset(np.broadcast_to(car_pos, (self.num_arenas, 3))[:, None, :],
+                         np.broadcast_to(car_orient, (self.num_arenas, 3))[:, None, :], mask)
+        self._car_height = np.broadcast_to(car_pos, (self.num_arenas, 3))[0, 2]
+        return car_id
+
+    def delete_car(self, car_id):
+        """
+        Removes a car from every arena.
+        @param car_id: The id of the car.
+        @return: Whether the deletion was successful.
+        """
+        if car_id not in self._car_data:
+            return False
+
+        keep = [i for i, other in enumerate(self._car_ids) if other != car_id]
+        self._car_ids.remove(car_id)
+        del self._car_data[car_id]
+        self._state_noise = None
+        self._resize_cars(keep)
+        return True
+
+    def _resize_cars(self, keep=None):
+        """Rebuilds the CarBatch after the list of cars changes, keeping the state of the listed slots."""
+        old = self._cars
+        if keep is None:
+            keep = list(range(old.shape[1]))
+        props = [self._car_data[car_id]["props"] for car_id in self._car_ids]
+        self._cars = CarBatch(self.num_arenas, len(self._car_ids), self._stack_props(props))
+        n = len(keep)
+        for attr in ('x', 'y', 'theta', 'v_rear', 'psi', 'cmd', 'x_dot', 'y_dot', 'omega'):
+            getattr(self._cars, attr)[:, :n] = getattr(old, attr)[:, keep]
+        # kept cars keep the properties of their last reset, in each arena
+        props = {key: np.array(value) for key, value in self._cars.get_properties().items()}
+        for key, value in old.get_properties().items():
+            props[key][:, :n] = value[:, keep]
+        self._cars.set_properties(props)
+
+    @classmethod
+    def _stack_props(cls, props):
+        if not props:
+            return cls._empty_props()
+        return {key: np.array([prop[key] for prop in props]) for key in props[0]}
+
+    def _car_slot(self, car_id):
+        return self._car_ids.index(car_id)
+
+    def step(self, dt):
+        """
+        Moves every arena forward one timestep, checking if a goal is scored.
+        @param dt: The change in time (delta-t) for this sim step.
+        @return: The number of physics substeps used.
+        """
+        # substeps are never merged, since contacts are resolved in closed form
+        p_dt = self._engine_time_step
+        with telemetry.timer('sim.step'):
+            self.events = []
+            self.substeps = 0
+            for _ in range(round(dt / p_dt)):
+                with telemetry.timer('sim.car_kinematics'):
+                    self._step_cars(p_dt)
+                contacts = None
+                if self._ball_id is not None:
+                    with telemetry.timer('sim.ball'):
+                        contacts = self._step_ball(p_dt)
+                self.time += p_dt
+                if contacts is not None:
+                    with telemetry.timer('sim.contact_events'):
+                        self._update_contacts(contacts)
+                self.substeps += 1
+            telemetry.count('substeps', self.substeps)
+            telemetry.log_summary()
+            if self._recorder is not None:
+                self._record()
+        return self.substeps
+
+    def _step_cars(self, dt):
+        """Moves the cars, then pushes them out of any walls."""
+        cars = self._cars
+        if cars.shape[1] == 0:
+            return
+        x0, y0, theta0 = cars.x.copy(), cars.y.copy(), cars.theta.copy()
+        cars.step(dt)
+
+        # axis aligned half extents of each car
+        c, s = np.abs(np.cos(cars.theta)), np.abs(np.sin(cars.theta))
+        hx = c * self._car_half_size[0] + s * self._car_half_size[1]
+        hy = s * self._car_half_size[0] + c * self._car_half_size[1]
+        for x_min, y_min, x_max, y_max in self._boxes:
+            over_x = np.minimum(cars.x + hx - x_min, x_max - (cars.x - hx))
+            over_y = np.minimum(cars.y + hy - y_min, y_max - (cars.y - hy))
+            hit = (over_x > 0) & (over_y > 0)
+            push_x = hit & (over_x <= over_y)
+            push_y = hit & (over_x > over_y)
+            center_x, center_y = (x_min + x_max) / 2.0, (y_min + y_max) / 2.0
+            cars.x += np.where(push_x, np.copysign(over_x, cars.x - center_x), 0.0)
+            cars.y += np.where(push_y, np.copysign(over_y, cars.y - center_y), 0.0)
+
+        # report the velocity that was actually achieved
+        cars.x_dot = (cars.x - x0) / dt
+        cars.y_dot = (cars.y - y0) / dt
+        cars.omega = (cars.theta - theta0) / dt
+
+    def _step_ball(self, dt):
+        """
+        Moves the ball, then resolves collisions with the walls, goals, and cars.
+        Goals are also checked by sweeping the ball along its path, so fast shots
+        can not tunnel through them.
+        @return: List of the set of bodies the ball touched in each arena, as in _ball_contacts.
+        """
+        r = self._ball_radius
+        contacts = [set() for _ in range(self.num_arenas)]
+        start = self._ball_pos[:, :2].copy()
+        self._ball_vel *= math.pow(1.0 - self._ball_damping, dt)
+        self._ball_pos[:, :2] += self._ball_vel * dt
+        swept = {i: self._segment_hits_box(start, self._ball_pos[:, :2], self._boxes[i])
+                 for i in (self._GOAL_A, self._GOAL_B)}
+
+        # walls and goals
+        for i, (x_min, y_min, x_max, y_max) in enumerate(self._boxes):
+            pos = self._ball_pos[:, :2]
+            closest = np.clip(pos, [x_min, y_min], [x_max, y_max])
+            normal, depth = self._contact(pos - closest, pos - [(x_min + x_max) / 2.0, (y_min + y_max) / 2.0],
+                                          [(x_max - x_min) / 2.0, (y_max - y_min) / 2.0], r)
+            hit = depth > 0
+            if hit.any():
+                self._resolve(hit, normal, depth, np.zeros_like(self._ball_vel),
+                              self._box_restitution[i], self._box_friction[i])
+            if i in swept:
+                winner = "A" if i == self._GOAL_A else "B"
+                hit = hit | swept[i]
+                self.arena_scored[hit] = True
+                self.arena_winner[hit] = winner
+                key = ('goal', winner)
+            else:
+                key = 'wall'
+            for arena in np.flatnonzero(hit):
+                contacts[arena].add(key)
+
+        # cars, which are oriented boxes that are not affected by the ball
+        cars = self._cars
+        for slot, car_id in enumerate(self._car_ids):
+            cos, sin = np.cos(cars.theta[:, slot]), np.sin(cars.theta[:, slot])
+            rel = self._ball_pos[:, :2] - np.stack((cars.x[:, slot], cars.y[:, slot]), axis=-1)
+            local = np.stack((cos * rel[:, 0] + sin * rel[:, 1],
+                              -sin * rel[:, 0] + cos * rel[:, 1]), axis=-1)
+            closest = np.clip(local, -self._car_half_size, self._car_half_size)
+            local_normal, depth = self._contact(local - closest, local, self._car_half_size, r)
+            hit = depth > 0
+            if not hit.any():
+                continue
+            normal = np.stack((cos * local_normal[:, 0] - sin * local_normal[:, 1],
+                               sin * local_normal[:, 0] + cos * local_normal[:, 1]), axis=-1)
+            # velocity of the car at the point of contact
+            arm = rel - normal * r
+            omega = cars.omega[:, slot]
+            surface_vel = np.stack((cars.x_dot[:, slot] - omega * arm[:, 1],
+                                    cars.y_dot[:, slot] + omega * arm[:, 0]), axis=-1)
+            self._resolve(hit, normal, depth, surface_vel, self._car_restitution, self._car_friction)
+            self.arena_touched_last[hit] = car_id
+            for arena in np.flatnonzero(hit):
+                contacts[arena].add(car_id)
+        return contacts
+
+    def _update_contacts(self, contacts):
+        """Logs an event for each body the ball started touching in the last substep."""
+        for arena, arena_contacts in enumerate(contacts):
+            for other in arena_contacts - self._ball_contacts[arena]:
+                if other == 'wall':
+                    self._log_event(arena, 'wall')
+                elif isinstance(other, tuple):
+                    self._log_event(arena, 'goal', winner=other[1])
+                else:
+                    self._log_event(arena, 'touch', car_id=other)
+            self._ball_contacts[arena] = arena_contacts
+
+    def _log_event(self, arena, kind, car_id=None, winner=None):
+        self.events.append(ContactEvent(self.time, self.substeps, arena, kind, car_id, winner))
+
+    def _segment_hits_box(self, start, end, box):
+        """
+        Returns whether the ball, moving from start to end, overlaps a box (slab test).
+        @param start: (A, 2) start of the ball in each arena.
+        @param end: (A, 2) end of the ball in each arena.
+        @param box: (x_min, y_min, x_max, y_max) of the box.
+        @return: (A,) boolean array.
+        """
+        lower = np.subtract(box[:2], self._ball_radius)
+        upper = np.add(box[2:], self._ball_radius)
+        delta = end - start
+        moving = np.abs(delta) >= 1e-12
+        inside = (start >= lower) & (start <= upper)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_0 = (lower - start) / delta
+            t_1 = (upper - start) / delta
+        # axes the ball does not move along either always or never overlap
+        t_near = np.where(moving, np.minimum(t_0, t_1), np.where(inside, 0.0, np.inf))
+        t_far = np.where(moving, np.maximum(t_0, t_1), np.where(inside, 1.0, -np.inf))
+        t_min = np.maximum(t_near.max(axis=-1), 0.0)
+        t_max = np.minimum(t_far.min(axis=-1), 1.0)
+        return t_min <= t_max
+
+    @staticmethod
+    def _contact(offset, center_offset, half_size, r):
+        """
+        Finds the contact normal and penetration depth of circles against boxes.
+        @param offset: (A, 2) offset of each circle center from the closest point on its box.
+        @param center_offset: (A, 2) offset of each circle center from its box center.
+        @param half_size: Half the size of the box.
+        @param r: The circle radius.
+        @return: (A, 2) unit normals pointing out of the box, and (A,) depths (positive when in contact).
+        """
+        dist = np.linalg.norm(offset, axis=-1)
+        outside = dist > 1e-9
+        normal = offset / np.where(outside, dist, 1.0)[:, None]
+        depth = r - dist
+
+        # centers inside the box get pushed out along the shallowest axis
+        inside = ~outside
+        if inside.any():
+            gap = np.asarray(half_size) - np.abs(center_offset)
+            axis = np.argmin(gap, axis=-1)
+            inside_normal = np.zeros_like(offset)
+            rows = np.arange(len(offset))
+            inside_normal[rows, axis] = np.copysign(1.0, center_offset[rows, axis])
+            normal = np.where(inside[:, None], inside_normal, normal)
+            depth = np.where(inside, r + gap[rows, axis], depth)
+        return normal, depth
+
+    def _resolve(self, hit, normal, depth, surface_vel, restitution, friction):
+        """Pushes the ball out of a surface and applies a collision impulse."""
+        self._ball_pos[hit, :2] += normal[hit] * depth[hit, None]
+        rel_vel = self._ball_vel[hit] - surface_vel[hit]
+        n = normal[hit]
+        v_n = np.sum(rel_vel * n, axis=-1)
+        approaching = v_n < 0
+        v_t = rel_vel - v_n[:, None] * n
+        speed_t = np.linalg.norm(v_t, axis=-1)
+
+        # normal impulse, then coulomb friction bounded by the tangential speed
+        impulse_n = -(1.0 + restitution) * np.where(approaching, v_n, 0.0)
+        impulse_t = np.minimum(friction * impulse_n, speed_t)
+        tangent = v_t / np.where(speed_t > 1e-9, speed_t, 1.0)[:, None]
+        self._ball_vel[hit] += impulse_n[:, None] * n - impulse_t[:, None] * tangent
+
+    def set_car_command(self, id, cmd, arena=None):
+        """Sets the command of a car (in all arenas by default)."""
+        if id not in self._car_data:
+            return None
+        self._cars.cmd[self._arenas(arena), self._car_slot(id)] = cmd
+
+    def set_car_commands(self, cmds):
+        """Sets the command of all cars, using a (num_arenas, num_cars, 2) array."""
+        self._cars.set_commands(cmds)
+
+    def get_car_commands(self):
+        """Returns (num_arenas, num_cars, 2) array of the commands of all cars."""
+        return self._cars.cmd.copy()
+
+    def get_car_pose(self, id, add_noise=False, arena=0):
+        """Returns the position and quaternion of a car."""
+        if id not in self._car_data:
+            return None
+
+        slot = self._car_slot(id)
+        pos = np.array([self._cars.x[arena, slot], self._cars.y[arena, slot], self._car_height])
+        orient = np.array([0.0, 0.0, self._cars.theta[arena, slot]])
+        noise = self._car_data[id]['noise']
+        if add_noise and noise:
+            if self._noise.uniform() < noise['dropout']:
+                return None, None
+            pos = self._noise.normal(pos, noise['pos'])
+            orient = self._noise.normal(orient, noise['orient'])
+        return pos, _quaternion_from_yaw(orient[2])
+
+    def get_car_velocity(self, id, arena=0):
+        """Returns a tuple of linear (body frame) and angular velocity for the car."""
+        if id not in self._car_data:
+            return None
+
+        slot = self._car_slot(id)
+        theta = self._cars.theta[arena, slot]
+        x_dot, y_dot = self._cars.x_dot[arena, slot], self._cars.y_dot[arena, slot]
+        linear = (math.cos(theta) * x_dot + math.sin(theta) * y_dot,
+                  -math.sin(theta) * x_dot + math.cos(theta) * y_dot, 0.0)
+        return linear, (0.0, 0.0, self._cars.omega[arena, slot])
+
+    def get_ball_pose(self, add_noise=False, arena=0):
+        """@param add_noise: State whether you want noise to get the ball position (default=False)."""
+        if self._ball_id is None:
+            return None
+        pos = self._ball_pos[arena].copy()
+
+        if add_noise and self.ball_noise:
+            if self._noise.uniform() < self.ball_noise['dropout']:
+                return None, None
+            else:
+                pos = self._noise.normal(pos, self.ball_noise['pos'])
+
+        return pos, (0.0, 0.0, 0.0, 1.0)
+
+    def get_ball_velocity(self, arena=0):
+        if self._ball_id is None:
+            return None
+        return (self._ball_vel[arena, 0], self._ball_vel[arena, 1], 0.0), (0.0, 0.0, 0.0)
+
+    def get_car_pose_array(self):
+        """Returns (num_arenas, num_cars, 3) array of x, y, and heading of all cars."""
+        return self._cars.get_pose()
+
+    def get_car_velocity_array(self):
+        """Returns (num_arenas, num_cars, 2) array of forward and angular velocity of all cars."""
+        return self._cars.get_velocity()
+
+    def get_ball_array(self):
+        """Returns (num_arenas, 4) array of x, y, vx, vy of the ball."""
+        return np.concatenate((self._ball_pos[:, :2], self._ball_vel), axis=-1)
+
+    @property
+    def car_ids(self):
+        """Ids of the cars, in the order of the rows of get_state_array."""
+        return list(self._car_ids)
+
+    def get_state_array(self, add_noise=False, arena=0, out=None):
+        """
+        Returns the state of every car and the ball, in the same layout as Sim.get_state_array.
+        @param add_noise: Whether to add sensor noise to the poses. Bodies that drop out have NaN poses.
+        @param arena: The arena to read.
+        @param out: Array to fill (default=a preallocated array, overwritten by the next call).
+        @return: The (num_bodies, state.STATE_SIZE) array.
+        """
+        num_cars = len(self._car_ids)
+        rows = num_cars + (self._ball_id is not None)
+        if out is None:
+            out = state.get_state_buffer(self._state_buffers, arena, rows)
+
+        cars = self._cars
+        out[:num_cars, state.X] = cars.x[arena]
+        out[:num_cars, state.Y] = cars.y[arena]
+        out[:num_cars, state.Z] = self._car_height
+        out[:num_cars, state.YAW] = cars.theta[arena]
+        out[:num_cars, state.V_FORWARD] = cars.x_dot[arena]
+        out[:num_cars, state.V_LEFT] = cars.y_dot[arena]
+        out[:num_cars, state.V_UP] = 0.0
+        out[:num_cars, state.OMEGA] = cars.omega[arena]
+        state.to_body_frame(out[:num_cars])
+
+        if self._ball_id is not None:
+            out[num_cars, state.X:state.Z + 1] = self._ball_pos[arena]
+            out[num_cars, state.YAW] = 0.0
+            out[num_cars, state.V_FORWARD:state.V_LEFT + 1] = self._ball_vel[arena]
+            out[num_cars, state.V_UP:] = 0.0
+
+        if add_noise:
+            if self._state_noise is None:
+                noises = [self._car_data[car_id]['noise'] for car_id in self._car_ids]
+                if self._ball_id is not None:
+                    noises.append(self.ball_noise)
+                self._state_noise = state.make_noise_table(noises)
+            state.add_noise(out, self._state_noise, self._noise)
+        return out
+
+    def start_recording(self, path, chunk_size=1024):
+        """
+        Starts recording the state and commands of every arena after each step and reset.
+        The cars should not change while recording.
+        @param path: Directory to write the recording to (see recording.Recorder).
+        @param chunk_size: Number of frames to buffer between writes.
+        @return: The Recorder.
+        """
+        self.stop_recording()
+        self._recorder = Recorder(path, self.car_ids, chunk_size=chunk_size)
+        return self._recorder
+
+    def stop_recording(self):
+        """Finishes the current recording, if there is one."""
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def _record(self):
+        """Adds the current state to the recording."""
+        state_array = np.stack([self.get_state_array(arena=arena) for arena in range(self.num_arenas)])
+        self._recorder.record(self.time, state_array, self.get_car_commands())
+
+    def save_snapshot(self):
+        """
+        Captures the state of every arena, so it can be returned to later.
+        Snapshots become invalid if cars are created or deleted.
+        @return: An opaque snapshot, for restore_snapshot.
+        """
+        return copy.deepcopy({
+            'ball_pos': self._ball_pos,
+            'ball_vel': self._ball_vel,
+            'cars': self._cars,
+            'car_data': self._car_data,
+            'scored': self.arena_scored,
+            'winner': self.arena_winner,
+            'touched_last': self.arena_touched_last,
+            'spawn_bounds': self.spawn_bounds,
+            'time': self.time,
+        })
+
+    def restore_snapshot(self, snapshot):
+        """Returns every arena to the state captured by save_snapshot. The snapshot can be reused."""
+        snapshot = copy.deepcopy(snapshot)
+        self._ball_pos = snapshot['ball_pos']
+        self._ball_vel = snapshot['ball_vel']
+        self._cars = snapshot['cars']
+        self._car_data = snapshot['car_data']
+        self._state_noise = None
+        self.arena_scored = snapshot['scored']
+        self.arena_winner = snapshot['winner']
+        self.arena_touched_last = snapshot['touched_last']
+        self.spawn_bounds = snapshot['spawn_bounds']
+        self.time = snapshot['time']
+        self._ball_contacts = [set() for _ in range(self.num_arenas)]
+        if self._recorder is not None:
+            self._recorder.new_episode()
+            self._record()
+
+    def remove_snapshot(self, snapshot):
+        """Nothing to free, provided to match Sim."""
+        pass
+
+    def fill_snapshot_pool(self, size, spawn_bounds, car_properties, ball_init_pose, ball_init_speed):
+        """
+        Saves a number of randomized initial states, to cheaply reset to with reset_from_pool.
+        Arguments after size are the same as reset.
+        @param size: Number of snapshots in the pool.
+        """
+        self._snapshot_pool = []
+        for _ in range(size):
+            self.reset(spawn_bounds, car_properties, ball_init_pose, ball_init_speed)
+            self._snapshot_pool.append(self.save_snapshot())
+
+    def clear_snapshot_pool(self):
+        """Removes all snapshots in the pool."""
+        self._snapshot_pool = []
+
+    def reset_from_pool(self):
+        """Resets all arenas to a random snapshot from the pool."""
+        self.restore_snapshot(self._snapshot_pool[self._rng['spawn'].integers(len(self._snapshot_pool))])
+
+    def reset(self, spawn_bounds, car_properties, ball_init_pose, ball_init_speed, arena=None):
+        """
+        Resets the ball, score, winner, spawn bounds, cars and ball.
+        @param spawn_bounds: The new spawn bounds.
+        @param car_properties: The new car properties.
+        @param arena: Arena(s) to reset (default=all).
+        """
+        arenas = self._arenas(arena)
+        self.arena_scored[arenas] = False
+        self.arena_winner[arenas] = None
+        self.arena_touched_last[arenas] = None
+        if ball_init_pose is not None: self.init_ball_pos = ball_init_pose["pos"]
+        if ball_init_speed is not None: self._speed_bound = spawn.ball_speed_bound(ball_init_speed)
+
+        self._noise.refill()
+        self.spawn_bounds = spawn_bounds
+        # only the cars in the arenas being reset take the new properties
+        mask = np.zeros(self._cars.shape, dtype=bool)
+        mask[arenas] = True
+        self._cars.set_properties(car_properties, mask=mask)
+
+        positions = [self._spawn(i, cars=True, ball=True) for i in arenas]
+        self._set_ball(arenas, positions)
+        self._set_cars(arenas, positions)
+
+        if self._recorder is not None:
+            self._recorder.new_episode()
+            self._record()
+
+    def reset_cars(self, arena=None):
+        """Generates new initial positions for all cars (clear of the ball), if they were not specified."""
+        arenas = self._arenas(arena)
+        self._set_cars(arenas, [self._spawn(i, cars=True, ball=False) for i in arenas])
+
+    def reset_ball(self, arena=None):
+        """Moves the ball to its initial or a random position (clear of the cars), with a random velocity."""
+        if self._ball_id is None:
+            return
+        arenas = self._arenas(arena)
+        self._set_ball(arenas, [self._spawn(i, cars=False, ball=True) for i in arenas])
+
+    def _spawn(self, arena, cars, ball):
+        """
+        Samples spawn positions in one arena, clear of the bodies that are not moved.
+        @param arena: The arena.
+        @param cars: Whether to move the cars to their initial or a random position.
+        @param ball: Whether to move the ball to its initial or a random position.
+        @return: List of car positions, followed by the ball position (if there is a ball).
+        """
+        car_radius = math.hypot(*self._car_half_size)
+        spawns = []
+        for slot, car_id in enumerate(self._car_ids):
+            if cars:
+                pos = self._car_data[car_id]["init_pos"]
+            else:
+                pos = (self._cars.x[arena, slot], self._cars.y[arena, slot], self._car_height)
+            spawns.append((pos, car_radius))
+        if self._ball_id is not None:
+            spawns.append((self.init_ball_pos if ball else self._ball_pos[arena], self._ball_radius))
+        return spawn.place(self._rng['spawn'], self.spawn_bounds, spawns)
+
+    def _set_cars(self, arenas, positions):
+        """Moves the cars of some arenas to positions from _spawn, with their initial or a random heading."""
+        num_cars = len(self._car_ids)
+        if num_cars == 0:
+            return
+
+        pos = np.array([arena_pos[:num_cars] for arena_pos in positions], dtype=float)
+        orient = np.zeros((len(arenas), num_cars, 3))
+        orient[..., 2] = self._rng['spawn'].uniform(0, 2 * math.pi, (len(arenas), num_cars))
+        for slot, car_id in enumerate(self._car_ids):
+            if self._car_data[car_id]["init_orient"] is not None:
+                orient[:, slot] = self._car_data[car_id]["init_orient"]
+
+        full_pos = np.zeros((self.num_arenas, num_cars, 3))
+        full_orient = np.zeros((self.num_arenas, num_cars, 3))
+        full_pos[arenas] = pos
+        full_orient[arenas] = orient
+        mask = np.zeros(self._cars.shape, dtype=bool)
+        mask[arenas] = True
+        self._cars.reset(full_pos, full_orient, mask)
+        self._car_height = pos[0, 0, 2]
+
+    def _set_ball(self, arenas, positions):
+        """Moves the ball of some arenas to positions from _spawn, with a random velocity."""
+        if self._ball_id is None:
+            return
+        self._ball_pos[arenas] = [arena_pos[-1] for arena_pos in positions]
+        for arena in arenas:
+            self._ball_contacts[arena] = set()
+        self._ball_vel[arenas] = self._rng['dynamics'].uniform(-self._speed_bound, self._speed_bound, (len(arenas), 2))
+
+
+def _quaternion_from_yaw(yaw):
+    """Returns the (x, y, z, w) quaternion of a rotation about z."""
+    return (0.0, 0.0, math.sin(yaw / 2.0), math.cos(yaw / 2.0))
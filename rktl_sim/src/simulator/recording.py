@@ -0,0 +1,177 @@
+"""Contains the Recorder and Replay classes, for saving and reading back simulator runs.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# A recording is a directory with one raw binary file per column (time, state,
+# and commands), and an index in meta.json with the dtype and shape of one frame
+# of each column and the first frame of every episode. Frames are written in
+# chunks, so recording costs one write per column per chunk. Every frame has
+# the same size, so a Replay memory maps the columns and can read any frame
+# without loading the rest.
+
+# 3rd party modules
+from collections import namedtuple
+import json
+import os
+import numpy as np
+
+# Local modules
+from simulator.state import STATE_FIELDS
+
+Frame = namedtuple('Frame', ['time', 'state', 'commands'])
+
+COLUMNS = Frame._fields
+META_FILE = 'meta.json'
+
+
+class Recorder(object):
+    """
+    Writes frames of a simulator run to a recording directory. Each frame holds
+    the sim time, the (num_arenas, num_bodies, STATE_SIZE) state array, and the
+    (num_arenas, num_cars, 2) command array.
+    """
+
+    def __init__(self, path, car_ids, chunk_size=1024):
+        """
+        @param path: Directory to write to (created if needed, existing recordings are overwritten).
+        @param car_ids: Ids of the cars, in the order of the rows of the state array.
+        @param chunk_size: Number of frames to buffer between writes.
+        """
+        self.path = path
+        self._car_ids = list(car_ids)
+        self._chunk_size = chunk_size
+        self._buffers = None
+        self._buffered = 0
+        self._frames = 0
+        self._episodes = [0]
+        self._files = None
+        os.makedirs(path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._frames + self._buffered
+
+    def record(self, time, state, commands):
+        """
+        Adds a frame.
+        @param time: The sim time.
+        @param state: Array from get_state_array, for every arena.
+        @param commands: Array of car commands, with NaN for cars without one.
+        """
+        if self._buffers is None:
+            self._open(time, state, commands)
+        frame = (time, state, commands)
+        for column, buffer, value in zip(COLUMNS, self._buffers, frame):
+            if np.shape(value) != buffer.shape[1:]:
+                raise ValueError(f'{column} has shape {np.shape(value)}, but the recording '
+                                 f'has {buffer.shape[1:]}. Start a new recording after adding or removing bodies.')
+            buffer[self._buffered] = value
+        self._buffered += 1
+        if self._buffered == self._chunk_size:
+            self.flush()
+
+    def new_episode(self):
+        """Marks the next frame as the start of a new episode."""
+        if len(self) > self._episodes[-1]:
+            self._episodes.append(len(self))
+
+    def flush(self):
+        """Writes buffered frames and the index to disk."""
+        if self._buffers is None:
+            return
+        for buffer, file in zip(self._buffers, self._files):
+            file.write(buffer[:self._buffered].tobytes())
+            file.flush()
+        self._frames += self._buffered
+        self._buffered = 0
+        self._write_meta()
+
+    def close(self):
+        """Flushes and closes the recording."""
+        self.flush()
+        if self._files is not None:
+            for file in self._files:
+                file.close()
+            self._files = None
+
+    def _open(self, time, state, commands):
+        self._buffers = [np.zeros((self._chunk_size,) + np.shape(value), dtype=np.float64)
+                         for value in (time, state, commands)]
+        self._files = [open(os.path.join(self.path, f'{column}.bin'), 'wb') for column in COLUMNS]
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'columns': {column: {'dtype': buffer.dtype.str, 'shape': list(buffer.shape[1:])}
+                        for column, buffer in zip(COLUMNS, self._buffers)},
+            'state_fields': list(STATE_FIELDS),
+            'car_ids': self._car_ids,
+            'frames': self._frames,
+            'episodes': [start for start in self._episodes if start < max(self._frames, 1)],
+        }
+        # write then rename, so readers never see a partial index
+        tmp_path = os.path.join(self.path, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+
+
+class Replay(object):
+    """
+    Reads a recording lazily. Indexing returns a Frame, and slicing or
+    iterating never loads more than the frames that are used.
+    """
+
+    def __init__(self, path):
+        """@param path: Directory of the recording."""
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as file:
+            meta = json.load(file)
+        self.state_fields = meta['state_fields']
+        self.car_ids = meta['car_ids']
+        self._frames = meta['frames']
+        self._episodes = meta['episodes'] + [self._frames]
+        self._columns = []
+        for column in COLUMNS:
+            info = meta['columns'][column]
+            if self._frames == 0:
+                self._columns.append(np.zeros([0] + info['shape'], dtype=info['dtype']))
+            else:
+                self._columns.append(np.memmap(os.path.join(path, f'{column}.bin'), dtype=info['dtype'],
+                                               mode='r', shape=tuple([self._frames] + info['shape'])))
+
+    def __len__(self):
+        return self._frames
+
+    def __getitem__(self, index):
+        """Returns a Frame, or for a slice, a Frame of arrays over the sliced frames."""
+        return Frame(*(column[index] for column in self._columns))
+
+    def __iter__(self):
+        return self.frames()
+
+    @property
+    def num_episodes(self):
+        return len(self._episodes) - 1
+
+    def episode(self, index):
+        """Returns the range of frames in an episode."""
+        return range(self._episodes[index], self._episodes[index + 1])
+
+    def frames(self, start=0, stop=None):
+        """Yields frames one at a time, from start up to (not including) stop."""
+        stop = self._frames if stop is None else min(stop, self._frames)
+        for index in range(start, stop):
+            yield self[index]
+
+    def column(self, name):
+        """Returns a whole column (time, state, or commands) as a memory mapped array."""
+        return self._columns[COLUMNS.index(name)]
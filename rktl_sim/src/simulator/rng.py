@@ -0,0 +1,85 @@
+"""Contains seeded random number streams for the simulator.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# 3rd party modules
+import numpy as np
+
+# independent streams owned by each simulator
+STREAMS = ('spawn', 'dynamics', 'noise')
+
+
+def make_streams(seed=None):
+    """
+    Creates independent random number generators derived from one seed.
+    @param seed: An int, SeedSequence, or None to seed from the OS.
+    @return: Dict mapping each name in STREAMS to a numpy.random.Generator.
+    """
+    children = np.random.SeedSequence(seed).spawn(len(STREAMS))
+    return {name: np.random.default_rng(child) for name, child in zip(STREAMS, children)}
+
+
+class NoiseBuffer(object):
+    """
+    Hands out random draws that were generated in one batch, which is much
+    cheaper than asking a generator for a few numbers at a time.
+    """
+
+    def __init__(self, rng, size=4096):
+        """
+        @param rng: The numpy.random.Generator to draw from.
+        @param size: Number of draws of each type to generate at once.
+        """
+        self._size = size
+        self.set_rng(rng)
+
+    def set_rng(self, rng):
+        """Switches to a new generator, discarding any remaining draws."""
+        self._rng = rng
+        self.refill()
+
+    def refill(self):
+        """Discards any remaining draws and generates a new batch."""
+        self._normal = self._rng.standard_normal(self._size)
+        self._uniform = self._rng.random(self._size)
+        self._normal_index = 0
+        self._uniform_index = 0
+
+    def uniform(self, size=None):
+        """
+        Returns draws from [0, 1).
+        @param size: Number of draws, or None for a single value.
+        """
+        if size is None:
+            if self._uniform_index >= self._size:
+                self.refill()
+            value = self._uniform[self._uniform_index]
+            self._uniform_index += 1
+            return value
+
+        if size > self._size:
+            return self._rng.random(size)
+        if self._uniform_index + size > self._size:
+            self.refill()
+        draws = self._uniform[self._uniform_index:self._uniform_index + size]
+        self._uniform_index += size
+        return draws
+
+    def normal(self, mean, std):
+        """
+        Returns normally distributed draws, in the same way as np.random.normal.
+        @param mean: Mean, which sets the shape of the result.
+        @param std: Standard deviation, broadcastable to mean.
+        """
+        mean = np.asarray(mean, dtype=float)
+        count = mean.size
+        if count > self._size:
+            return self._rng.normal(mean, std)
+        if self._normal_index + count > self._size:
+            self.refill()
+        draws = self._normal[self._normal_index:self._normal_index + count]
+        self._normal_index += count
+        return mean + np.asarray(std) * draws.reshape(mean.shape)
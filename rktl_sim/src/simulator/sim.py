@@ -8,31 +8,64 @@ License:
 # 3rd party modules
 import math
 import pybullet as p
-import random
 import numpy as np
 
 # Local modules
 from simulator.car import Car
+from simulator.planar import PlanarSim
+from simulator.recording import Recorder
+from simulator.rng import make_streams, NoiseBuffer
+from simulator.state import ContactEvent
+from simulator import spawn, state, telemetry
+
+# space left between neighboring arenas (meters)
+ARENA_MARGIN = 1.0
+# number of collision filter group bits available to separate arenas. arena i
+# uses group 1 << (i % ARENA_FILTER_BITS), so with more arenas than bits, arenas
+# ARENA_FILTER_BITS apart share a group and are kept apart only by their spacing
+# on the grid (ARENA_MARGIN)
+ARENA_FILTER_BITS = 30
+# PyBullet's default fixedTimeStep (seconds)
+DEFAULT_TIME_STEP = 1.0 / 240.0
 
 
 class Sim(object):
     """
     Oversees instance-based parameters and objects of the simulator.
     Cars, ball objects, goal position, etc.
+    All PyBullet calls go to the default client (no physicsClientId), so only
+    one Sim can exist per process; parallel runs need a process per Sim.
     """
 
     class NoURDFError(Exception):
         pass
 
-    def __init__(self, props, urdf_paths, spawn_bounds, render_enabled):
+    def __new__(cls, props, urdf_paths, spawn_bounds, render_enabled, backend='pybullet', **kwargs):
+        """
+        Selects the physics backend.
+        @param backend: Either 'pybullet' (default) or 'planar', which returns a PlanarSim.
+        @param kwargs: Extra arguments for the backend (ex: num_arenas for PlanarSim).
+        """
+        if backend == 'planar':
+            return PlanarSim(props, urdf_paths, spawn_bounds, render_enabled, **kwargs)
+        elif backend != 'pybullet':
+            raise ValueError(f'unknown sim backend "{backend}"')
+        return super().__new__(cls)
+
+    def __init__(self, props, urdf_paths, spawn_bounds, render_enabled, backend='pybullet', num_arenas=1, seed=None):
         """
         Initializes the playing field, field properties, and field elements.
         @param props: Connect the pybullet object based on the gui and direct.
         @param urdf_paths: Configure: filed type, walls, floor, goal a and b.
         @param spawn_bounds: Initialize cars list and other data related to them.
         @param render_enabled: Use the loadURDF via p.loadURDF (loads the specific instruction).
+        @param backend: Physics backend, see __new__.
+        @param num_arenas: Number of independent arenas (matches) to host in the one physics client.
+        @param seed: Seed for the spawn, dynamics, and noise random streams (default=unseeded).
         """
-        self.touchedLast = None
+        self.num_arenas = num_arenas
+        self._rng = make_streams(seed)
+        self._noise = NoiseBuffer(self._rng['noise'])
         self.ball_noise = None
         self._speed_bound = None
         self.init_ball_pos = None
@@ -56,43 +89,166 @@ class Sim(object):
             self._plane_id = p.loadURDF(
                 urdf_paths["plane"], zero_pos, zero_orient, useFixedBase=1
             )
-            print(self.props)
+            telemetry.logger.debug('sim props: %s', self.props)
             self.configure_dynamics(self._plane_id, "floor")
+            if num_arenas > 1:
+                all_arenas = (1 << ARENA_FILTER_BITS) - 1
+                p.setCollisionFilterGroupMask(self._plane_id, -1, all_arenas, all_arenas)
         else:
             raise self.NoURDFError()
-        # set the walls for the simulation
-        if "walls" in urdf_paths:
-            self._walls_id = p.loadURDF(
-                urdf_paths["walls"], zero_pos, zero_orient, useFixedBase=1
-            )
-            self.configure_dynamics(self._walls_id, "walls")
-        else:
+        if "walls" not in urdf_paths or "goal_a" not in urdf_paths or "goal_b" not in urdf_paths:
             raise self.NoURDFError()
-        # set the goals for the simulation
-        self._goal_a_id = None
-        self._goal_b_id = None
-        if "goal_a" in urdf_paths and "goal_b" in urdf_paths:
-            self._goal_a_id = p.loadURDF(
-                urdf_paths["goal_a"], zero_pos, zero_orient, useFixedBase=1
-            )
 
-            self._goal_b_id = p.loadURDF(
-                urdf_paths["goal_b"], zero_pos, zero_orient, useFixedBase=1
+        # each arena gets its own walls and goals, laid out in a grid centered on the floor
+        self._walls_ids = []
+        self._goal_a_ids = []
+        self._goal_b_ids = []
+        self._arena_origins = []
+        self._arena_spacing = 0.0
+        for arena in range(num_arenas):
+            if arena == 0:
+                origin = [0.0, 0.0, 0.0]
+            else:
+                origin = self._get_arena_origin(arena)
+            self._arena_origins.append(origin)
+
+            # set the walls for the simulation
+            walls_id = p.loadURDF(
+                urdf_paths["walls"], origin, zero_orient, useFixedBase=1
             )
-        else:
-            raise self.NoURDFError()
+            self.configure_dynamics(walls_id, "walls")
+            self._walls_ids.append(walls_id)
+
+            # set the goals for the simulation
+            self._goal_a_ids.append(p.loadURDF(
+                urdf_paths["goal_a"], origin, zero_orient, useFixedBase=1
+            ))
+            self._goal_b_ids.append(p.loadURDF(
+                urdf_paths["goal_b"], origin, zero_orient, useFixedBase=1
+            ))
+            for body_id in (walls_id, self._goal_a_ids[-1], self._goal_b_ids[-1]):
+                self._set_arena_filter(body_id, arena)
+
+            if arena == 0 and num_arenas > 1:
+                self._arena_spacing = self._get_extent(walls_id) + ARENA_MARGIN
+                self._arena_origins[0] = self._get_arena_origin(0)
+                p.resetBasePositionAndOrientation(walls_id, self._arena_origins[0], zero_orient)
+                p.resetBasePositionAndOrientation(self._goal_a_ids[0], self._arena_origins[0], zero_orient)
+                p.resetBasePositionAndOrientation(self._goal_b_ids[0], self._arena_origins[0], zero_orient)
+
+        # cars are keyed by body id, with the arena 0 body id used to refer to a car in all arenas
         self._cars = {}
         self._car_data = {}
+        self._car_bodies = {}
+        self._body_to_car = {}
         self._ball_id = None
+        self._ball_ids = []
 
-        self.touched_last = None
-        self.scored = False
-        self.winner = None
+        self.arena_touched_last = [None] * num_arenas
+        self.arena_scored = [False] * num_arenas
+        self.arena_winner = [None] * num_arenas
 
         if 'engine' in self.props and self.props['engine'] is not None:
             p.setPhysicsEngineParameter(**self.props['engine'])
         p.setGravity(0, 0, -10)
 
+        # substeps are multiples of the engine's fixedTimeStep, and the car models
+        # (throttle and steering) step by the same time as the engine. substeps are
+        # taken one at a time while anything is close to contact, and merged when
+        # it is quiet
+        self._engine_time_step = DEFAULT_TIME_STEP
+        if self.props.get('engine') is not None:
+            self._engine_time_step = self.props['engine'].get('fixedTimeStep', DEFAULT_TIME_STEP)
+        self._max_merge = 1
+        self._contact_margin = 0.0
+        if self.props.get('stepping') is not None:
+            self._max_merge = max(1, int(self.props['stepping'].get('max_merge', 1)))
+            self._contact_margin = self.props['stepping'].get('contact_margin', 0.0)
+        self._current_time_step = self._engine_time_step
+        self._collision_links = {}
+
+        # contact tracking
+        self._goal_boxes = [
+            [(goal_id,) + self._get_box(goal_id) for goal_id in (goal_a_id, goal_b_id)]
+            for goal_a_id, goal_b_id in zip(self._goal_a_ids, self._goal_b_ids)
+        ]
+        self._ball_contacts = [set() for _ in range(num_arenas)]
+        self._ball_prev_pos = [None] * num_arenas
+        self._ball_radius = 0.0
+        self.events = []
+        self.time = 0.0
+
+        self._snapshot_pool = []
+        self.substeps = 0
+
+        # preallocated outputs of get_state_array
+        self._state_buffers = {}
+        self._state_noise = None
+
+        self._recorder = None
+
+    @property
+    def scored(self):
+        """Whether the first arena has been scored in."""
+        return self.arena_scored[0]
+
+    @property
+    def winner(self):
+        """Winner of the first arena."""
+        return self.arena_winner[0]
+
+    @property
+    def touched_last(self):
+        """Car that last touched the ball in the first arena."""
+        return self.arena_touched_last[0]
+
+    def _get_extent(self, body_id):
+        """Returns the largest horizontal size of a body's bounding box."""
+        aabbs = [p.getAABB(body_id, link) for link in range(-1, p.getNumJoints(body_id))]
+        low = np.min([aabb[0] for aabb in aabbs], axis=0)
+        high = np.max([aabb[1] for aabb in aabbs], axis=0)
+        return float(max(high[0] - low[0], high[1] - low[1]))
+
+    def _get_arena_origin(self, arena):
+        """Returns the world position of the center of an arena."""
+        cols = math.ceil(math.sqrt(self.num_arenas))
+        rows = math.ceil(self.num_arenas / cols)
+        row, col = divmod(arena, cols)
+        return [(col - (cols - 1) / 2.0) * self._arena_spacing,
+                (row - (rows - 1) / 2.0) * self._arena_spacing,
+                0.0]
+
+    def _set_arena_filter(self, body_id, arena):
+        """Only allows a body to collide with bodies of the same arena (and the shared floor)."""
+        if self.num_arenas <= 1:
+            return
+        group = 1 << (arena % ARENA_FILTER_BITS)
+        for link in range(-1, p.getNumJoints(body_id)):
+            p.setCollisionFilterGroupMask(body_id, link, group, group)
+
+    def _arenas(self, arena):
+        """Converts an arena argument (None for all, or an index) to a list of arenas."""
+        if arena is None:
+            return range(self.num_arenas)
+        return [arena]
+
+    def _random_spawn_pos(self):
+        return [
+            self._rng['spawn'].uniform(self.spawn_bounds[0][0], self.spawn_bounds[0][1]),
+            self._rng['spawn'].uniform(self.spawn_bounds[1][0], self.spawn_bounds[1][1]),
+            self._rng['spawn'].uniform(self.spawn_bounds[2][0], self.spawn_bounds[2][1]),
+        ]
+
+    def seed(self, seed=None):
+        """Re-seeds the spawn, dynamics, and noise random streams."""
+        self._rng = make_streams(seed)
+        self._noise.set_rng(self._rng['noise'])
+
+    def close(self):
+        """Disconnects from the physics server, finishing any recording."""
+        self.stop_recording()
+        p.disconnect(self._client)
+
     def configure_dynamics(self, body_id, body_type):
         """
         Set the car's curvature and general car behavior.
@@ -112,6 +268,7 @@ class Sim(object):
     def create_ball(self, urdf_name, init_pose=None, init_speed=None,
                     noise=None, init_vel=None):
         """
+        Creates a ball in every arena.
         @param urdf_name: The id for the specific pybullet object.
         @param init_pose: The initial position of the ball (override randomization).
         @param init_speed: The max speed of the ball (override known speed parameter).
@@ -122,35 +279,36 @@ class Sim(object):
         if urdf_name in self.urdf_paths:
             zero_orient = p.getQuaternionFromEuler([0.0, 0.0, 0.0])
             if init_pose:
-                ball_pos = init_pose["pos"]
-                self.init_ball_pos = ball_pos
+                self.init_ball_pos = init_pose["pos"]
             else:
-                ball_pos = [
-                    random.uniform(self.spawn_bounds[0][0], self.spawn_bounds[0][1]),
-                    random.uniform(self.spawn_bounds[1][0], self.spawn_bounds[1][1]),
-                    random.uniform(self.spawn_bounds[2][0], self.spawn_bounds[2][1]),
-                ]
                 self.init_ball_pos = None
-            self._ball_id = p.loadURDF(
-                self.urdf_paths[urdf_name], ball_pos, zero_orient)
-            self.configure_dynamics(self._ball_id, "ball")
-
-            # initialize the ball with some speed
-            if init_vel:
-                ball_vel = init_vel
-            else:
-                if init_speed:
-                    self._speed_bound = math.sqrt(2.0) * init_speed
+            self._speed_bound = spawn.ball_speed_bound(init_speed)
+
+            for arena, origin in enumerate(self._arena_origins):
+                ball_pos = self.init_ball_pos
+                if ball_pos is None:
+                    ball_pos = self._random_spawn_pos()
+                ball_id = p.loadURDF(
+                    self.urdf_paths[urdf_name], np.add(ball_pos, origin), zero_orient)
+                self.configure_dynamics(ball_id, "ball")
+                self._set_arena_filter(ball_id, arena)
+                self._ball_ids.append(ball_id)
+                self._ball_prev_pos[arena] = p.getBasePositionAndOrientation(ball_id)[0]
+
+                # initialize the ball with some speed
+                if init_vel:
+                    ball_vel = init_vel
                 else:
-                    self._speed_bound = 0.0
-                ball_vel = [
-                    random.uniform(-self._speed_bound, self._speed_bound),
-                    random.uniform(-self._speed_bound, self._speed_bound),
-                    0.0,
-                ]
-            print("\n\n\n\n\n\n\n\n\n\n==========here7================")
-            p.resetBaseVelocity(self._ball_id, ball_vel, zero_orient)
+                    ball_vel = [
+                        self._rng['dynamics'].uniform(-self._speed_bound, self._speed_bound),
+                        self._rng['dynamics'].uniform(-self._speed_bound, self._speed_bound),
+                        0.0,
+                    ]
+                p.resetBaseVelocity(ball_id, ball_vel, zero_orient)
+            self._ball_id = self._ball_ids[0]
+            self._ball_radius = p.getCollisionShapeData(self._ball_id, -1)[0][3][0]
             self.ball_noise = noise
+            self._state_noise = None
             return self._ball_id
         else:
             return None
@@ -158,6 +316,7 @@ class Sim(object):
     def create_car(self, urdf_name, init_pose=None, noise=None, car_props=None):
         """
         Creates instance based car properties(pose,vel,orient) and configures car dynamics.
+        A copy of the car is created in every arena.
         @param urdf_name: The id for the specific pybullet object.
         @param init_pose: The initial position of the ball (override randomization).
         @param noise: The noise and if it should be present in the location of the object.
@@ -169,8 +328,6 @@ class Sim(object):
         if urdf_name in self.urdf_paths:
             zero_pos = [0.0, 0.0, 0.0]
             zero_orient = [0.0, 0.0, 0.0]
-            car_id = p.loadURDF(self.urdf_paths[urdf_name], zero_pos,
-                                p.getQuaternionFromEuler(zero_orient))
             if init_pose:
                 if "pos" in init_pose:
                     car_pos = init_pose["pos"]
@@ -185,194 +342,529 @@ class Sim(object):
                 init_car_pos = car_pos
                 init_car_orient = car_orient
             else:
-                car_pos = [
-                    random.uniform(self.spawn_bounds[0][0], self.spawn_bounds[0][1]),
-                    random.uniform(self.spawn_bounds[1][0], self.spawn_bounds[1][1]),
-                    random.uniform(self.spawn_bounds[2][0], self.spawn_bounds[2][1]),
-                ]
-                car_orient = [0.0, 0.0, random.uniform(0, 2 * math.pi)]
+                car_pos = None
+                car_orient = None
                 init_car_pos = None
                 init_car_orient = None
 
-            self._cars[car_id] = Car(
-                car_id,
-                car_pos,
-                car_orient,
-                car_props
-            )
-
-            # configures dynamics of the car
-            self.configure_dynamics(car_id, "car")
-
+            bodies = []
+            radius = None
+            for arena, origin in enumerate(self._arena_origins):
+                body_id = p.loadURDF(self.urdf_paths[urdf_name], origin,
+                                     p.getQuaternionFromEuler(zero_orient))
+                if radius is None:
+                    radius = self._get_footprint_radius(body_id)
+                self._cars[body_id] = Car(
+                    body_id,
+                    car_pos if car_pos is not None else self._random_spawn_pos(),
+                    car_orient if car_orient is not None else [0.0, 0.0, self._rng['spawn'].uniform(0, 2 * math.pi)],
+                    car_props,
+                    origin=origin,
+                    arena=arena,
+                    noise_buffer=self._noise
+                )
+
+                # configures dynamics of the car
+                self.configure_dynamics(body_id, "car")
+                self._set_arena_filter(body_id, arena)
+                bodies.append(body_id)
+
+            car_id = bodies[0]
+            self._car_bodies[car_id] = bodies
+            for body_id in bodies:
+                self._body_to_car[body_id] = car_id
             self._car_data[car_id] = {
                 "init_pos": init_car_pos,
                 "init_orient": init_car_orient,
                 "noise": noise,
+                "radius": radius,
             }
+            self._state_noise = None
             return car_id
         else:
             return None
 
     def delete_car(self, car_id):
         """
-        Removes a car from being tracked in the _cars and _car_data lists.
+        Removes a car (in all arenas) from being tracked in the _cars and _car_data lists.
         @param car_id: The id of the car in the simulator class.
         @return: Whether the deletion was successful.
         """
-        if car_id not in self._cars:
+        if car_id not in self._car_data:
             return False
 
-        p.removeBody(car_id)
-        del self._cars[car_id]
+        for body_id in self._car_bodies[car_id]:
+            p.removeBody(body_id)
+            self._collision_links.pop(body_id, None)
+            del self._cars[body_id]
+            del self._body_to_car[body_id]
+        del self._car_bodies[car_id]
         del self._car_data[car_id]
+        self._state_noise = None
         return True
 
     def step(self, dt):
         """
-        Moves the sim forward one timestep, checking if a goal is score to end the sim round.
+        Moves all arenas forward one timestep, checking if a goal is score to end the sim round.
         @param dt: The change in time (delta-t) for this sim step.
+        @return: The number of physics substeps used.
         """
-        if self._ball_id is not None:
-            ball_contacts = p.getContactPoints(bodyA=self._ball_id)
-            for contact in ball_contacts:
-                if contact[2] in self._cars:
-                    self.touchedLast = contact[2]
-                elif contact[2] == self._goal_a_id:
-                    self.scored = True
-                    self.winner = "A"
-                elif contact[2] == self._goal_b_id:
-                    self.scored = True
-                    self.winner = "B"
-
-        # PyBullet steps at 240hz
-        p_dt = 1.0 / 240.0
-        for _ in range(round(dt / p_dt)):
-            # step kinematic objects independently, at max possible rate
-            for car in self._cars.values():
-                car.step(p_dt)
-            p.stepSimulation()
-
-    def get_car_pose(self, id, add_noise=False):
-
-        if id not in self._cars:
+        with telemetry.timer('sim.step'):
+            self.events = []
+            remaining = round(dt / self._engine_time_step)
+            self.substeps = 0
+            while remaining > 0:
+                merge = 1
+                if self._max_merge > 1 and remaining > 1:
+                    merge = min(self._max_merge, remaining)
+                    with telemetry.timer('sim.contact_scan'):
+                        if self._near_contact(merge):
+                            merge = 1
+                p_dt = merge * self._engine_time_step
+                if p_dt != self._current_time_step:
+                    p.setPhysicsEngineParameter(fixedTimeStep=p_dt)
+                    self._current_time_step = p_dt
+
+                # step kinematic objects independently, at max possible rate
+                with telemetry.timer('sim.car_kinematics'):
+                    for car in self._cars.values():
+                        car.step(p_dt)
+                with telemetry.timer('sim.step_simulation'):
+                    p.stepSimulation()
+                self.time += p_dt
+
+                with telemetry.timer('sim.contact_events'):
+                    for arena in range(len(self._ball_ids)):
+                        self._update_contacts(arena, p_dt)
+
+                remaining -= merge
+                self.substeps += 1
+
+            telemetry.count('substeps', self.substeps)
+            telemetry.log_summary()
+            if self._recorder is not None:
+                self._record()
+        return self.substeps
+
+    def _update_contacts(self, arena, dt):
+        """
+        Checks what the ball hit during the last substep, updating the match state and event log.
+        Contact points are only queried for bodies that pass a bounding box check, and
+        goals are also checked by sweeping the ball along its path, so fast shots
+        can not tunnel through them.
+        @param arena: The arena to check.
+        @param dt: The duration of the last substep.
+        """
+        ball_id = self._ball_ids[arena]
+        pos, _ = p.getBasePositionAndOrientation(ball_id)
+        prev_pos = self._ball_prev_pos[arena]
+        self._ball_prev_pos[arena] = pos
+
+        # broad phase
+        contacts = set()
+        for other_id in self._get_nearby(ball_id, self._contact_margin):
+            # narrow phase
+            if p.getContactPoints(bodyA=ball_id, bodyB=other_id):
+                contacts.add(other_id)
+        for goal_id, low, high in self._goal_boxes[arena]:
+            if goal_id not in contacts and self._segment_hits_box(prev_pos, pos, low, high):
+                contacts.add(goal_id)
+
+        for other_id in contacts:
+            new = other_id not in self._ball_contacts[arena]
+            if other_id in self._body_to_car:
+                car_id = self._body_to_car[other_id]
+                self.arena_touched_last[arena] = car_id
+                if new:
+                    self._log_event(arena, 'touch', car_id=car_id)
+            elif other_id == self._walls_ids[arena]:
+                if new:
+                    self._log_event(arena, 'wall')
+            elif other_id in (self._goal_a_ids[arena], self._goal_b_ids[arena]):
+                winner = "A" if other_id == self._goal_a_ids[arena] else "B"
+                self.arena_scored[arena] = True
+                self.arena_winner[arena] = winner
+                if new:
+                    self._log_event(arena, 'goal', winner=winner)
+        self._ball_contacts[arena] = contacts
+
+    def _log_event(self, arena, kind, car_id=None, winner=None):
+        self.events.append(ContactEvent(self.time, self.substeps, arena, kind, car_id, winner))
+
+    def _segment_hits_box(self, start, end, low, high):
+        """Returns whether the ball, moving from start to end, overlaps a box (slab test)."""
+        t_min, t_max = 0.0, 1.0
+        for axis in range(3):
+            delta = end[axis] - start[axis]
+            lower = low[axis] - self._ball_radius
+            upper = high[axis] + self._ball_radius
+            if abs(delta) < 1e-12:
+                if start[axis] < lower or start[axis] > upper:
+                    return False
+                continue
+            t_0 = (lower - start[axis]) / delta
+            t_1 = (upper - start[axis]) / delta
+            t_min = max(t_min, min(t_0, t_1))
+            t_max = min(t_max, max(t_0, t_1))
+            if t_min > t_max:
+                return False
+        return True
+
+    def _near_contact(self, merge):
+        """
+        Checks whether the ball or a car could touch another body within merged substeps.
+        This only uses the broadphase bounding boxes, so it is cheap and conservative.
+        @param merge: The number of substeps to merge.
+        @return: Whether a finer time step should be used.
+        """
+        dt = merge * self._engine_time_step
+        for ball_id in self._ball_ids:
+            linear, _ = p.getBaseVelocity(ball_id)
+            if self._is_near(ball_id, math.hypot(linear[0], linear[1]) * dt):
+                return True
+        for car in self._cars.values():
+            if self._is_near(car.id, car._MAX_SPEED * dt):
+                return True
+        return False
+
+    def _is_near(self, body_id, distance):
+        """Returns whether any body other than the floor is within distance (plus margin) of a body."""
+        return len(self._get_nearby(body_id, distance + self._contact_margin)) > 0
+
+    def _get_nearby(self, body_id, distance):
+        """Returns the ids of bodies (other than the floor) whose bounding boxes are within distance of a body."""
+        nearby = set()
+        for link_id in self._get_collision_links(body_id):
+            low, high = p.getAABB(body_id, link_id)
+            overlaps = p.getOverlappingObjects(np.subtract(low, distance), np.add(high, distance))
+            if overlaps is None:
+                continue
+            for other_id, other_link_id in overlaps:
+                if other_id == body_id or other_id == self._plane_id or other_id in nearby:
+                    continue
+                if other_link_id in self._get_collision_links(other_id):
+                    nearby.add(other_id)
+        return nearby
+
+    def _get_box(self, body_id):
+        """Returns the bounding box around all collision links of a body."""
+        aabbs = [p.getAABB(body_id, link) for link in self._get_collision_links(body_id)]
+        return np.min([aabb[0] for aabb in aabbs], axis=0), np.max([aabb[1] for aabb in aabbs], axis=0)
+
+    def _get_footprint_radius(self, body_id):
+        """Returns the radius in the xy plane that a body's collision shapes can reach, at any heading."""
+        radius = 0.0
+        for link_id in self._get_collision_links(body_id):
+            low, high = p.getAABB(body_id, link_id)
+            radius = max(radius, math.hypot(high[0] - low[0], high[1] - low[1]) / 2.0)
+        return radius
+
+    def _get_collision_links(self, body_id):
+        """Returns the links of a body that have a collision shape (others have an empty AABB at the body origin)."""
+        if body_id not in self._collision_links:
+            self._collision_links[body_id] = [
+                link_id for link_id in range(-1, p.getNumJoints(body_id))
+                if p.getCollisionShapeData(body_id, link_id)
+            ]
+        return self._collision_links[body_id]
+
+    def get_car_pose(self, id, add_noise=False, arena=0):
+
+        if id not in self._car_data:
             return None
 
+        car = self._cars[self._car_bodies[id][arena]]
         noise = self._car_data[id]['noise']
         if add_noise:
-            return self._cars[id].get_pose(noise=noise)
+            return car.get_pose(noise=noise)
         else:
-            return self._cars[id].get_pose(noise=None)
+            return car.get_pose(noise=None)
 
-    def get_car_velocity(self, id):
+    def get_car_velocity(self, id, arena=0):
         """Returns a tuple of linear and angular velocity for the car."""
-        if id not in self._cars:
+        if id not in self._car_data:
             return None
 
-        return self._cars[id].get_velocity()
+        return self._cars[self._car_bodies[id][arena]].get_velocity()
 
-    def set_car_command(self, id, cmd):
-        if id not in self._cars:
+    def set_car_command(self, id, cmd, arena=None):
+        """Sets the command of a car (in all arenas by default)."""
+        if id not in self._car_data:
             return None
 
-        return self._cars[id].setCmd(cmd)
+        for arena in self._arenas(arena):
+            self._cars[self._car_bodies[id][arena]].setCmd(cmd)
+
+    def set_car_commands(self, cmds):
+        """Sets the command of all cars, using a (num_arenas, num_cars, 2) array."""
+        for i, bodies in enumerate(self._car_bodies.values()):
+            for arena, body_id in enumerate(bodies):
+                self._cars[body_id].setCmd(tuple(cmds[arena][i]))
+
+    def get_car_commands(self):
+        """Returns (num_arenas, num_cars, 2) array of the commands of all cars, with NaN for no command."""
+        cmds = np.full((self.num_arenas, len(self._car_bodies), 2), np.nan)
+        for i, bodies in enumerate(self._car_bodies.values()):
+            for arena, body_id in enumerate(bodies):
+                if self._cars[body_id].cmd is not None:
+                    cmds[arena, i] = self._cars[body_id].cmd
+        return cmds
+
+    def get_car_pose_array(self):
+        """Returns (num_arenas, num_cars, 3) array of x, y, and heading of all cars."""
+        num_cars = len(self._car_bodies)
+        poses = np.zeros((self.num_arenas, num_cars, 3))
+        for arena in range(self.num_arenas):
+            poses[arena] = self.get_state_array(arena=arena)[:num_cars, (state.X, state.Y, state.YAW)]
+        return poses
+
+    def get_car_velocity_array(self):
+        """Returns (num_arenas, num_cars, 2) array of forward and angular velocity of all cars."""
+        num_cars = len(self._car_bodies)
+        velocities = np.zeros((self.num_arenas, num_cars, 2))
+        for arena in range(self.num_arenas):
+            velocities[arena] = self.get_state_array(arena=arena)[:num_cars, (state.V_FORWARD, state.OMEGA)]
+        return velocities
+
+    def get_ball_array(self):
+        """Returns (num_arenas, 4) array of x, y, vx, vy of the ball."""
+        balls = np.zeros((self.num_arenas, 4))
+        for arena in range(len(self._ball_ids)):
+            pos, _ = self.get_ball_pose(arena=arena)
+            linear, _ = self.get_ball_velocity(arena=arena)
+            balls[arena] = (pos[0], pos[1], linear[0], linear[1])
+        return balls
+
+    @property
+    def car_ids(self):
+        """Ids of the cars, in the order of the rows of get_state_array."""
+        return list(self._car_bodies)
+
+    def get_state_array(self, add_noise=False, arena=0, out=None):
+        """
+        Reads the state of every car and the ball, with one PyBullet call per car
+        and two for the ball. Rows are the cars in the order of car_ids, followed by
+        the ball (if there is one), and columns are described by state.STATE_FIELDS.
+        @param add_noise: Whether to add sensor noise to the poses. Bodies that drop out have NaN poses.
+        @param arena: The arena to read.
+        @param out: Array to fill (default=a preallocated array, overwritten by the next call).
+        @return: The (num_bodies, state.STATE_SIZE) array.
+        """
+        num_cars = len(self._car_bodies)
+        rows = num_cars + (self._ball_id is not None)
+        if out is None:
+            out = state.get_state_buffer(self._state_buffers, arena, rows)
+
+        for i, bodies in enumerate(self._car_bodies.values()):
+            x, y, z, heading, x_dot, y_dot, omega = self._cars[bodies[arena]].get_state()
+            out[i] = (x, y, z, heading, x_dot, y_dot, 0.0, omega)
+        state.to_body_frame(out[:num_cars])
 
-    def get_ball_pose(self, add_noise=False):
+        if self._ball_id is not None:
+            ball_id = self._ball_ids[arena]
+            pos, _ = p.getBasePositionAndOrientation(ball_id)
+            linear, angular = p.getBaseVelocity(ball_id)
+            out[num_cars, state.X:state.Z + 1] = np.subtract(pos, self._arena_origins[arena])
+            out[num_cars, state.YAW] = 0.0
+            out[num_cars, state.V_FORWARD:state.V_UP + 1] = linear
+            out[num_cars, state.OMEGA] = angular[2]
+
+        if add_noise:
+            if self._state_noise is None:
+                noises = [data['noise'] for data in self._car_data.values()]
+                if self._ball_id is not None:
+                    noises.append(self.ball_noise)
+                self._state_noise = state.make_noise_table(noises)
+            state.add_noise(out, self._state_noise, self._noise)
+        return out
+
+    def load_car_batch(self, batch, env_index=0, arena=0):
+        """
+        Copies the state of one environment of a CarBatch into the simulated cars.
+        @param batch: The CarBatch, with one car per simulated car, in order of creation.
+        @param env_index: The environment of the batch to copy.
+        @param arena: The arena to copy it into.
+        """
+        assert batch.shape[1] == len(self._car_bodies)
+        for i, bodies in enumerate(self._car_bodies.values()):
+            car = self._cars[bodies[arena]]
+            car.set_state(batch.x[env_index, i], batch.y[env_index, i], batch.theta[env_index, i],
+                          v_rear=batch.v_rear[env_index, i], psi=batch.psi[env_index, i])
+            car.setCmd(tuple(batch.cmd[env_index, i]))
+
+    def get_ball_pose(self, add_noise=False, arena=0):
         """@param add_noise: State whether you want noise to get the ball position (default=False)."""
         if self._ball_id is None:
             return None
-        pos, _ = p.getBasePositionAndOrientation(self._ball_id)
+        pos, _ = p.getBasePositionAndOrientation(self._ball_ids[arena])
+        pos = np.subtract(pos, self._arena_origins[arena])
 
         if add_noise and self.ball_noise:
-            if np.random.uniform() < self.ball_noise['dropout']:
+            if self._noise.uniform() < self.ball_noise['dropout']:
                 return None, None
             else:
-                pos = np.random.normal(pos, self.ball_noise['pos'])
+                pos = self._noise.normal(pos, self.ball_noise['pos'])
 
         return pos, p.getQuaternionFromEuler([0, 0, 0])
 
-    def get_ball_velocity(self):
+    def start_recording(self, path, chunk_size=1024):
+        """
+        Starts recording the state and commands of every arena after each step and reset.
+        The cars should not change while recording.
+        @param path: Directory to write the recording to (see recording.Recorder).
+        @param chunk_size: Number of frames to buffer between writes.
+        @return: The Recorder.
+        """
+        self.stop_recording()
+        self._recorder = Recorder(path, self.car_ids, chunk_size=chunk_size)
+        return self._recorder
+
+    def stop_recording(self):
+        """Finishes the current recording, if there is one."""
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def _record(self):
+        """Adds the current state to the recording."""
+        state_array = np.stack([self.get_state_array(arena=arena) for arena in range(self.num_arenas)])
+        self._recorder.record(self.time, state_array, self.get_car_commands())
+
+    def save_snapshot(self):
+        """
+        Captures the state of every arena, so it can be returned to later.
+        Snapshots become invalid if cars are created or deleted.
+        @return: An opaque snapshot, for restore_snapshot.
+        """
+        return {
+            'state_id': p.saveState(),
+            'cars': {car_id: car.get_internal_state() for car_id, car in self._cars.items()},
+            'scored': list(self.arena_scored),
+            'winner': list(self.arena_winner),
+            'touched_last': list(self.arena_touched_last),
+            'spawn_bounds': self.spawn_bounds,
+            'time': self.time,
+        }
+
+    def restore_snapshot(self, snapshot):
+        """Returns every arena to the state captured by save_snapshot. The snapshot can be reused."""
+        p.restoreState(stateId=snapshot['state_id'])
+        for car_id, car_state in snapshot['cars'].items():
+            self._cars[car_id].set_internal_state(car_state)
+        self.arena_scored = list(snapshot['scored'])
+        self.arena_winner = list(snapshot['winner'])
+        self.arena_touched_last = list(snapshot['touched_last'])
+        self.spawn_bounds = snapshot['spawn_bounds']
+        self.time = snapshot['time']
+        for arena, ball_id in enumerate(self._ball_ids):
+            self._ball_prev_pos[arena] = p.getBasePositionAndOrientation(ball_id)[0]
+            self._ball_contacts[arena] = set()
+        if self._recorder is not None:
+            self._recorder.new_episode()
+            self._record()
+
+    def remove_snapshot(self, snapshot):
+        """Frees the memory PyBullet uses for a snapshot."""
+        p.removeState(snapshot['state_id'])
+
+    def fill_snapshot_pool(self, size, spawn_bounds, car_properties, ball_init_pose, ball_init_speed):
+        """
+        Saves a number of randomized initial states, to cheaply reset to with reset_from_pool.
+        Arguments after size are the same as reset.
+        @param size: Number of snapshots in the pool.
+        """
+        self.clear_snapshot_pool()
+        for _ in range(size):
+            self.reset(spawn_bounds, car_properties, ball_init_pose, ball_init_speed)
+            self._snapshot_pool.append(self.save_snapshot())
+
+    def clear_snapshot_pool(self):
+        """Removes all snapshots in the pool."""
+        for snapshot in self._snapshot_pool:
+            self.remove_snapshot(snapshot)
+        self._snapshot_pool = []
+
+    def reset_from_pool(self):
+        """Resets all arenas to a random snapshot from the pool, instead of re-randomizing each body."""
+        self.restore_snapshot(self._snapshot_pool[self._rng['spawn'].integers(len(self._snapshot_pool))])
+
+    def get_ball_velocity(self, arena=0):
         if self._ball_id is None:
             return None
-        return p.getBaseVelocity(self._ball_id)
+        return p.getBaseVelocity(self._ball_ids[arena])
 
-    def reset(self, spawn_bounds, car_properties, ball_init_pose, ball_init_speed):
+    def reset(self, spawn_bounds, car_properties, ball_init_pose, ball_init_speed, arena=None):
         """
         Resets the ball, score, winner, spawn bounds, cars and ball.
         @param spawn_bounds: The new spawn bounds.
         @param car_properties: The new car properties.
+        @param arena: The arena to reset (default=all).
         """
-        self.scored = False
-        self.winner = None
-        self.touched_last = None
-        if ball_init_pose is not None: self.init_ball_pos = ball_init_pose 
-        if ball_init_speed is not None: self._speed_bound = ball_init_speed
-
+        for i in self._arenas(arena):
+            self.arena_scored[i] = False
+            self.arena_winner[i] = None
+            self.arena_touched_last[i] = None
+        if ball_init_pose is not None: self.init_ball_pos = ball_init_pose["pos"]
+        if ball_init_speed is not None: self._speed_bound = spawn.ball_speed_bound(ball_init_speed)
+
+        self._noise.refill()
         self.spawn_bounds = spawn_bounds
-        self.reset_ball()
         for car in self._cars.values():
-            self.reset_car(car, car_properties)
-
-
-    def reset_car(self, car, car_properties):
-        """
-        Loops over the cars and generates new initial positions (if they were not specified).
-        @param car_properties: The new car config properties.
-        """
-        # reset the car properties in advance
-        car.set_properties(car_properties)
-        car_pos = self._car_data[car.id]["init_pos"]
-        car_orient = self._car_data[car.id]["init_orient"]
-
-        if car_pos is None:
-            car_pos = self.generate_new_car_pos()
-        
-        while self.check_if_pos_overlap(car_pos):
-            print("\n\n\n\n\n\n\n\n\noverlap generation")
-            car_pos = self.generate_new_car_pos()
-
-        if car_orient is None:
-            car_orient = [0, 0, random.uniform(0, 2 * math.pi)]
-        car.reset(car_pos, car_orient)
+            if arena is None or car.arena == arena:
+                car.set_properties(car_properties)
+
+        for i in self._arenas(arena):
+            positions = self._spawn(i, cars=True, ball=True)
+            if self._ball_id is not None:
+                self._place_ball(i, positions[-1])
+            for bodies, data, car_pos in zip(self._car_bodies.values(), self._car_data.values(), positions):
+                car_orient = data["init_orient"]
+                if car_orient is None:
+                    car_orient = [0, 0, self._rng['spawn'].uniform(0, 2 * math.pi)]
+                self._cars[bodies[i]].reset(car_pos, car_orient)
+
+        if self._recorder is not None:
+            self._recorder.new_episode()
+            self._record()
+
+    def reset_ball(self, arena=None):
+        """Moves the ball to its initial or a random position (clear of the cars), in one or all arenas."""
+        if self._ball_id is None:
+            return
 
+        for arena in self._arenas(arena):
+            self._place_ball(arena, self._spawn(arena, cars=False, ball=True)[-1])
 
-    def check_if_pos_overlap(self, car_pos):
+    def _spawn(self, arena, cars, ball):
         """
-        Checks if two cars spawn bounds overlap with each other.
-        @param car_pos: The position of the car.
-        @return: Whether overlap happens (true = need to generate new bounds).
+        Samples spawn positions in one arena, clear of the bodies that are not moved.
+        @param arena: The arena.
+        @param cars: Whether to move the cars to their initial or a random position.
+        @param ball: Whether to move the ball to its initial or a random position.
+        @return: List of car positions (in order of creation), followed by the ball position (if there is a ball).
         """
-        for car in self._cars.values():
-            overlap = car.check_overlap(car_pos)
-            if overlap:
-                return True
-
-        return False
-
-
-    def generate_new_car_pos(self):
-        car_pos = [random.uniform(self.spawn_bounds[0][0], self.spawn_bounds[0][1]),
-                random.uniform(
-                    self.spawn_bounds[1][0], self.spawn_bounds[1][1]),
-                random.uniform(self.spawn_bounds[2][0], self.spawn_bounds[2][1])]
-        return car_pos
-
-
-    def reset_ball(self):
-            
+        spawns = []
+        for bodies, data in zip(self._car_bodies.values(), self._car_data.values()):
+            if cars:
+                pos = data["init_pos"]
+            else:
+                pos = self._cars[bodies[arena]].get_state()[:3]
+            spawns.append((pos, data["radius"]))
         if self._ball_id is not None:
-            ball_pos = self.init_ball_pos
-            if ball_pos is None:
-                ball_pos = [
-                    random.uniform(self.spawn_bounds[0][0], self.spawn_bounds[0][1]),
-                    random.uniform(self.spawn_bounds[1][0], self.spawn_bounds[1][1]),
-                    random.uniform(self.spawn_bounds[2][0], self.spawn_bounds[2][1]),
-                ]
-            p.resetBasePositionAndOrientation(
-                self._ball_id, ball_pos, p.getQuaternionFromEuler([0, 0, 0])
-            )
-            ball_vel = [
-                random.uniform(-self._speed_bound, self._speed_bound),
-                random.uniform(-self._speed_bound, self._speed_bound),
-                0.0,
-            ]
-            p.resetBaseVelocity(self._ball_id, ball_vel, [0, 0, 0])
+            spawns.append((self.init_ball_pos if ball else self.get_ball_pose(arena=arena)[0], self._ball_radius))
+        return spawn.place(self._rng['spawn'], self.spawn_bounds, spawns)
+
+    def _place_ball(self, arena, ball_pos):
+        """Moves the ball of an arena to a position, with a random velocity."""
+        p.resetBasePositionAndOrientation(
+            self._ball_ids[arena], np.add(ball_pos, self._arena_origins[arena]),
+            p.getQuaternionFromEuler([0, 0, 0])
+        )
+        ball_vel = [
+            self._rng['dynamics'].uniform(-self._speed_bound, self._speed_bound),
+            self._rng['dynamics'].uniform(-self._speed_bound, self._speed_bound),
+            0.0,
+        ]
+        p.resetBaseVelocity(self._ball_ids[arena], ball_vel, [0, 0, 0])
+        self._ball_prev_pos[arena] = p.getBasePositionAndOrientation(self._ball_ids[arena])[0]
+        self._ball_contacts[arena] = set()
@@ -0,0 +1,108 @@
+"""Contains spawn placement for the simulator backends.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# Bodies are circles in the xy plane. Each body to place gets up to MAX_ATTEMPTS
+# uniform random draws (Poisson-disk dart throwing), each checked against a
+# uniform grid with cells as wide as the largest clearance, so a check only
+# looks at the 3x3 neighboring cells. If every draw collides, the body is put in
+# the first free point of a shuffled grid covering the spawn bounds. The work per
+# body is bounded, so placing n bodies is O(n) no matter how crowded the field is.
+
+# 3rd party modules
+from collections import defaultdict
+import logging
+import math
+import numpy as np
+
+# Local modules
+from simulator import telemetry
+
+MAX_ATTEMPTS = 30
+
+
+def ball_speed_bound(init_speed):
+    """
+    Bound of the ball's initial velocity. Each of vx and vy is drawn uniformly
+    from [-bound, bound], in every backend.
+    @param init_speed: The ball's init_speed parameter (None or 0 for a still ball).
+    @return: The bound.
+    """
+    return float(init_speed) if init_speed else 0.0
+
+
+class _Grid(object):
+    """Uniform grid of placed circles."""
+
+    def __init__(self, cell_size):
+        self._cell_size = cell_size
+        self._cells = defaultdict(list)
+
+    def _key(self, x, y):
+        return (math.floor(x / self._cell_size), math.floor(y / self._cell_size))
+
+    def add(self, x, y, radius):
+        self._cells[self._key(x, y)].append((x, y, radius))
+
+    def is_free(self, x, y, radius):
+        """Returns whether a circle does not overlap any placed circle."""
+        i, j = self._key(x, y)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for other_x, other_y, other_radius in self._cells.get((i + di, j + dj), ()):
+                    if (x - other_x) ** 2 + (y - other_y) ** 2 < (radius + other_radius) ** 2:
+                        return False
+        return True
+
+
+def place(rng, spawn_bounds, bodies, max_attempts=MAX_ATTEMPTS):
+    """
+    Samples non-overlapping spawn positions.
+    @param rng: The numpy.random.Generator to draw from.
+    @param spawn_bounds: [[x_min, x_max], [y_min, y_max], [z_min, z_max]].
+    @param bodies: List of (position, radius). Bodies with a position stay there, and
+        the others (position=None) are given one that is clear of every other body.
+    @param max_attempts: Random draws per body, before falling back to a grid search.
+    @return: List of positions, in the same order as bodies.
+    """
+    positions = [pos for pos, _ in bodies]
+    radii = [radius for _, radius in bodies]
+    if not radii:
+        return positions
+    grid = _Grid(max(2.0 * max(radii), 1e-6))
+    for pos, radius in bodies:
+        if pos is not None:
+            grid.add(pos[0], pos[1], radius)
+
+    (x_min, x_max), (y_min, y_max), (z_min, z_max) = spawn_bounds
+    for i, (pos, radius) in enumerate(bodies):
+        if pos is not None:
+            continue
+        draws = rng.uniform((x_min, y_min), (x_max, y_max), size=(max_attempts, 2))
+        z = rng.uniform(z_min, z_max)
+        for x, y in draws:
+            if grid.is_free(x, y, radius):
+                break
+        else:
+            x, y = _search(rng, grid, spawn_bounds, radius, draws[0])
+        grid.add(x, y, radius)
+        positions[i] = [x, y, z]
+    return positions
+
+
+def _search(rng, grid, spawn_bounds, radius, fallback):
+    """Returns the first free point of a shuffled grid over the spawn bounds, or fallback if there is none."""
+    (x_min, x_max), (y_min, y_max), _ = spawn_bounds
+    spacing = max(radius, 1e-3)
+    xs = np.arange(x_min, x_max + 1e-9, spacing)
+    ys = np.arange(y_min, y_max + 1e-9, spacing)
+    candidates = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    for x, y in candidates[rng.permutation(len(candidates))]:
+        if grid.is_free(x, y, radius):
+            return x, y
+    telemetry.log_throttled(logging.WARNING, 'spawn_no_room', 5.0,
+                            'no room to spawn a body of radius %.3f, placing it on top of another', radius)
+    return fallback
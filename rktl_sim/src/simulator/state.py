@@ -0,0 +1,80 @@
+"""Contains the layout of state arrays and contact events, shared by the simulator backends.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# 3rd party modules
+from collections import namedtuple
+import math
+import numpy as np
+
+# columns of the arrays returned by get_state_array
+# velocities are in the body frame (forward, left, up), which for the ball is the world frame
+STATE_FIELDS = ('x', 'y', 'z', 'yaw', 'v_forward', 'v_left', 'v_up', 'omega')
+X, Y, Z, YAW, V_FORWARD, V_LEFT, V_UP, OMEGA = range(len(STATE_FIELDS))
+STATE_SIZE = len(STATE_FIELDS)
+
+# something the ball hit during a substep
+# kind is one of 'touch' (car_id is set), 'wall', or 'goal' (winner is set)
+ContactEvent = namedtuple('ContactEvent', ['time', 'substep', 'arena', 'kind', 'car_id', 'winner'])
+
+
+def get_state_buffer(buffers, arena, rows):
+    """
+    Returns the preallocated state array of an arena, reallocating it if the number of bodies changed.
+    @param buffers: Dict of arrays, keyed by arena.
+    @param arena: The arena.
+    @param rows: Number of bodies.
+    """
+    out = buffers.get(arena)
+    if out is None or out.shape[0] != rows:
+        out = np.zeros((rows, STATE_SIZE))
+        buffers[arena] = out
+    return out
+
+
+def to_body_frame(state):
+    """Wraps yaw to [-pi, pi) and rotates world frame x, y velocities into the body frame, in place."""
+    state[:, YAW] = (state[:, YAW] + math.pi) % (2.0 * math.pi) - math.pi
+    cos = np.cos(state[:, YAW])
+    sin = np.sin(state[:, YAW])
+    x_dot = state[:, V_FORWARD].copy()
+    y_dot = state[:, V_LEFT]
+    state[:, V_FORWARD] = cos * x_dot + sin * y_dot
+    state[:, V_LEFT] = cos * y_dot - sin * x_dot
+
+
+def make_noise_table(noises):
+    """
+    Collects noise settings into arrays, for use with add_noise.
+    @param noises: Noise dict or None for each body. The pos and orient entries are
+        standard deviations, either one for all axes or a list of x, y, and z.
+    @return: Tuple of (num_bodies, 3) position std, yaw std, and dropout probability arrays.
+    """
+    pos_std = np.zeros((len(noises), 3))
+    yaw_std = np.zeros(len(noises))
+    dropout = np.zeros(len(noises))
+    for i, noise in enumerate(noises):
+        if noise:
+            pos_std[i] = np.broadcast_to(noise.get('pos', 0.0), 3)
+            yaw_std[i] = np.broadcast_to(noise.get('orient', 0.0), 3)[2]
+            dropout[i] = noise.get('dropout', 0.0)
+    return pos_std, yaw_std, dropout
+
+
+def add_noise(state, noise_table, noise_buffer):
+    """
+    Adds sensor noise to the pose columns of a state array, in place. Bodies that
+    drop out have their pose columns set to NaN.
+    @param state: The state array.
+    @param noise_table: Tuple from make_noise_table, with one entry per row of state.
+    @param noise_buffer: The NoiseBuffer to draw from.
+    """
+    pos_std, yaw_std, dropout = noise_table
+    rows = len(state)
+    state[:, X:Z + 1] = noise_buffer.normal(state[:, X:Z + 1], pos_std)
+    state[:, YAW] = noise_buffer.normal(state[:, YAW], yaw_std)
+    dropped = noise_buffer.uniform(rows) < dropout
+    state[dropped, X:YAW + 1] = np.nan
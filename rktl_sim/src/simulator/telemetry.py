@@ -0,0 +1,191 @@
+"""Logging and counters for the simulator, kept cheap enough for the physics loop.
+License:
+  BSD 3-Clause License
+  Copyright (c) 2022, Autonomous Robotics Club of Purdue (Purdue ARC)
+  All rights reserved.
+"""
+
+# Messages go to the 'simulator' logger from the standard logging module, so
+# they are silent below WARNING unless the application configures logging.
+# Events that happen every substep are not logged one by one. Instead, they are
+# counted with count(), and log_summary() periodically logs the totals (ex:
+# "car_pose: 9600 in 1.0s"). Counting is off by default, so count() only checks a flag.
+# Timers work in the same way: `with timer('name'):` adds the time spent in the
+# block to a running total when profiling is enabled, and otherwise does nothing.
+
+# System
+from collections import Counter
+import logging
+import time
+
+logger = logging.getLogger('simulator')
+
+# counters
+_counting = False
+_counts = Counter()
+_summary_period = 1.0
+_last_summary = time.monotonic()
+
+# per-site time of the last throttled message
+_last_logged = {}
+
+# timers, each a list of [calls, total seconds, max seconds]
+_profiling = False
+_timings = {}
+
+
+def enable_counters(period=1.0):
+    """
+    Starts counting events, with totals logged at INFO level.
+    @param period: Minimum time between summaries, in seconds.
+    """
+    global _counting, _summary_period, _last_summary
+    _counting = True
+    _summary_period = period
+    _last_summary = time.monotonic()
+    _counts.clear()
+
+
+def disable_counters():
+    """Stops counting events."""
+    global _counting
+    _counting = False
+    _counts.clear()
+
+
+def count(name, amount=1):
+    """Counts an event (does nothing unless counters are enabled)."""
+    if _counting:
+        _counts[name] += amount
+
+
+def get_counts():
+    """Returns a copy of the counts since the last summary."""
+    return dict(_counts)
+
+
+def log_summary():
+    """Logs and clears the counters, if the summary period has passed. Meant to be called once per step."""
+    global _last_summary
+    if not _counting:
+        return
+    now = time.monotonic()
+    elapsed = now - _last_summary
+    if elapsed < _summary_period:
+        return
+    if _counts and logger.isEnabledFor(logging.INFO):
+        logger.info(', '.join(f'{name}: {total} in {elapsed:.1f}s' for name, total in sorted(_counts.items())))
+    _counts.clear()
+    _last_summary = now
+
+
+def log_throttled(level, site, period, msg, *args):
+    """
+    Logs a message, at most once per period for each call site.
+    @param level: Logging level (ex: logging.WARNING).
+    @param site: Name identifying the call site.
+    @param period: Minimum time between messages from this site, in seconds.
+    @param msg: Message, formatted with args in the same way as logging.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    last = _last_logged.get(site)
+    if last is not None and now - last < period:
+        return
+    _last_logged[site] = now
+    logger.log(level, msg, *args)
+
+
+class _Timer(object):
+    """Adds the time spent in a with block to a timer."""
+    __slots__ = ('_name', '_start')
+
+    def __init__(self, name):
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        add_time(self._name, time.perf_counter() - self._start)
+
+
+class _NullTimer(object):
+    """Stands in for _Timer while profiling is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def enable_profiling():
+    """Starts timing the blocks wrapped with timer()."""
+    global _profiling
+    _profiling = True
+
+
+def disable_profiling():
+    """Stops timing, keeping the totals so far."""
+    global _profiling
+    _profiling = False
+
+
+def is_profiling():
+    return _profiling
+
+
+def timer(name):
+    """
+    Returns a context manager that adds the time spent in it to a timer (does nothing unless profiling is enabled).
+    @param name: Name of the timer, ex: 'sim.step'.
+    """
+    if _profiling:
+        return _Timer(name)
+    return _NULL_TIMER
+
+
+def add_time(name, seconds):
+    """Adds a duration to a timer (does nothing unless profiling is enabled)."""
+    if not _profiling:
+        return
+    timing = _timings.get(name)
+    if timing is None:
+        _timings[name] = [1, seconds, seconds]
+    else:
+        timing[0] += 1
+        timing[1] += seconds
+        if seconds > timing[2]:
+            timing[2] = seconds
+
+
+def get_profile():
+    """
+    Returns the totals of every timer since profiling was enabled (or reset).
+    @return: Dict of timer name to dict of calls, total, mean, and max (seconds).
+    """
+    return {name: {'calls': calls, 'total': total, 'mean': total / calls, 'max': max_time}
+            for name, (calls, total, max_time) in sorted(_timings.items())}
+
+
+def reset_profile():
+    """Clears the timers."""
+    _timings.clear()
+
+
+def format_profile(profile=None):
+    """Returns a table of timer totals, one line per timer, for logging."""
+    if profile is None:
+        profile = get_profile()
+    lines = [f'{"timer":<24} {"calls":>9} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>10}']
+    for name, timing in profile.items():
+        lines.append(f'{name:<24} {timing["calls"]:>9} {timing["total"]:>10.3f} '
+                     f'{timing["mean"] * 1e3:>10.3f} {timing["max"] * 1e3:>10.3f}')
+    return '\n'.join(lines)